@@ -1,11 +1,15 @@
 import streamlit as st
 import pandas as pd
 import os
-import json
-from PIL import Image
-import io
-import base64
 import datetime
+import atexit
+import math
+from contextlib import nullcontext
+
+from core import SORT_OPTIONS, Ingredient, Recipe, Services, split_ingredients
+from metrics import METRICS, METRICS_FILE, PROFILE_DIR, profile
+from share_server import export_url, is_local_url, load_secret, share_url
+from workers import DONE, FAILED, PENDING, QueueFull
 
 # Set page configuration
 st.set_page_config(
@@ -14,98 +18,185 @@ st.set_page_config(
     layout="wide"
 )
 
-# File paths for persistent storage
-USER_DATA_FILE = "user_data.json"
-RECIPE_DATA_FILE = "recipe_data.json"
-FAVORITES_DATA_FILE = "favorites_data.json"
+# Directory for persistent storage
+DATA_DIR = "data"
 
 # Create data directory if it doesn't exist
-if not os.path.exists("data"):
-    os.makedirs("data")
+if not os.path.exists(DATA_DIR):
+    os.makedirs(DATA_DIR)
+
+# Result grids are rendered one page at a time
+PAGE_SIZE_OPTIONS = [9, 18, 30, 60]
+DEFAULT_PAGE_SIZE = int(os.environ.get("RECIPE_PAGE_SIZE", PAGE_SIZE_OPTIONS[0]))
+if DEFAULT_PAGE_SIZE not in PAGE_SIZE_OPTIONS:
+    PAGE_SIZE_OPTIONS = sorted(PAGE_SIZE_OPTIONS + [DEFAULT_PAGE_SIZE])
 
-USER_DATA_FILE = os.path.join("data", USER_DATA_FILE)
-RECIPE_DATA_FILE = os.path.join("data", RECIPE_DATA_FILE)
-FAVORITES_DATA_FILE = os.path.join("data", FAVORITES_DATA_FILE)
+# The performance panel (and its profiler, which writes to disk) is off
+# unless the server is started with RECIPE_METRICS_PANEL=1, and even then
+# only shown to the accounts listed in RECIPE_ADMINS (comma-separated; no
+# one by default, since anyone can register any free user name)
+METRICS_PANEL = os.environ.get("RECIPE_METRICS_PANEL", "0") == "1"
+ADMINS = {name.strip() for name in os.environ.get("RECIPE_ADMINS", "").split(",") if name.strip()}
+# Metrics are written in Prometheus text format at most this often (seconds)
+METRICS_INTERVAL = float(os.environ.get("RECIPE_METRICS_INTERVAL", "15"))
+METRICS_PATH = os.path.join(DATA_DIR, METRICS_FILE)
 
 # Initialize session state variables if they don't exist
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 if 'username' not in st.session_state:
     st.session_state.username = ""
-if 'users' not in st.session_state:
-    st.session_state.users = {}
-if 'recipes' not in st.session_state:
-    st.session_state.recipes = {}
-if 'user_favorites' not in st.session_state:
-    st.session_state.user_favorites = {}
-
-# Load data from JSON files
-def load_data():
-    # Load users
-    if os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, 'r') as f:
-            st.session_state.users = json.load(f)
-    else:
-        st.session_state.users = {"demo": "password"}  # Default user
-        save_user_data()
-    
-    # Load recipes
-    if os.path.exists(RECIPE_DATA_FILE):
-        with open(RECIPE_DATA_FILE, 'r') as f:
-            st.session_state.recipes = json.load(f)
-    else:
-        # Sample recipes with enhanced ingredient structure
-        st.session_state.recipes = {
-            "Pasta Carbonara": {
-                "ingredients": [
-                    {"name": "Pasta", "image": None},
-                    {"name": "Eggs", "image": None},
-                    {"name": "Cheese", "image": None},
-                    {"name": "Bacon", "image": None}
-                ],
-                "instructions": "1. Boil pasta\n2. Cook bacon\n3. Mix eggs and cheese\n4. Combine all ingredients",
-                "image": None,
-                "author": "system",
-                "date_added": str(datetime.datetime.now())
-            },
-            "Chicken Curry": {
-                "ingredients": [
-                    {"name": "Chicken", "image": None},
-                    {"name": "Curry Paste", "image": None},
-                    {"name": "Coconut Milk", "image": None},
-                    {"name": "Rice", "image": None}
-                ],
-                "instructions": "1. Cook chicken\n2. Add curry paste\n3. Pour coconut milk\n4. Simmer and serve with rice",
-                "image": None,
-                "author": "system",
-                "date_added": str(datetime.datetime.now())
-            }
-        }
-        save_recipe_data()
-    
-    # Load favorites
-    if os.path.exists(FAVORITES_DATA_FILE):
-        with open(FAVORITES_DATA_FILE, 'r') as f:
-            st.session_state.user_favorites = json.load(f)
+
+# All data access goes through the headless core services (see core/),
+# created once per process and shared by every session
+@st.cache_resource
+def get_services():
+    services = Services(DATA_DIR)
+    atexit.register(services.close)
+    atexit.register(METRICS.dump, METRICS_PATH)
+    return services
+
+# Shared links and exports are served by a small HTTP server next to
+# Streamlit that reads straight from storage (see share_server.py); it is
+# started with the services, so links work before anyone opens the Share page
+@st.cache_resource
+def get_share_server():
+    return get_services().start_share_server(get_share_secret())
+
+@st.cache_resource
+def get_share_secret():
+    return load_secret(DATA_DIR)
+
+# Result grids only ever show downscaled copies, served from an LRU cache
+def load_thumbnail(ref, width):
+    return get_services().images.thumbnail(ref, width)
+
+# Queue an upload for processing and return its job id. Each upload is only
+# queued once per session, however many reruns it stays in the widget.
+def submit_upload(uploaded_file):
+    submitted = st.session_state.setdefault("image_jobs", {})
+    if uploaded_file.file_id not in submitted:
+        try:
+            submitted[uploaded_file.file_id] = get_services().images.submit(uploaded_file)
+        except QueueFull:
+            st.warning("Too many images are being processed right now. Please try again in a moment.")
+            return None
+    return submitted[uploaded_file.file_id]
+
+# Uploads are processed in the background (see workers.py); show the result,
+# or a placeholder that polls until it is ready
+def show_upload(job_id, width, caption=None):
+    images = get_services().images
+    if images.is_pending(job_id):
+        _upload_placeholder(job_id)
+        return
+    digest = images.result(job_id)
+    if digest is None:
+        st.error("The image could not be processed")
     else:
-        st.session_state.user_favorites = {}
-        save_favorites_data()
+        st.image(load_thumbnail(digest, width), caption=caption, width=width)
+
+@st.fragment(run_every=1.0)
+def _upload_placeholder(job_id):
+    if not get_services().images.is_pending(job_id):
+        st.rerun()
+    st.info("Processing image...")
+
+def load_data():
+    with METRICS.timer("load_data"):
+        get_services().recipes.load()
+        get_share_server()
+
+# Pagination: the current page of each grid lives in session state so it
+# survives reruns; it goes back to the first page whenever reset_token (the
+# search term, sort order, ...) changes. Returns the slice to render.
+def _set_page(key, page):
+    st.session_state[key] = page
+
+def paginate(key, total, reset_token=None):
+    page_key = f"{key}_page"
+    size_key = f"{key}_page_size"
+    token_key = f"{key}_page_token"
+    if st.session_state.get(token_key) != reset_token:
+        st.session_state[token_key] = reset_token
+        st.session_state[page_key] = 0
+    if size_key not in st.session_state:
+        st.session_state[size_key] = DEFAULT_PAGE_SIZE
+
+    page_size = st.session_state[size_key]
+    pages = max(1, math.ceil(total / page_size))
+    page = min(st.session_state.get(page_key, 0), pages - 1)
+
+    col1, col2, col3, col4 = st.columns([1, 2, 1, 1])
+    with col1:
+        st.button("◀ Previous", key=f"{key}_prev", disabled=page == 0,
+                  on_click=_set_page, args=(page_key, page - 1))
+    with col2:
+        st.write(f"Page {page + 1} of {pages}")
+    with col3:
+        st.button("Next ▶", key=f"{key}_next", disabled=page >= pages - 1,
+                  on_click=_set_page, args=(page_key, page + 1))
+    with col4:
+        st.selectbox("Per page", PAGE_SIZE_OPTIONS, key=size_key, label_visibility="collapsed",
+                     on_change=_set_page, args=(page_key, 0))
+
+    start = page * page_size
+    return start, min(total, start + page_size)
+
+# Recipe cards: every grid renders recipes the same way, from the cards
+# prepared once per recipe version (see core/cards.py), so a rerun does not
+# format ingredient lists or decode images again for cards already shown.
+# `header` renders extra lines under the title, `actions` the buttons at the
+# end of the details.
+PLACEHOLDER_IMAGE = "https://cdn-icons-png.flaticon.com/512/3565/3565418.png"
+
+def show_card_image(card, width, caption=None, placeholder=False):
+    if card.recipe.image:
+        thumb = card.thumbnail(card.recipe.image, width)
+        if thumb is not None:
+            st.image(thumb, caption=caption, width=width)
+        else:
+            st.info("Image could not be displayed")
+    elif placeholder:
+        st.image(PLACEHOLDER_IMAGE, width=150)
 
-# Save functions
-def save_user_data():
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump(st.session_state.users, f)
+def show_card_body(card):
+    st.write("**Ingredients:**")
+    for block in card.blocks:
+        if block[0] == "text":
+            st.markdown(block[1])
+        else:
+            _, ingredient_name, ref = block
+            thumb = card.thumbnail(ref, 100)
+            if thumb is not None:
+                st.image(thumb, width=100)
+            else:
+                st.info(f"Image for {ingredient_name} could not be displayed")
+    st.write("**Instructions:**")
+    st.write(card.instructions)
 
-def save_recipe_data():
-    with open(RECIPE_DATA_FILE, 'w') as f:
-        json.dump(st.session_state.recipes, f)
+def recipe_card(card, header=None, actions=None, placeholder=True):
+    st.subheader(card.name)
+    if header is not None:
+        header()
+    show_card_image(card, 200, caption=card.name, placeholder=placeholder)
+    with st.expander("View Details"):
+        show_card_body(card)
+        st.write(f"**Created by:** {card.recipe.author}")
+        if actions is not None:
+            actions()
 
-def save_favorites_data():
-    with open(FAVORITES_DATA_FILE, 'w') as f:
-        json.dump(st.session_state.user_favorites, f)
+def save_favorite_button(name, key):
+    if st.button("Save to Favorites", key=key):
+        if get_services().favorites.add(st.session_state.username, name):
+            st.success(f"Added {name} to favorites!")
+            st.rerun()
+        else:
+            st.info(f"{name} is already in your favorites")
 
 # Function to handle login
 def login():
+    users = get_services().users
     st.header("Login")
     
     col1, col2 = st.columns([3, 2])
@@ -118,14 +209,10 @@ def login():
         
         with col1_1:
             if st.button("Login", use_container_width=True):
-                if username in st.session_state.users and st.session_state.users[username] == password:
+                if users.authenticate(username, password):
                     st.session_state.logged_in = True
                     st.session_state.username = username
                     st.success(f"Welcome {username}!")
-                    # Initialize favorites for new users
-                    if username not in st.session_state.user_favorites:
-                        st.session_state.user_favorites[username] = []
-                        save_favorites_data()
                     st.rerun()
                 else:
                     st.error("Invalid username or password")
@@ -133,11 +220,7 @@ def login():
         with col1_2:
             if st.button("Register", use_container_width=True):
                 if username and password:
-                    if username not in st.session_state.users:
-                        st.session_state.users[username] = password
-                        st.session_state.user_favorites[username] = []
-                        save_user_data()
-                        save_favorites_data()
+                    if users.register(username, password):
                         st.success("Registration successful! You can now log in.")
                     else:
                         st.error("Username already exists")
@@ -151,6 +234,7 @@ def login():
 
 # Function to search recipes
 def search_recipe():
+    services = get_services()
     st.header("Search Recipes")
     
     col1, col2 = st.columns([3, 1])
@@ -159,71 +243,84 @@ def search_recipe():
         search_term = st.text_input("Search by name or ingredient")
     
     with col2:
-        sort_option = st.selectbox("Sort by", ["Name (A-Z)", "Name (Z-A)", "Newest First", "Oldest First"])
+        sort_option = st.selectbox("Sort by", list(SORT_OPTIONS))
     
     if search_term or not search_term:  # Always show results
-        results = []
-        for name, details in st.session_state.recipes.items():
-            # Search in recipe name or ingredient names
-            if not search_term or search_term.lower() in name.lower() or any(search_term.lower() in ingredient["name"].lower() for ingredient in details["ingredients"]):
-                results.append((name, details))
+        # Search in recipe name or ingredient names (all recipes when empty),
+        # tolerating typos
+        found = services.search.search(search_term, sort_option)
         
-        # Sort results based on selection
-        if sort_option == "Name (A-Z)":
-            results.sort(key=lambda x: x[0])
-        elif sort_option == "Name (Z-A)":
-            results.sort(key=lambda x: x[0], reverse=True)
-        elif sort_option == "Newest First":
-            results.sort(key=lambda x: x[1].get("date_added", ""), reverse=True)
-        elif sort_option == "Oldest First":
-            results.sort(key=lambda x: x[1].get("date_added", ""))
-        
-        if results:
-            st.write(f"Found {len(results)} recipes")
+        if found.total:
+            st.write(f"Found {found.total} recipes")
+            if search_term and not found.exact:
+                st.caption("No exact matches, showing similar recipes")
+            start, end = paginate("search", found.total, (search_term, sort_option))
+            results = found.page(start, end)
             
-            # Display results in a grid
+            # Display the current page of results in a grid
             cols = st.columns(3)
-            for i, (name, details) in enumerate(results):
+            for i, recipe in enumerate(results):
+                card = services.cards.get(recipe.name)
+                if card is None:
+                    continue
+                
+                def similarity():
+                    score = found.score(card.name)
+                    if score < 1.0:
+                        st.caption(f"Similar match ({score:.0%})")
+                
                 with cols[i % 3]:
-                    st.subheader(name)
-                    if details["image"]:
-                        try:
-                            st.image(base64.b64decode(details["image"]), caption=name, width=200)
-                        except:
-                            st.info("Image could not be displayed")
-                    else:
-                        st.image("https://cdn-icons-png.flaticon.com/512/3565/3565418.png", width=150)
-                    
-                    with st.expander("View Details"):
-                        st.write("**Ingredients:**")
-                        for ing in details["ingredients"]:
-                            st.write(f"• {ing['name']}")
-                            if ing["image"]:
-                                try:
-                                    st.image(base64.b64decode(ing["image"]), width=100)
-                                except:
-                                    st.info(f"Image for {ing['name']} could not be displayed")
-                        
-                        st.write("**Instructions:**")
-                        st.write(details["instructions"])
-                        
-                        st.write(f"**Created by:** {details['author']}")
-                        
-                        # Save to favorite button
-                        if st.button(f"Save to Favorites", key=f"fav_{name}"):
-                            if st.session_state.username not in st.session_state.user_favorites:
-                                st.session_state.user_favorites[st.session_state.username] = []
-                            
-                            if name not in st.session_state.user_favorites[st.session_state.username]:
-                                st.session_state.user_favorites[st.session_state.username].append(name)
-                                save_favorites_data()
-                                st.success(f"Added {name} to favorites!")
-                                st.rerun()
-                            else:
-                                st.info(f"{name} is already in your favorites")
+                    recipe_card(card, header=similarity,
+                                actions=lambda: save_favorite_button(card.name, f"fav_{card.name}"))
         else:
             st.info("No recipes found matching your search")
 
+# Function to find recipes from the ingredients at hand
+def what_can_i_cook():
+    services = get_services()
+    st.header("What Can I Cook?")
+    
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        pantry_text = st.text_area("Ingredients you have (separated by commas or new lines)")
+    
+    with col2:
+        max_missing = st.selectbox("Missing ingredients allowed", ["Any", 0, 1, 2, 3, 5])
+    
+    ingredients = split_ingredients(pantry_text)
+    if not ingredients:
+        st.info("Enter the ingredients you have to see which recipes you can make")
+        return
+    
+    # Recipes are ranked by how much of them your ingredients cover
+    found = services.pantry.match(ingredients, None if max_missing == "Any" else max_missing)
+    if found.unknown:
+        st.caption("No recipe uses: " + ", ".join(found.unknown))
+    
+    if found.total:
+        st.write(f"Found {found.total} recipes")
+        start, end = paginate("pantry", found.total, (tuple(ingredients), max_missing))
+        
+        cols = st.columns(3)
+        for i, match in enumerate(found.page(start, end)):
+            card = services.cards.get(match.recipe.name)
+            if card is None:
+                continue
+            
+            def coverage():
+                st.progress(match.coverage, text=f"You have {match.have} of {match.required} ingredients")
+                if match.missing:
+                    st.write("**Missing:** " + ", ".join(match.missing))
+                else:
+                    st.write("**You have everything!**")
+            
+            with cols[i % 3]:
+                recipe_card(card, header=coverage, placeholder=False,
+                            actions=lambda: save_favorite_button(card.name, f"pantry_fav_{card.name}"))
+    else:
+        st.info("No recipes found for these ingredients")
+
 # Function to type/add new recipes
 def type_recipe():
     st.header("Add New Recipe")
@@ -258,28 +355,36 @@ def type_recipe():
     with col2:
         st.write("Upload an image of your recipe:")
         uploaded_image = st.file_uploader("Choose an image", type=["jpg", "jpeg", "png"])
-        image_data = None
+        image_job = None
         
         if uploaded_image is not None:
-            image = Image.open(uploaded_image)
-            st.image(image, caption="Uploaded Image", width=300)
-            buf = io.BytesIO()
-            image.save(buf, format="PNG")
-            image_data = base64.b64encode(buf.getvalue()).decode()
+            image_job = submit_upload(uploaded_image)
+            if image_job is not None:
+                show_upload(image_job, 300, "Uploaded Image")
     
     if st.button("Save Recipe", use_container_width=True):
-        if recipe_name and any(ing["name"].strip() for ing in st.session_state.ingredients_list):
+        conflict = get_services().recipes.name_conflict(recipe_name) if recipe_name else None
+        if conflict is not None:
+            st.error(f"A recipe named '{conflict}' already exists; please choose a different name")
+        elif recipe_name and any(ing["name"].strip() for ing in st.session_state.ingredients_list):
             # Filter out empty ingredients
             valid_ingredients = [ing for ing in st.session_state.ingredients_list if ing["name"].strip()]
             
-            st.session_state.recipes[recipe_name] = {
-                "ingredients": valid_ingredients,
-                "instructions": instructions,
-                "image": image_data,
-                "author": st.session_state.username,
-                "date_added": str(datetime.datetime.now())
-            }
-            save_recipe_data()
+            # Save right away; an image still being processed is attached
+            # to the recipe when its job finishes
+            services = get_services()
+            image_data = services.images.result(image_job) if image_job else None
+            services.recipes.save(Recipe(
+                recipe_name,
+                tuple(Ingredient(ing["name"]) for ing in valid_ingredients),
+                instructions,
+                image_data,
+                st.session_state.username,
+                str(datetime.datetime.now())
+            ))
+            if image_job and image_data is None:
+                if services.images.attach_to_recipe(image_job, recipe_name) not in (PENDING, DONE):
+                    st.warning("The image could not be processed; the recipe was saved without it")
             st.success(f"Recipe '{recipe_name}' saved successfully!")
             # Clear the ingredients list for next recipe
             st.session_state.ingredients_list = [{"name": "", "image": None}]
@@ -289,9 +394,10 @@ def type_recipe():
 
 # Function to take pictures of ingredients
 def take_ingredient_photo():
+    services = get_services()
     st.header("Add Ingredient Photos")
     
-    recipe_options = list(st.session_state.recipes.keys())
+    recipe_options = services.recipes.names()
     
     if not recipe_options:
         st.info("No recipes available. Please create a recipe first.")
@@ -304,8 +410,8 @@ def take_ingredient_photo():
         
         if recipe_to_update:
             # Get ingredients for the selected recipe
-            ingredients = st.session_state.recipes[recipe_to_update]["ingredients"]
-            ingredient_names = [ing["name"] for ing in ingredients]
+            ingredients = services.recipes.get(recipe_to_update).ingredients
+            ingredient_names = [ing.name for ing in ingredients]
             
             if ingredient_names:
                 ingredient_to_update = st.selectbox("Select Ingredient", ingredient_names)
@@ -320,99 +426,117 @@ def take_ingredient_photo():
         uploaded_image = st.file_uploader("Upload an ingredient image", type=["jpg", "jpeg", "png"])
         
         if uploaded_image is not None and ingredient_to_update:
-            image = Image.open(uploaded_image)
-            st.image(image, caption=f"Image for {ingredient_to_update}", width=250)
+            image_job = submit_upload(uploaded_image)
+            if image_job is None:
+                return
+            show_upload(image_job, 250, f"Image for {ingredient_to_update}")
             
             if st.button("Add Ingredient Photo"):
-                # Find the ingredient in the recipe and update its image
-                for i, ing in enumerate(st.session_state.recipes[recipe_to_update]["ingredients"]):
-                    if ing["name"] == ingredient_to_update:
-                        # Convert image to base64
-                        buf = io.BytesIO()
-                        image.save(buf, format="PNG")
-                        image_data = base64.b64encode(buf.getvalue()).decode()
-                        
-                        # Update the ingredient image
-                        st.session_state.recipes[recipe_to_update]["ingredients"][i]["image"] = image_data
-                        save_recipe_data()
-                        
-                        st.success(f"Photo added for {ingredient_to_update} in {recipe_to_update}!")
-                        
-                        # Display the updated ingredients
-                        st.write(f"**Updated Ingredients for {recipe_to_update}:**")
-                        for ing in st.session_state.recipes[recipe_to_update]["ingredients"]:
-                            st.write(f"• {ing['name']}")
-                            if ing["name"] == ingredient_to_update:
-                                st.image(image, width=100)
-                        
-                        break
+                # The photo is attached as soon as it has been processed;
+                # further photos can be uploaded in the meantime
+                status = services.images.attach_to_ingredient(image_job, recipe_to_update, ingredient_to_update)
+                if status == FAILED:
+                    st.error("The photo could not be processed. Please upload it again.")
+                    return
+                if status is None:
+                    st.error("This upload has expired. Please upload the photo again.")
+                    return
+                st.success(f"Photo added for {ingredient_to_update} in {recipe_to_update}!")
+                
+                # Display the updated ingredients
+                st.write(f"**Updated Ingredients for {recipe_to_update}:**")
+                for ing in services.recipes.get(recipe_to_update).ingredients:
+                    st.write(f"• {ing.name}")
+                    if ing.name == ingredient_to_update:
+                        show_upload(image_job, 100)
+
+# Function to bulk-import recipes from a JSON-lines or CSV file; the recipes
+# are added as the logged-in user's own
+def bulk_import():
+    services = get_services()
+    st.header("Import Recipes")
+    st.write("Upload a JSON-lines or CSV file with one recipe per row, or a JSON file with a list of "
+             "recipes or an object mapping names to recipes. Fields: `name`, `ingredients` (a list, "
+             "or names separated by `;`), and optionally `instructions`, `image` and `date_added`.")
+    
+    uploaded_file = st.file_uploader("Choose a file", type=["jsonl", "ndjson", "json", "csv"])
+    replace = st.checkbox("Replace my existing recipes with the same name")
+    
+    if uploaded_file is not None and st.button("Import", use_container_width=True):
+        progress = st.progress(0.0, text="Importing...")
+        total_size = max(uploaded_file.size, 1)
+        
+        def report(result):
+            done = min(uploaded_file.tell() / total_size, 1.0)
+            progress.progress(done, text=f"Imported {result.imported} recipes...")
+        
+        try:
+            result = services.imports.import_file(st.session_state.username, uploaded_file, uploaded_file.name,
+                                                  replace, report)
+        except ValueError as e:
+            progress.empty()
+            st.error(f"Could not import the file: {e}")
+            return
+        progress.progress(1.0, text="Done")
+        st.success(f"Imported {result.imported} recipes in {result.seconds:.1f} s")
+        if result.duplicates:
+            st.info(f"Skipped {result.duplicates} recipes whose names already exist"
+                    + (" (only your own recipes are replaced)" if replace else ""))
+        if result.invalid:
+            st.warning(f"Skipped {result.invalid} rows without a name or ingredients")
 
 # Function to manage favorite recipes
 def manage_favorites():
+    favorites = get_services().favorites
     st.header("Manage Favorite Recipes")
     
-    if st.session_state.username in st.session_state.user_favorites and st.session_state.user_favorites[st.session_state.username]:
-        favorites = st.session_state.user_favorites[st.session_state.username]
+    count = favorites.count(st.session_state.username)
+    if count:
+        st.write(f"You have {count} favorite recipes")
+        start, end = paginate("favorites", count)
         
-        st.write(f"You have {len(favorites)} favorite recipes")
-        
-        # Display favorites in a grid
+        # Display the current page of favorites in a grid; removing one
+        # reuses the prepared cards of the others
+        cards = get_services().cards
         cols = st.columns(3)
-        for i, recipe_name in enumerate(favorites):
-            if recipe_name in st.session_state.recipes:
-                with cols[i % 3]:
-                    details = st.session_state.recipes[recipe_name]
-                    st.subheader(recipe_name)
-                    if details["image"]:
-                        try:
-                            st.image(base64.b64decode(details["image"]), caption=recipe_name, width=200)
-                        except:
-                            st.info("Image could not be displayed")
-                    else:
-                        st.image("https://cdn-icons-png.flaticon.com/512/3565/3565418.png", width=150)
-                    
-                    with st.expander("View Details"):
-                        st.write("**Ingredients:**")
-                        for ing in details["ingredients"]:
-                            st.write(f"• {ing['name']}")
-                            if ing["image"]:
-                                try:
-                                    st.image(base64.b64decode(ing["image"]), width=100)
-                                except:
-                                    st.info(f"Image for {ing['name']} could not be displayed")
-                        
-                        st.write("**Instructions:**")
-                        st.write(details["instructions"])
-                        
-                        st.write(f"**Created by:** {details['author']}")
-                        
-                        # Remove from favorites button
-                        if st.button(f"Remove from Favorites", key=f"remove_{recipe_name}"):
-                            st.session_state.user_favorites[st.session_state.username].remove(recipe_name)
-                            save_favorites_data()
-                            st.success(f"Removed {recipe_name} from favorites!")
-                            st.rerun()
+        for i, recipe_name in enumerate(favorites.names(st.session_state.username)[start:end]):
+            card = cards.get(recipe_name)
+            if card is None:
+                continue
+            
+            def remove_button():
+                if st.button("Remove from Favorites", key=f"remove_{card.name}"):
+                    favorites.remove(st.session_state.username, card.name)
+                    st.success(f"Removed {card.name} from favorites!")
+                    st.rerun()
+            
+            with cols[i % 3]:
+                recipe_card(card, actions=remove_button)
     else:
         st.info("You don't have any favorite recipes yet. Search for recipes and add them to your favorites!")
         st.image("https://cdn-icons-png.flaticon.com/512/2772/2772128.png", width=200)
 
 # Function to share recipes
 def share_recipe():
+    services = get_services()
     st.header("Share Recipe")
     
     col1, col2 = st.columns([3, 2])
     
     with col1:
-        if st.session_state.username in st.session_state.user_favorites and st.session_state.user_favorites[st.session_state.username]:
-            favorites = st.session_state.user_favorites[st.session_state.username]
+        favorites = services.favorites.names(st.session_state.username)
+        if favorites:
             recipe_to_share = st.selectbox("Select Recipe to Share", favorites)
             
             share_method = st.radio("Share via:", ["Email", "Link", "Social Media"])
             
             if st.button("Generate Sharing Link"):
-                share_link = f"https://recipe-hub.com/shared/{recipe_to_share.replace(' ', '-').lower()}"
+                share_link = share_url(recipe_to_share)
                 st.success("Recipe Shared Successfully!")
                 st.code(share_link)
+                if is_local_url():
+                    st.caption("This link only opens on this computer. To share it with others, start the "
+                               "app with RECIPE_SHARE_HOST and RECIPE_SHARE_URL set to a public address.")
                 
                 if share_method == "Email":
                     st.write("Email with recipe details has been prepared!")
@@ -420,33 +544,29 @@ def share_recipe():
                     st.write("Ready to post on your social media!")
                 
                 # Display the recipe card
-                if recipe_to_share in st.session_state.recipes:
-                    details = st.session_state.recipes[recipe_to_share]
+                card = services.cards.get(recipe_to_share)
+                if card is not None:
                     st.subheader(f"Preview: {recipe_to_share}")
-                    if details["image"]:
-                        try:
-                            st.image(base64.b64decode(details["image"]), width=300)
-                        except:
-                            st.info("Image could not be displayed")
-                    st.write("**Ingredients:**")
-                    for ing in details["ingredients"]:
-                        st.write(f"• {ing['name']}")
-                        if ing["image"]:
-                            try:
-                                st.image(base64.b64decode(ing["image"]), width=100)
-                            except:
-                                st.info(f"Image for {ing['name']} could not be displayed")
-                    st.write("**Instructions:**")
-                    st.write(details["instructions"])
+                    show_card_image(card, 300)
+                    show_card_body(card)
         else:
             st.info("You need to add recipes to your favorites before you can share them")
     
     with col2:
         st.image("https://cdn-icons-png.flaticon.com/512/3991/3991833.png", width=220)
         st.write("Share your favorite recipes with friends and family!")
+        
+        # Personal links for downloading recipes as JSON lines
+        secret = get_share_secret()
+        st.write("**Export your recipes:**")
+        st.markdown(f"[Favorites]({export_url(secret, st.session_state.username, 'favorites')}) · "
+                    f"[Your created recipes]({export_url(secret, st.session_state.username, 'recipes')})")
 
-# Function to sync favorites
+# Function to sync favorites: every device name has its own cursor in the
+# change feed (see core/sync.py), so a sync only fetches what changed since
+# that device last synced
 def sync_favorites():
+    sync = get_services().sync
     st.header("Favorite Recipe Sync")
     
     col1, col2 = st.columns([3, 2])
@@ -455,49 +575,84 @@ def sync_favorites():
         st.write("Sync your favorite recipes across all your devices")
         st.write("Your account: **" + st.session_state.username + "**")
         
-        device_name = st.text_input("Device Name (e.g., My Phone, My Laptop)")
+        device_name = st.text_input("Device Name (e.g., My Phone, My Laptop)").strip()
         
         sync_options = st.multiselect("Sync Options", 
                                       ["Favorites", "Your Created Recipes", "Recipe Images", "Ingredient Images"],
                                       default=["Favorites", "Ingredient Images"])
         
         if st.button("Sync Now"):
-            with st.spinner("Syncing your recipes..."):
-                # Simulate sync with a delay
-                import time
-                time.sleep(1.5)
+            if not device_name:
+                st.warning("Please enter a device name")
+            else:
+                with st.spinner("Syncing your recipes..."):
+                    delta = sync.pull(st.session_state.username, device_name,
+                                      favorites="Favorites" in sync_options,
+                                      authored="Your Created Recipes" in sync_options,
+                                      recipe_images="Recipe Images" in sync_options,
+                                      ingredient_images="Ingredient Images" in sync_options)
+                    sync.ack(st.session_state.username, device_name, delta.until)
                 st.success("Sync completed successfully!")
                 
                 # Show what was synced
                 st.write("**Synced Items:**")
-                if "Favorites" in sync_options:
-                    if st.session_state.username in st.session_state.user_favorites:
-                        num_favorites = len(st.session_state.user_favorites[st.session_state.username])
-                        st.write(f"✓ {num_favorites} favorite recipes")
-                    else:
-                        st.write("✓ 0 favorite recipes")
-                
-                if "Your Created Recipes" in sync_options:
-                    created_recipes = [r for r, details in st.session_state.recipes.items() 
-                                      if details["author"] == st.session_state.username]
-                    st.write(f"✓ {len(created_recipes)} created recipes")
-                
-                if "Recipe Images" in sync_options:
-                    img_count = sum(1 for r in st.session_state.recipes.values() if r["image"] is not None)
-                    st.write(f"✓ {img_count} recipe images")
-                
-                if "Ingredient Images" in sync_options:
-                    ing_img_count = 0
-                    for recipe in st.session_state.recipes.values():
-                        for ing in recipe["ingredients"]:
-                            if ing["image"] is not None:
-                                ing_img_count += 1
-                    st.write(f"✓ {ing_img_count} ingredient images")
+                if delta.full:
+                    st.write(f"✓ First sync of {device_name}: {len(delta.favorites)} favorite recipes")
+                elif delta.is_empty():
+                    st.write(f"✓ {device_name} is already up to date")
+                if delta.added:
+                    st.write(f"✓ {len(delta.added)} favorites added: " + ", ".join(delta.added))
+                if delta.removed:
+                    st.write(f"✓ {len(delta.removed)} favorites removed: " + ", ".join(delta.removed))
+                if delta.recipes:
+                    st.write(f"✓ {len(delta.recipes)} recipes sent")
+                if delta.deleted:
+                    st.write(f"✓ {len(delta.deleted)} deleted recipes")
+                if delta.images:
+                    st.write(f"✓ {len(delta.images)} images, downloaded when opened")
+        
+        devices = sync.devices(st.session_state.username)
+        if devices:
+            st.write("**Your devices:**")
+            for device, _, synced_at in devices:
+                st.write(f"• {device}: last synced {datetime.datetime.fromtimestamp(synced_at).strftime('%Y-%m-%d %H:%M')}")
     
     with col2:
         st.image("https://cdn-icons-png.flaticon.com/512/2682/2682067.png", width=220)
         st.write("Keep your recipes synchronized across all your devices!")
 
+# Performance panel, when enabled (see metrics.py): where the previous rerun
+# spent its time, rolling statistics per operation, and a one-off cProfile
+# capture of the next rerun
+def metrics_panel_allowed():
+    return METRICS_PANEL and st.session_state.logged_in and st.session_state.username in ADMINS
+
+def _profile_next_rerun():
+    st.session_state.profile_rerun = True
+
+def metrics_panel():
+    st.sidebar.markdown("---")
+    with st.sidebar.expander("⏱️ Performance"):
+        last = st.session_state.get("last_rerun")
+        if last is not None:
+            st.write(f"**Previous rerun:** {last.seconds * 1000:.1f} ms")
+            rows = [{"operation": name, "calls": calls, "ms": round(seconds * 1000, 2)}
+                    for name, (calls, seconds) in sorted(last.timings.items(), key=lambda item: -item[1][1])]
+            rows.append({"operation": "rendering & other", "calls": None, "ms": round(last.other_seconds() * 1000, 2)})
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        
+        st.write(f"**Last {METRICS.window:g} s:**")
+        summary = METRICS.window_summary()
+        if summary:
+            st.dataframe(pd.DataFrame.from_dict(summary, orient="index").round(2), use_container_width=True)
+        for name, count in METRICS.window_counts().items():
+            st.caption(f"{name}: {count}")
+        st.caption(f"Prometheus metrics: `{METRICS_PATH}`")
+        
+        st.button("Profile next rerun", on_click=_profile_next_rerun)
+        if st.session_state.get("last_profile"):
+            st.caption(f"Profile written to `{st.session_state.last_profile}`")
+
 # Main app layout
 def main():
     # Load data first
@@ -522,39 +677,31 @@ def main():
         # Navigation options
         option = st.sidebar.radio(
             "Choose an option",
-            ["Search Recipe", "Type New Recipe", "Add Ingredient Photos", 
-             "Manage Favorites", "Share Recipe", "Sync Favorites"]
+            ["Search Recipe", "What Can I Cook", "Type New Recipe", "Add Ingredient Photos", 
+             "Manage Favorites", "Share Recipe", "Sync Favorites", "Import Recipes"]
         )
         
         # Display user stats in sidebar
         st.sidebar.markdown("---")
         st.sidebar.subheader("Your Recipe Stats")
         
-        # Count user's recipes
-        user_recipes = len([r for r, details in st.session_state.recipes.items() 
-                           if details["author"] == st.session_state.username])
-        
-        # Count favorites
-        user_favorites = 0
-        if st.session_state.username in st.session_state.user_favorites:
-            user_favorites = len(st.session_state.user_favorites[st.session_state.username])
+        # Counts are maintained by the store on every write
+        user_stats = get_services().users.stats(st.session_state.username)
+        st.sidebar.write(f"📝 Created Recipes: {user_stats.recipes}")
+        st.sidebar.write(f"⭐ Favorite Recipes: {user_stats.favorites}")
+        st.sidebar.write(f"🖼️ Ingredient Images: {user_stats.ingredient_images}")
+        last_sync = get_services().sync.last_sync(st.session_state.username)
+        st.sidebar.write("🔄 Last Sync: " + (datetime.datetime.fromtimestamp(last_sync).strftime('%Y-%m-%d %H:%M')
+                                            if last_sync else "Never"))
         
-        # Count ingredient images
-        ingredient_images = 0
-        for recipe in st.session_state.recipes.values():
-            if recipe["author"] == st.session_state.username:
-                for ing in recipe["ingredients"]:
-                    if ing["image"] is not None:
-                        ingredient_images += 1
-        
-        st.sidebar.write(f"📝 Created Recipes: {user_recipes}")
-        st.sidebar.write(f"⭐ Favorite Recipes: {user_favorites}")
-        st.sidebar.write(f"🖼️ Ingredient Images: {ingredient_images}")
-        st.sidebar.write(f"🔄 Last Sync: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
+        if metrics_panel_allowed():
+            metrics_panel()
         
         # Display selected option
         if option == "Search Recipe":
             search_recipe()
+        elif option == "What Can I Cook":
+            what_can_i_cook()
         elif option == "Type New Recipe":
             type_recipe()
         elif option == "Add Ingredient Photos":
@@ -565,6 +712,26 @@ def main():
             share_recipe()
         elif option == "Sync Favorites":
             sync_favorites()
+        elif option == "Import Recipes":
+            bulk_import()
+
+# Run main() as one instrumented rerun, under cProfile when the panel asked
+# for it, and keep its timings for the panel on the next rerun
+def run_instrumented():
+    profile_path = None
+    if st.session_state.pop("profile_rerun", False) and metrics_panel_allowed():
+        profile_path = os.path.join(DATA_DIR, PROFILE_DIR,
+                                    datetime.datetime.now().strftime("rerun-%Y%m%d-%H%M%S.prof"))
+    rerun = None
+    profiled = False
+    try:
+        with METRICS.rerun() as rerun, (profile(profile_path) if profile_path else nullcontext(False)) as profiled:
+            main()
+    finally:
+        st.session_state.last_rerun = rerun
+        if profiled:
+            st.session_state.last_profile = profile_path
+        METRICS.dump_if_due(METRICS_PATH, METRICS_INTERVAL)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_instrumented()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+
+from blobstore import BlobStore
+from ingest import MAX_IMAGE_DIMENSION, ingest_image
+from thumbnails import Thumbnailer
+
+# Upload ingest benchmark: peak RSS and latency for one large phone photo.
+#
+# Compares the original upload handling (decode, re-encode as PNG into a
+# buffer, base64 the buffer) with ingest.ingest_image(). Each run happens in
+# a fresh process so that ru_maxrss reflects only that pipeline; the figure
+# reported is the growth of peak RSS over the process baseline.
+#
+#     python -m benchmarks.ingest --megapixels 12
+
+
+def make_photo(path, megapixels=12):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    # Noise compresses like a real photo; a gradient adds some structure
+    noise = Image.effect_noise((width, height), 48)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5)))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotated 90 degrees
+    exif[0x010F] = "Benchmark Phone"
+    image.save(path, format="JPEG", quality=92, exif=exif)
+
+
+def _legacy(path, work_dir):
+    with open(path, 'rb') as f:
+        image = Image.open(f)
+        buf = io.BytesIO()
+        image.save(buf, format="PNG")
+        return len(base64.b64encode(buf.getvalue()).decode())
+
+
+def _ingest(path, work_dir):
+    blobs = BlobStore(os.path.join(work_dir, "blobs"))
+    thumbnailer = Thumbnailer(blobs, os.path.join(work_dir, "thumbs"))
+    with open(path, 'rb') as f:
+        digest = ingest_image(f, blobs, thumbnailer)
+    return os.path.getsize(blobs.path(digest))
+
+
+PIPELINES = {"legacy_png_base64": _legacy, "ingest": _ingest}
+
+
+def _measure(name, path, work_dir, queue):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    output_bytes = PIPELINES[name](path, work_dir)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "pipeline": name,
+        "seconds": round(elapsed, 3),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_growth_mib": round((peak - baseline) / 1024, 1),
+        "stored_bytes": output_bytes,
+    })
+
+
+def run(megapixels=12, repeat=3):
+    work_dir = tempfile.mkdtemp(prefix="recipe-ingest-")
+    try:
+        path = os.path.join(work_dir, "photo.jpg")
+        make_photo(path, megapixels)
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for name in PIPELINES:
+            runs = []
+            for i in range(repeat):
+                queue = context.Queue()
+                out_dir = os.path.join(work_dir, f"{name}-{i}")
+                process = context.Process(target=_measure, args=(name, path, out_dir, queue))
+                process.start()
+                runs.append(queue.get())
+                process.join()
+            best = min(runs, key=lambda r: r["seconds"])
+            best["peak_rss_growth_mib"] = max(r["peak_rss_growth_mib"] for r in runs)
+            results.append(best)
+        return {
+            "megapixels": megapixels,
+            "input_bytes": os.path.getsize(path),
+            "max_dimension": MAX_IMAGE_DIMENSION,
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload ingest benchmark")
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.megapixels, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.synthetic import generate
+from compact import CompactRecipe
+from core import Services
+from storage import RECIPE_DATA_FILE, open_storage
+
+# Memory used by the in-memory recipe catalog.
+#
+# Generates a synthetic catalog, lets Services migrate it (SQLite, images
+# moved to the blob store), then measures with tracemalloc how much the
+# loaded recipes take in each of the forms the app has held them in:
+#
+#   original   the recipe_data.json dicts, inline base64 images included
+#   dicts      the storage dicts, images as blob references
+#   compact    the DataStore's CompactRecipe records (see compact.py)
+#
+# Each form is loaded in a fresh interpreter so interned strings and the
+# ingredient dictionary are counted where they are built. Figures are
+# scaled to bytes per 10,000 recipes.
+#
+#     python -m benchmarks.memory --recipes 10000
+
+FORMS = ("original", "dicts", "compact")
+PER_RECIPES = 10000
+
+
+def load(form, data_dir):
+    if form == "original":
+        with open(os.path.join(data_dir, RECIPE_DATA_FILE)) as f:
+            return json.load(f)
+    storage = open_storage(data_dir, "sqlite")
+    try:
+        if form == "dicts":
+            return storage.load_recipes()
+        return {name: CompactRecipe.from_dict(recipe) for name, recipe in storage.iter_recipes()}
+    finally:
+        storage.close()
+
+
+def measure(form, data_dir):
+    tracemalloc.start()
+    recipes = load(form, data_dir)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"recipes": len(recipes), "current_bytes": current, "peak_bytes": peak}
+
+
+def _measure_in_subprocess(form, data_dir):
+    output = subprocess.run([sys.executable, "-m", "benchmarks.memory", "--measure", form, data_dir],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def run(recipes=10000, image_size=64, seed=0):
+    work_dir = tempfile.mkdtemp(prefix="recipe-memory-")
+    try:
+        data_dir = os.path.join(work_dir, "data")
+        generated = generate(data_dir, recipes, image_size=image_size, seed=seed)
+        generated.pop("vocabulary")
+        # Import into SQLite and move the inline images to the blob store
+        Services(data_dir, "sqlite").close()
+        results = {}
+        for form in FORMS:
+            measured = _measure_in_subprocess(form, data_dir)
+            scale = PER_RECIPES / max(1, measured["recipes"])
+            results[form] = {
+                "bytes_per_10k": int(measured["current_bytes"] * scale),
+                "peak_bytes_per_10k": int(measured["peak_bytes"] * scale),
+            }
+        baseline = results["dicts"]["bytes_per_10k"]
+        results["compact"]["saved_vs_dicts"] = round(1 - results["compact"]["bytes_per_10k"] / baseline, 3)
+        return {
+            "params": {"recipes": recipes, "image_size": image_size, "seed": seed},
+            "catalog": generated,
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe catalog memory report")
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--image-size", type=int, default=64, help="Side of the generated recipe images")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--measure", nargs=2, metavar=("FORM", "DATA_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+    print(json.dumps(run(args.recipes, args.image_size, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
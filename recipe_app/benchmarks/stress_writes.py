@@ -0,0 +1,109 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from datastore import DataStore
+from storage import open_storage
+
+# Concurrent-writer stress test for the storage backends.
+#
+# Spawns several processes that each behave like a busy Streamlit server:
+# a DataStore of their own, refresh_if_stale() before every operation (as a
+# rerun does), then a recipe save or a favorite toggle. Afterwards the data
+# is reopened and checked for lost writes, and throughput is reported.
+#
+#     python -m benchmarks.stress_writes --writers 4 --ops 200 --backend json
+
+
+def _writer(data_dir, backend, writer_id, ops, start_event):
+    store = DataStore(open_storage(data_dir, backend))
+    username = f"writer{writer_id}"
+    store.save_user(username, "password")
+    start_event.wait()
+    for i in range(ops):
+        store.refresh_if_stale()
+        name = f"Recipe {writer_id}-{i}"
+        store.save_recipe(name, {
+            "ingredients": [{"name": f"Ingredient {i}", "image": None}],
+            "instructions": "Stir.",
+            "image": None,
+            "author": username,
+            "date_added": "2025-01-01 00:00:00",
+        })
+        store.refresh_if_stale()
+        store.add_favorite(username, name)
+        if i % 2:
+            store.refresh_if_stale()
+            store.remove_favorite(username, name)
+
+
+def run(backend, writers, ops, data_dir=None):
+    own_dir = data_dir is None
+    data_dir = data_dir or tempfile.mkdtemp(prefix="recipe-stress-")
+    try:
+        # Create the storage up front so the writers don't race to set it up
+        open_storage(data_dir, backend).close()
+
+        start_event = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=_writer, args=(data_dir, backend, w, ops, start_event))
+            for w in range(writers)
+        ]
+        for process in processes:
+            process.start()
+        time.sleep(0.5)
+        started = time.perf_counter()
+        start_event.set()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+        failed = [p.exitcode for p in processes if p.exitcode != 0]
+
+        storage = open_storage(data_dir, backend)
+        recipes = storage.load_recipes()
+        favorites = storage.load_favorites()
+        lost_recipes = [
+            f"Recipe {w}-{i}" for w in range(writers) for i in range(ops)
+            if f"Recipe {w}-{i}" not in recipes
+        ]
+        wrong_favorites = [
+            f"writer{w}" for w in range(writers)
+            if favorites.get(f"writer{w}", []) != [f"Recipe {w}-{i}" for i in range(0, ops, 2)]
+        ]
+        total_ops = writers * (ops * 2 + ops // 2)
+        return {
+            "backend": backend,
+            "writers": writers,
+            "ops_per_writer": ops,
+            "total_writes": total_ops,
+            "seconds": round(elapsed, 3),
+            "writes_per_second": round(total_ops / elapsed, 1),
+            "failed_writers": len(failed),
+            "lost_recipes": len(lost_recipes),
+            "inconsistent_favorites": len(wrong_favorites),
+        }
+    finally:
+        if own_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent writer stress test")
+    parser.add_argument("--backend", choices=["sqlite", "json", "all"], default="all")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=100, help="Recipes saved per writer")
+    args = parser.parse_args()
+
+    backends = ["sqlite", "json"] if args.backend == "all" else [args.backend]
+    results = [run(backend, args.writers, args.ops) for backend in backends]
+    print(json.dumps(results, indent=2))
+    if any(r["failed_writers"] or r["lost_recipes"] or r["inconsistent_favorites"] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
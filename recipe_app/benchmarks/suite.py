@@ -0,0 +1,284 @@
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import replace
+
+from PIL import Image
+
+from benchmarks.ingest import make_photo
+from benchmarks.synthetic import generate
+from core import SORT_OPTIONS, LocalDevice, Services
+from ingest import ingest_image
+from stats import StatsIndex
+from thumbnails import THUMBNAIL_DIR, Thumbnailer
+
+# Benchmark suite for the data layer.
+#
+# Generates a synthetic catalog (see synthetic.py) and times, headlessly, what
+# the pages do on every rerun or action: load_data() cold (first start,
+# including the JSON import) and warm, each save function, search filter +
+# sort for a few kinds of query, "what can I cook" matching for a few
+# pantries, favorites sync pulls after a growing number of changes, picking
+# up other processes' writes, the sidebar stats, and image encode/decode.
+# Results are printed as JSON (or written with --output) so runs can be
+# compared across commits.
+#
+#     python -m benchmarks.suite --recipes 10000 --output bench.json
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def timed(fn, runs):
+    samples = []
+    for i in range(runs):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return _summary(samples)
+
+
+def _once(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, round((time.perf_counter() - started) * 1000, 3)
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_load(data_dir, backend):
+    services, cold_ms = _once(lambda: _load(data_dir, backend))
+    services.store.persist()
+    services.store.storage.close()
+    services, warm_ms = _once(lambda: _load(data_dir, backend))
+    return services, {"load_data_cold_ms": cold_ms, "load_data_warm_ms": warm_ms}
+
+
+def _load(data_dir, backend):
+    services = Services(data_dir, backend)
+    services.recipes.load()
+    return services
+
+
+def bench_saves(services, runs):
+    names = services.recipes.names()
+    recipe = services.recipes.get(names[0])
+    return {
+        "save_user_data": timed(lambda i: services.users.register(f"bench{i}", "password"), runs),
+        "save_recipe_data": timed(
+            lambda i: services.recipes.save(replace(recipe, name=f"Bench Recipe {i}")), runs),
+        "save_favorite": timed(lambda i: services.favorites.add("bench0", names[i % len(names)]), runs),
+        "remove_favorite": timed(lambda i: services.favorites.remove("bench0", names[i % len(names)]), runs),
+        "set_ingredient_image": timed(
+            lambda i: services.recipes.set_ingredient_image(
+                f"Bench Recipe {i}", recipe.ingredients[0].name, "0" * 64), runs),
+    }
+
+
+# Swap two letters in the middle of a word
+def _typo(word):
+    i = len(word) // 2
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+def bench_search(services, vocabulary, runs, page_size=9):
+    queries = {
+        "all": "",
+        "common_ingredient": vocabulary[0].lower(),
+        "rare_ingredient": vocabulary[-1].lower(),
+        "two_letters": vocabulary[0][:2].lower(),
+        "dish_word": "curry",
+        "no_match": "zzqx",
+        # Typos only match through the fuzzy search
+        "typo_ingredient": _typo(vocabulary[len(vocabulary) // 3].lower()),
+        "typo_two_words": "spicey cury",
+    }
+    results = {}
+    for label, term in queries.items():
+        for sort_option in SORT_OPTIONS:
+            found = services.search.search(term, sort_option)
+            results[f"{label} / {sort_option}"] = dict(
+                timed(lambda i: services.search.search(term, sort_option).page(0, page_size), runs),
+                matches=found.total)
+    return results
+
+
+def bench_pantry(services, vocabulary, runs, page_size=9):
+    pantries = {
+        "3_common": vocabulary[:3],
+        "10_mixed": vocabulary[:5] + vocabulary[len(vocabulary) // 2:][:5],
+        "25_spread": vocabulary[::max(1, len(vocabulary) // 25)][:25],
+    }
+    results = {}
+    for label, pantry in pantries.items():
+        found = services.pantry.match(pantry)
+        results[label] = dict(timed(lambda i: services.pantry.match(pantry).page(0, page_size), runs),
+                              matches=found.total)
+    return results
+
+
+# A device pulling after `changes` favorite changes made on another device;
+# the cost should follow the number of changes, not the catalog size
+def bench_sync(services, runs, favorites=50):
+    names = services.recipes.names()
+    user = "bench_sync"
+    for name in names[:favorites]:
+        services.favorites.add(user, name)
+    device = LocalDevice(services.sync, user, "Bench Phone")
+    _, snapshot_ms = _once(device.sync)
+    results = {"snapshot_ms": snapshot_ms, "favorites": favorites}
+    toggled = set()
+    for changes in (0, 10, 1000):
+        samples = []
+        for i in range(runs):
+            for j in range(changes):
+                name = names[(i * changes + j) % len(names)]
+                if name in toggled:
+                    services.sync.push(user, "Bench Laptop", removed=[name])
+                    toggled.discard(name)
+                else:
+                    services.sync.push(user, "Bench Laptop", added=[name])
+                    toggled.add(name)
+            started = time.perf_counter()
+            device.sync()
+            samples.append(time.perf_counter() - started)
+        results[f"pull_after_{changes}_changes"] = _summary(samples)
+    return results
+
+
+# Picking up writes made by another process (a second Services over the
+# same data): refreshing after one and after 100 foreign writes, against a
+# full reload of the catalog
+def bench_refresh(services, data_dir, backend, runs):
+    other = Services(data_dir, backend)
+    recipe = services.recipes.get(services.recipes.names()[0])
+    results = {}
+    for writes in (1, 100):
+        samples = []
+        for i in range(runs):
+            for j in range(writes):
+                other.recipes.save(replace(recipe, name=f"Other Recipe {j}", instructions=f"Run {i}"))
+            started = time.perf_counter()
+            services.store.refresh_if_stale()
+            samples.append(time.perf_counter() - started)
+        results[f"refresh_after_{writes}_writes"] = _summary(samples)
+    _, results["full_reload_ms"] = _once(services.store.load)
+    other.images.shutdown()
+    other.store.storage.close()
+    return results
+
+
+def bench_stats(services, runs):
+    store = services.store
+    users = list(store.users)
+    rebuild = StatsIndex()
+    return {
+        "sidebar_stats": timed(lambda i: store.stats.get(users[i % len(users)]), runs),
+        "stats_rebuild": timed(lambda i: rebuild.build(store.recipes, store.favorites), 3),
+    }
+
+
+def bench_images(services, work_dir, megapixels, runs):
+    photo = os.path.join(work_dir, "photo.jpg")
+    make_photo(photo, megapixels)
+    blobs = services.blobs
+
+    def encode(i):
+        with open(photo, 'rb') as f:
+            ingest_image(f, blobs)
+
+    with open(photo, 'rb') as f:
+        digest = ingest_image(f, blobs)
+    legacy = base64.b64encode(blobs.get(digest)).decode()
+
+    def decode(i):
+        Image.open(io.BytesIO(blobs.load(digest))).load()
+
+    def decode_base64(i):
+        Image.open(io.BytesIO(base64.b64decode(legacy))).load()
+
+    def thumbnail_cold(i):
+        Thumbnailer(blobs, os.path.join(work_dir, f"thumbs-{i}"), cache_bytes=0).get(digest, 200)
+
+    warm = Thumbnailer(blobs, os.path.join(work_dir, THUMBNAIL_DIR))
+    warm.get(digest, 200)
+    return {
+        "image_encode": timed(encode, runs),
+        "image_decode": timed(decode, runs),
+        "image_decode_base64": timed(decode_base64, runs),
+        "thumbnail_cold": timed(thumbnail_cold, runs),
+        "thumbnail_cached": timed(lambda i: warm.get(digest, 200), runs * 10),
+    }
+
+
+def run(recipes=10000, backend="sqlite", runs=50, image_size=128, megapixels=12, seed=0):
+    work_dir = tempfile.mkdtemp(prefix="recipe-bench-")
+    try:
+        data_dir = os.path.join(work_dir, "data")
+        generated, generate_ms = _once(lambda: generate(data_dir, recipes, image_size=image_size, seed=seed))
+        vocabulary = generated.pop("vocabulary")
+        services, load = bench_load(data_dir, backend)
+        results = {"generate_ms": generate_ms, **load}
+        results["search"] = bench_search(services, vocabulary, runs)
+        results["pantry"] = bench_pantry(services, vocabulary, runs)
+        results["sync"] = bench_sync(services, max(1, runs // 2))
+        results["refresh"] = bench_refresh(services, data_dir, backend, max(1, runs // 5))
+        results.update(bench_stats(services, runs))
+        results.update(bench_saves(services, runs))
+        results.update(bench_images(services, work_dir, megapixels, max(1, runs // 10)))
+        return {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "params": {"recipes": recipes, "backend": backend, "runs": runs, "image_size": image_size,
+                       "megapixels": megapixels, "seed": seed},
+            "catalog": generated,
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe data layer benchmarks")
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--backend", choices=["sqlite", "json"], default="sqlite")
+    parser.add_argument("--runs", type=int, default=50, help="Repetitions per timed operation")
+    parser.add_argument("--image-size", type=int, default=128, help="Side of the generated recipe images")
+    parser.add_argument("--megapixels", type=float, default=12, help="Size of the photo used for image timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.recipes, args.backend, args.runs, args.image_size, args.megapixels, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import base64
+import bisect
+import datetime
+import io
+import itertools
+import json
+import os
+import random
+
+from PIL import Image
+
+from storage import FAVORITES_DATA_FILE, RECIPE_DATA_FILE, USER_DATA_FILE
+
+# Synthetic catalog generator.
+#
+# Writes user_data.json, recipe_data.json and favorites_data.json in the
+# original format (inline base64 PNG images included), so a generated
+# directory can be used as the app's data directory or fed to the benchmark
+# suite. Ingredients are drawn from a made-up vocabulary with a skewed
+# popularity, and favorites follow a heavy-tailed per-user distribution
+# over a skewed recipe popularity, like real usage.
+#
+#     python -m benchmarks.synthetic --recipes 100000 --out /tmp/catalog
+
+SYLLABLES = ["ba", "ko", "ri", "ma", "sel", "to", "nu", "vi", "pa", "gor", "li", "en", "da", "sho", "ter", "qui"]
+DISHES = ["Stew", "Salad", "Curry", "Soup", "Pie", "Bake", "Roast", "Pasta", "Bowl", "Tart", "Skillet", "Wrap"]
+ADJECTIVES = ["Spicy", "Creamy", "Smoky", "Quick", "Classic", "Crispy", "Herbed", "Golden", "Rustic", "Zesty"]
+
+
+def make_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize())
+    return sorted(words)
+
+
+def _zipf_cumulative(n, exponent=1.0):
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def _draw(rng, population, cumulative):
+    return population[bisect.bisect(cumulative, rng.random() * cumulative[-1])]
+
+
+def make_images(count, size, rng):
+    images = []
+    for i in range(count):
+        image = Image.effect_noise((size, size), 32 + i).convert("RGB")
+        image = Image.blend(image, Image.new("RGB", image.size, tuple(rng.randrange(256) for _ in range(3))), 0.6)
+        buf = io.BytesIO()
+        image.save(buf, format="PNG")
+        images.append(base64.b64encode(buf.getvalue()).decode())
+    return images
+
+
+def generate(out_dir, recipes=10000, min_ingredients=3, max_ingredients=12, vocabulary=2000,
+             users=100, favorites_mean=20, image_size=0, image_fraction=0.3,
+             ingredient_image_fraction=0.05, image_variants=8, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    words = make_vocabulary(vocabulary, rng)
+    word_weights = _zipf_cumulative(len(words))
+    # Generating every image would dominate the run; a few variants are reused
+    images = make_images(image_variants, image_size, rng) if image_size else []
+    usernames = [f"user{i}" for i in range(users)]
+    start = datetime.datetime(2020, 1, 1)
+
+    recipe_data = {}
+    for i in range(recipes):
+        count = rng.randint(min_ingredients, max_ingredients)
+        names = list(dict.fromkeys(_draw(rng, words, word_weights) for _ in range(count)))
+        ingredients = [
+            {"name": name, "image": rng.choice(images) if images and rng.random() < ingredient_image_fraction else None}
+            for name in names
+        ]
+        recipe_name = f"{rng.choice(ADJECTIVES)} {names[0]} {rng.choice(DISHES)} {i}"
+        recipe_data[recipe_name] = {
+            "ingredients": ingredients,
+            "instructions": "\n".join(f"{step}. Combine the {name.lower()}." for step, name in enumerate(names, 1)),
+            "image": rng.choice(images) if images and rng.random() < image_fraction else None,
+            "author": rng.choice(usernames),
+            "date_added": str(start + datetime.timedelta(seconds=rng.randrange(5 * 365 * 86400))),
+        }
+
+    recipe_names = list(recipe_data)
+    recipe_weights = _zipf_cumulative(len(recipe_names), 0.8)
+    favorites = {}
+    for username in usernames:
+        # Pareto-distributed counts: most users have a few, some have many
+        count = min(len(recipe_names), int(rng.paretovariate(1.5) * favorites_mean / 3))
+        picked = dict.fromkeys(_draw(rng, recipe_names, recipe_weights) for _ in range(count))
+        if picked:
+            favorites[username] = list(picked)
+
+    for filename, data in ((USER_DATA_FILE, {name: "password" for name in usernames}),
+                           (RECIPE_DATA_FILE, recipe_data),
+                           (FAVORITES_DATA_FILE, favorites)):
+        with open(os.path.join(out_dir, filename), 'w') as f:
+            json.dump(data, f)
+    return {
+        "recipes": len(recipe_data),
+        "users": len(usernames),
+        "favorites": sum(len(names) for names in favorites.values()),
+        "vocabulary": words,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic recipe catalog")
+    parser.add_argument("--out", required=True, help="Data directory to write")
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--min-ingredients", type=int, default=3)
+    parser.add_argument("--max-ingredients", type=int, default=12)
+    parser.add_argument("--vocabulary", type=int, default=2000, help="Distinct ingredient names")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--favorites-mean", type=float, default=20)
+    parser.add_argument("--image-size", type=int, default=0, help="Image side in pixels (0: no images)")
+    parser.add_argument("--image-fraction", type=float, default=0.3)
+    parser.add_argument("--ingredient-image-fraction", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    summary = generate(args.out, args.recipes, args.min_ingredients, args.max_ingredients, args.vocabulary,
+                       args.users, args.favorites_mean, args.image_size, args.image_fraction,
+                       args.ingredient_image_fraction, seed=args.seed)
+    summary.pop("vocabulary")
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from fileio import write_file
+from metrics import METRICS
+
+# Content-addressed image store.
+#
+# Every image is written once to <root>/<first two hex chars>/<sha256>, and
+# recipes only keep the 64-character digest. Identical uploads map to the
+# same file, so they are stored once. Older records still carry the image
+# inline as a base64 string; load() understands both, and
+# extract_inline_images() moves those strings into the store.
+
+BLOB_DIR = "blobs"
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_blob_ref(value):
+    return isinstance(value, str) and _DIGEST_RE.match(value) is not None
+
+
+@METRICS.timed("base64_decode")
+def decode_inline(ref, validate=False):
+    return base64.b64decode(ref, validate=validate)
+
+
+# File-like wrapper that hashes everything written through it
+class _HashingWriter:
+    def __init__(self, f):
+        self._f = f
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        self._f.flush()
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            write_file(path, data)
+        return digest
+
+    # Store content produced by write(f) without holding it in memory: it is
+    # hashed while being written to a temporary file, which is then renamed
+    # to its digest (or dropped if that content is already stored)
+    def put_stream(self, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer = _HashingWriter(f)
+                write(writer)
+                f.flush()
+                os.fsync(f.fileno())
+            digest = writer.hash.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, path)
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    # Image bytes for a recipe/ingredient "image" field: a digest, or a
+    # legacy inline base64 string
+    def load(self, ref):
+        if is_blob_ref(ref):
+            return self.get(ref)
+        return decode_inline(ref)
+
+
+def _extract(blobs, ref):
+    if ref and not is_blob_ref(ref):
+        try:
+            return blobs.put(decode_inline(ref, validate=True)), True
+        except (binascii.Error, ValueError):
+            pass
+    return ref, False
+
+
+# Move inline base64 images of the given recipes into the blob store and
+# return only the recipes that changed, with their images replaced by digests
+def extract_inline_images(recipes, blobs):
+    changed = {}
+    for name, recipe in recipes.items():
+        image, dirty = _extract(blobs, recipe.get("image"))
+        ingredients = []
+        for ing in recipe["ingredients"]:
+            ing_image, ing_dirty = _extract(blobs, ing.get("image"))
+            ingredients.append(dict(ing, image=ing_image) if ing_dirty else ing)
+            dirty = dirty or ing_dirty
+        if dirty:
+            changed[name] = dict(recipe, image=image, ingredients=ingredients)
+    return changed
+
+
+def main():
+    from changefeed import recipe_changes
+    from storage import open_storage
+
+    parser = argparse.ArgumentParser(description="Recipe image store tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Move inline base64 images out of the stored recipes")
+    migrate_parser.add_argument("--data-dir", default="data")
+    migrate_parser.add_argument("--backend", default=None, help="Storage backend (default: RECIPE_STORAGE or sqlite)")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        storage = open_storage(args.data_dir, args.backend)
+        blobs = BlobStore(os.path.join(args.data_dir, BLOB_DIR))
+        changed = extract_inline_images(storage.load_recipes(), blobs)
+        if changed:
+            storage.save_recipes(changed, changes=[change for name, recipe in changed.items()
+                                                   for change in recipe_changes(name, recipe.get("author"))])
+            storage.compact()
+        print(f"Moved images of {len(changed)} recipes into {blobs.root}")
+
+
+if __name__ == "__main__":
+    main()
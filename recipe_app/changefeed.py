@@ -0,0 +1,152 @@
+import os
+import time
+
+# Change feed for device sync.
+#
+# Every favorite change and recipe write is appended as one row with a
+# sequence number from SQLite's AUTOINCREMENT: numbers are never reused and,
+# since writers serialize on the database lock, a row only becomes visible
+# after every row with a smaller number. A device remembers the last number
+# it has seen (its cursor, stored here per user and device name) and asks for
+# the rows after it, so a sync reads the changes made since the previous one
+# and nothing else.
+#
+# Rows only name what changed (recipe, user, device that made the change);
+# the current data is read from the store when a device pulls. Each row is
+# addressed to one user, and a device only reads its user's rows: a
+# favorite change goes to the user who made it, a recipe write to its author
+# and to every user who has the recipe as a favorite.
+#
+# The storage backend owns the feed and writes the rows of a change together
+# with it (see storage.py): on SQLite they are in the same database and the
+# same transaction, so a write is never committed without its rows. The
+# JSON backend keeps them in FEED_FILE next to its documents and appends
+# them right after the operation log, under the same lock.
+#
+# Rows older than RETENTION_DAYS are pruned. A device whose cursor falls
+# before the pruned range gets a full snapshot instead of a delta.
+
+FEED_FILE = "sync.db"
+RETENTION_DAYS = float(os.environ.get("RECIPE_SYNC_RETENTION_DAYS", "30"))
+# Seconds between pruning passes
+PRUNE_INTERVAL = 3600
+
+# Change kinds
+RECIPE = "recipe"
+FAVORITE_ADDED = "favorite_added"
+FAVORITE_REMOVED = "favorite_removed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    username TEXT,
+    recipe TEXT NOT NULL,
+    device TEXT,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_user ON changes (username, seq);
+CREATE TABLE IF NOT EXISTS cursors (
+    username TEXT NOT NULL,
+    device TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (username, device)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('pruned_through', 0);
+"""
+
+
+# Feed entries for a write of one recipe, given its author before and after
+# the write (None for a new or deleted recipe)
+def recipe_changes(name, *authors):
+    authors = [author for author in dict.fromkeys(authors) if author is not None]
+    return [(RECIPE, author, name, None) for author in authors or [None]]
+
+
+class ChangeFeed:
+    def __init__(self, db, retention_days=RETENTION_DAYS):
+        # storage.SQLiteDatabase
+        self.db = db
+        self.retention = retention_days * 86400
+        self._pruned = 0.0
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        return self.db.conn()
+
+    # Rows for (kind, username, recipe, device) changes: recipe changes also
+    # go to favorited_by(recipe); changes for no user are dropped, and a user
+    # gets one row per change however many ways it concerns them
+    @staticmethod
+    def rows(changes, favorited_by):
+        rows = {}
+        for kind, username, recipe, device in changes:
+            users = [username]
+            if kind == RECIPE:
+                users.extend(favorited_by(recipe))
+            rows.update(dict.fromkeys((kind, user, recipe, device) for user in users if user is not None))
+        return list(rows)
+
+    # Write rows inside the caller's transaction
+    def insert(self, conn, rows):
+        now = time.time()
+        conn.executemany("INSERT INTO changes (kind, username, recipe, device, time) VALUES (?, ?, ?, ?, ?)",
+                         ((kind, username, recipe, device, now) for kind, username, recipe, device in rows))
+
+    def append(self, rows):
+        with self.db.transaction() as conn:
+            self.insert(conn, rows)
+
+    def prune_if_due(self):
+        if time.monotonic() - self._pruned >= PRUNE_INTERVAL:
+            self.prune()
+
+    def last_seq(self):
+        row = self._conn().execute("SELECT max(seq) FROM changes").fetchone()
+        return row[0] or self.pruned_through()
+
+    def pruned_through(self):
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'pruned_through'").fetchone()[0]
+
+    # The user's (seq, kind, recipe, device) rows after `since`, oldest first
+    def since(self, username, since):
+        return self._conn().execute(
+            "SELECT seq, kind, recipe, device FROM changes WHERE username = ? AND seq > ? ORDER BY seq",
+            (username, since)).fetchall()
+
+    def prune(self):
+        self._pruned = time.monotonic()
+        cutoff = time.time() - self.retention
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT max(seq) FROM changes WHERE time < ?", (cutoff,)).fetchone()
+            if row[0] is not None:
+                conn.execute("DELETE FROM changes WHERE seq <= ?", (row[0],))
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'pruned_through'", (row[0],))
+
+    # Cursors
+    def cursor(self, username, device):
+        row = self._conn().execute("SELECT seq FROM cursors WHERE username = ? AND device = ?",
+                                   (username, device)).fetchone()
+        return row[0] if row else None
+
+    # Move a device's cursor forward; never moves it back
+    def advance(self, username, device, seq):
+        with self.db.transaction() as conn:
+            conn.execute("INSERT INTO cursors (username, device, seq, synced_at) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT (username, device) DO UPDATE "
+                         "SET seq = max(seq, excluded.seq), synced_at = excluded.synced_at",
+                         (username, device, seq, time.time()))
+
+    # (device, seq, synced_at) of a user's devices, most recently synced first
+    def devices(self, username):
+        return self._conn().execute(
+            "SELECT device, seq, synced_at FROM cursors WHERE username = ? ORDER BY synced_at DESC",
+            (username,)).fetchall()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,166 @@
+import datetime
+import sys
+import threading
+from array import array
+
+from blobstore import is_blob_ref
+
+# Compact in-memory form of a recipe.
+#
+# The storage format (a dict with a list of {"name", "image"} dicts) costs
+# several hundred bytes per recipe before any of the actual text, most of it
+# in per-ingredient dicts and repeated keys. The DataStore instead keeps one
+# slotted CompactRecipe per recipe:
+#
+#   - ingredient names are interned in a process-wide IngredientDictionary
+#     and stored as an array of ids, so "Salt" is held once for the whole
+#     catalog;
+#   - ingredient images are a tuple aligned with the ids, or None when the
+#     recipe has no ingredient photos (the common case);
+#   - blob references are held as their 32 raw digest bytes rather than a
+#     64-character hex string;
+#   - date_added is parsed into integer microseconds since the epoch when it
+#     round-trips exactly; other values are kept as given;
+#   - authors are interned.
+#
+# to_dict() rebuilds the storage format, which is what the storage backends
+# and anything that writes still deal in.
+
+
+class IngredientDictionary:
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self._lock = threading.Lock()
+
+    def id(self, name):
+        ingredient_id = self.ids.get(name)
+        if ingredient_id is None:
+            with self._lock:
+                ingredient_id = self.ids.get(name)
+                if ingredient_id is None:
+                    ingredient_id = len(self.names)
+                    self.names.append(sys.intern(name))
+                    self.ids[self.names[-1]] = ingredient_id
+        return ingredient_id
+
+    def name(self, ingredient_id):
+        return self.names[ingredient_id]
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Ids are only meaningful inside one process and are never persisted
+INGREDIENTS = IngredientDictionary()
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def pack_image(value):
+    return bytes.fromhex(value) if is_blob_ref(value) else value
+
+
+def unpack_image(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def pack_date(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if parsed.tzinfo is not None or str(parsed) != value:
+        return value
+    return (parsed - _EPOCH) // _MICROSECOND
+
+
+def unpack_date(value):
+    return str(_EPOCH + value * _MICROSECOND) if isinstance(value, int) else value
+
+
+class CompactRecipe:
+    __slots__ = ("ingredient_ids", "ingredient_images", "instructions", "image", "author", "added")
+
+    def __init__(self, ingredient_ids, ingredient_images, instructions, image, author, added):
+        self.ingredient_ids = ingredient_ids
+        self.ingredient_images = ingredient_images
+        self.instructions = instructions
+        self.image = image
+        self.author = author
+        self.added = added
+
+    @classmethod
+    def from_dict(cls, data, dictionary=INGREDIENTS):
+        ingredients = data["ingredients"]
+        images = tuple(pack_image(ing.get("image")) for ing in ingredients)
+        author = data.get("author")
+        return cls(
+            array("I", [dictionary.id(ing["name"]) for ing in ingredients]),
+            images if any(image is not None for image in images) else None,
+            data.get("instructions"),
+            pack_image(data.get("image")),
+            sys.intern(author) if author else author,
+            pack_date(data.get("date_added")),
+        )
+
+    def to_dict(self, dictionary=INGREDIENTS):
+        return {
+            "ingredients": [{"name": name, "image": image} for name, image in self.ingredients(dictionary)],
+            "instructions": self.instructions,
+            "image": self.image_ref(),
+            "author": self.author,
+            "date_added": self.date_added(),
+        }
+
+    # (name, image) pairs, images as stored references
+    def ingredients(self, dictionary=INGREDIENTS):
+        names = dictionary.names
+        if self.ingredient_images is None:
+            return [(names[i], None) for i in self.ingredient_ids]
+        return [(names[i], unpack_image(image)) for i, image in zip(self.ingredient_ids, self.ingredient_images)]
+
+    def ingredient_names(self, dictionary=INGREDIENTS):
+        names = dictionary.names
+        return [names[i] for i in self.ingredient_ids]
+
+    def ingredient_image_count(self):
+        if self.ingredient_images is None:
+            return 0
+        return sum(1 for image in self.ingredient_images if image is not None)
+
+    def has_inline_images(self):
+        images = (self.image,) + (self.ingredient_images or ())
+        return any(isinstance(image, str) for image in images)
+
+    def image_ref(self):
+        return unpack_image(self.image)
+
+    def date_added(self):
+        return unpack_date(self.added)
+
+    # Seconds since the epoch for sorting; 0.0 when the date is unknown
+    def timestamp(self):
+        if isinstance(self.added, int):
+            return self.added / 1e6
+        try:
+            parsed = datetime.datetime.fromisoformat(self.added)
+        except (TypeError, ValueError):
+            return 0.0
+        if parsed.tzinfo is not None:
+            return parsed.timestamp()
+        return (parsed - _EPOCH).total_seconds()
+
+    def with_image(self, image):
+        return CompactRecipe(self.ingredient_ids, self.ingredient_images, self.instructions,
+                             pack_image(image), self.author, self.added)
+
+    def with_ingredient_image(self, index, image):
+        images = list(self.ingredient_images or (None,) * len(self.ingredient_ids))
+        images[index] = pack_image(image)
+        return CompactRecipe(self.ingredient_ids,
+                             tuple(images) if any(i is not None for i in images) else None,
+                             self.instructions, self.image, self.author, self.added)
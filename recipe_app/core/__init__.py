@@ -0,0 +1,13 @@
+# Headless core of the recipe app: plain Python services over the data
+# layer, used by the Streamlit pages, the benchmarks and the CLI tools.
+
+from core.cards import CardCache, RecipeCard
+from core.favorites import FavoritesService
+from core.images import ImageService
+from core.imports import ImportService
+from core.pantry import PantryResult, PantryService, split_ingredients
+from core.records import Ingredient, Recipe, RecipeMatch
+from core.repository import RecipeRepository, UserService
+from core.search import SORT_OPTIONS, SearchResult, SearchService
+from core.services import Services
+from core.sync import LocalDevice, SyncDelta, SyncService
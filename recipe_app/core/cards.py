@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import OrderedDict
+
+from core.records import Recipe
+from metrics import METRICS
+
+# Prepared recipe cards for the result grids.
+#
+# A RecipeCard holds what rendering a recipe needs beyond the record itself:
+# the ingredient list and instructions already formatted as markdown blocks,
+# and the image references to show with them. Cards are kept per recipe in
+# a bounded LRU cache shared by every session, so a rerun (turning a page,
+# removing one favorite, ...) only prepares the cards it has not shown
+# before. Image bytes are not part of a card: they come from the
+# Thumbnailer's LRU, which keeps them within its byte budget.
+#
+# The cache is registered with the DataStore like the indexes: update()
+# drops a recipe's card whenever the recipe is saved or gets an image, and
+# build() drops them all on a reload. Each card also remembers the stored
+# record it was made from; the store replaces records instead of mutating
+# them, so that record identifies the recipe version and a card made from
+# an older one is never handed out.
+
+MAX_CARDS = int(os.environ.get("RECIPE_CARD_CACHE", "2000"))
+
+
+class RecipeCard:
+    __slots__ = ("recipe", "blocks", "instructions", "_thumbnailer")
+
+    def __init__(self, recipe, thumbnailer):
+        self.recipe = recipe
+        # Ingredients as markdown runs, split where an ingredient has a
+        # photo: ("text", markdown) or ("image", ingredient name, ref)
+        self.blocks = []
+        lines = []
+        for ing in recipe.ingredients:
+            lines.append(f"• {ing.name}")
+            if ing.image:
+                self.blocks.append(("text", "  \n".join(lines)))
+                self.blocks.append(("image", ing.name, ing.image))
+                lines = []
+        if lines:
+            self.blocks.append(("text", "  \n".join(lines)))
+        self.instructions = recipe.instructions
+        self._thumbnailer = thumbnailer
+
+    @property
+    def name(self):
+        return self.recipe.name
+
+    # Thumbnail bytes of one of the card's images, or None if it cannot be
+    # loaded right now
+    def thumbnail(self, ref, width):
+        try:
+            return self._thumbnailer.get(ref, width)
+        except Exception:
+            return None
+
+
+class CardCache:
+    def __init__(self, thumbnailer, max_cards=MAX_CARDS):
+        self.thumbnailer = thumbnailer
+        # The store's recipes, as handed to build()
+        self.recipes = {}
+        self.max_cards = max_cards
+        # name -> (stored record, card)
+        self.cards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, recipes, version=None):
+        with self._lock:
+            self.recipes = recipes
+            self.cards.clear()
+
+    def update(self, name, old, new):
+        with self._lock:
+            self.cards.pop(name, None)
+
+    # Card for a recipe, or None if it no longer exists
+    def get(self, name):
+        compact = self.recipes.get(name)
+        if compact is None:
+            return None
+        with self._lock:
+            entry = self.cards.get(name)
+            if entry is not None and entry[0] is compact:
+                self.cards.move_to_end(name)
+                METRICS.count("card_cache_hit")
+                return entry[1]
+
+        METRICS.count("card_cache_miss")
+        card = RecipeCard(Recipe.from_compact(name, compact), self.thumbnailer)
+        with self._lock:
+            # Only keep it if the recipe was not written in the meantime
+            if self.recipes.get(name) is compact:
+                self.cards[name] = (compact, card)
+                self.cards.move_to_end(name)
+                while len(self.cards) > self.max_cards:
+                    self.cards.popitem(last=False)
+        return card
+
+    def __len__(self):
+        return len(self.cards)
@@ -0,0 +1,21 @@
+# A user's favorite recipes. Favorites may name recipes that have since been
+# removed; those are left out of everything returned here.
+
+
+class FavoritesService:
+    def __init__(self, store):
+        self.store = store
+
+    def names(self, username):
+        recipes = self.store.recipes
+        return [name for name in self.store.get_favorites(username) if name in recipes]
+
+    def count(self, username):
+        return len(self.names(username))
+
+    # Both return False when there was nothing to change
+    def add(self, username, recipe_name):
+        return self.store.add_favorite(username, recipe_name)
+
+    def remove(self, username, recipe_name):
+        return self.store.remove_favorite(username, recipe_name)
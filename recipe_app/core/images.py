@@ -0,0 +1,55 @@
+from workers import DONE, PENDING, ImageJobQueue
+
+# Recipe and ingredient images: thumbnails for display and background
+# processing of uploads (see workers.py), with the results attached to
+# recipes through the repository.
+
+
+class ImageService:
+    def __init__(self, blobs, thumbnailer, repository, spool_dir):
+        self.blobs = blobs
+        self.thumbnailer = thumbnailer
+        self.repository = repository
+        self.spool_dir = spool_dir
+        self._jobs = None
+
+    @property
+    def jobs(self):
+        # The worker pool is only started once something is uploaded
+        if self._jobs is None:
+            self._jobs = ImageJobQueue(self.blobs, self.thumbnailer, self.spool_dir)
+        return self._jobs
+
+    def thumbnail(self, ref, width):
+        return self.thumbnailer.get(ref, width)
+
+    # Queue an uploaded file for processing; returns the job id (raises
+    # workers.QueueFull when too many uploads are waiting)
+    def submit(self, fileobj):
+        return self.jobs.submit(fileobj)
+
+    def job(self, job_id):
+        return self.jobs.get(job_id)
+
+    # The stored image of a finished job, None while it is still running
+    def result(self, job_id):
+        job = self.job(job_id)
+        return job.digest if job is not None and job.status == DONE else None
+
+    def is_pending(self, job_id):
+        job = self.job(job_id)
+        return job is not None and job.status == PENDING
+
+    # Attach a job's image once it is ready (right away if it already is).
+    # Returns the job's status: PENDING or DONE, FAILED if it will never be
+    # attached, or None if the job is no longer known.
+    def attach_to_recipe(self, job_id, recipe_name):
+        return self.jobs.when_done(job_id, lambda digest: self.repository.set_image(recipe_name, digest))
+
+    def attach_to_ingredient(self, job_id, recipe_name, ingredient_name):
+        return self.jobs.when_done(
+            job_id, lambda digest: self.repository.set_ingredient_image(recipe_name, ingredient_name, digest))
+
+    def shutdown(self):
+        if self._jobs is not None:
+            self._jobs.shutdown()
@@ -0,0 +1,18 @@
+from importer import BATCH_SIZE, detect_format, import_recipes
+
+# Bulk imports made by a user of the app. The recipes are attributed to that
+# user and only their own recipes are ever replaced; the command line
+# importer (importer.py) is the way to load files on anyone else's behalf.
+
+
+class ImportService:
+    def __init__(self, store, blobs):
+        self.store = store
+        self.blobs = blobs
+
+    # Import an uploaded file, its format taken from `filename`; returns an
+    # ImportResult. Raises ValueError for a file that cannot be read.
+    # progress(result) is called after every committed batch.
+    def import_file(self, username, source, filename, replace=False, progress=None, batch_size=BATCH_SIZE):
+        return import_recipes(self.store, source, detect_format(filename), batch_size, username, replace,
+                              self.blobs, progress, owner=username)
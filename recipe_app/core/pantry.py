@@ -0,0 +1,52 @@
+import re
+
+from core.records import Recipe, RecipeMatch
+from ingredient_index import ingredient_key
+from metrics import METRICS
+
+# "What can I cook": recipes ranked by how much of them the ingredients at
+# hand cover (see ingredient_index.py).
+
+
+# Ingredient names typed as a list separated by commas, semicolons or lines
+def split_ingredients(text):
+    return [name.strip() for name in re.split(r"[,;\n]", text or "") if name.strip()]
+
+
+class PantryResult:
+    __slots__ = ("recipes", "matches", "pantry", "unknown", "total")
+
+    def __init__(self, recipes, matches, pantry, unknown):
+        self.recipes = recipes
+        self.matches = matches
+        self.pantry = pantry
+        # Ingredients no recipe uses
+        self.unknown = unknown
+        self.total = matches.total
+
+    def page(self, start=0, stop=None):
+        results = []
+        for name, have, required in self.matches.select(start, stop):
+            compact = self.recipes.get(name)
+            if compact is None:
+                continue
+            recipe = Recipe.from_compact(name, compact)
+            missing = tuple(dict.fromkeys(ing.name for ing in recipe.ingredients
+                                          if ingredient_key(ing.name) not in self.pantry))
+            results.append(RecipeMatch(recipe, have, required, missing))
+        return results
+
+
+class PantryService:
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    # Recipes using any of `ingredients`, best coverage first; max_missing
+    # leaves out recipes needing more than that many other ingredients
+    def match(self, ingredients, max_missing=None):
+        with METRICS.timer("pantry_match"):
+            matches = self.index.match(ingredients, max_missing)
+        pantry = {ingredient_key(name) for name in ingredients}
+        unknown = [name for name in ingredients if not self.index.known(name)]
+        return PantryResult(self.store.recipes, matches, pantry, unknown)
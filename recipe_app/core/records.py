@@ -0,0 +1,80 @@
+from dataclasses import dataclass, replace
+
+# Typed records handed out by the core services.
+#
+# Records are immutable: a change produces a new record (see with_image()),
+# which matches how the DataStore replaces stored recipes rather than
+# mutating them. to_dict()/from_dict() convert to and from the storage
+# format, where the recipe name is the key rather than a field;
+# from_compact() builds a record from the DataStore's in-memory form.
+
+
+@dataclass(frozen=True, slots=True)
+class Ingredient:
+    name: str
+    image: str | None = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data.get("image"))
+
+    def to_dict(self):
+        return {"name": self.name, "image": self.image}
+
+
+@dataclass(frozen=True, slots=True)
+class Recipe:
+    name: str
+    ingredients: tuple[Ingredient, ...]
+    instructions: str = ""
+    image: str | None = None
+    author: str | None = None
+    date_added: str | None = None
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(
+            name,
+            tuple(Ingredient.from_dict(ing) for ing in data["ingredients"]),
+            data.get("instructions") or "",
+            data.get("image"),
+            data.get("author"),
+            data.get("date_added"),
+        )
+
+    @classmethod
+    def from_compact(cls, name, compact):
+        return cls(
+            name,
+            tuple(Ingredient(ing_name, image) for ing_name, image in compact.ingredients()),
+            compact.instructions or "",
+            compact.image_ref(),
+            compact.author,
+            compact.date_added(),
+        )
+
+    def to_dict(self):
+        return {
+            "ingredients": [ing.to_dict() for ing in self.ingredients],
+            "instructions": self.instructions,
+            "image": self.image,
+            "author": self.author,
+            "date_added": self.date_added,
+        }
+
+    def with_image(self, image):
+        return replace(self, image=image)
+
+
+# A recipe found from the ingredients at hand: `have` of its `required`
+# ingredients are covered, the names in `missing` are not
+@dataclass(frozen=True, slots=True)
+class RecipeMatch:
+    recipe: Recipe
+    have: int
+    required: int
+    missing: tuple[str, ...] = ()
+
+    @property
+    def coverage(self):
+        return self.have / self.required if self.required else 0.0
@@ -0,0 +1,102 @@
+import datetime
+
+from core.records import Recipe
+
+# Recipe and user records on top of the shared DataStore.
+#
+# The store keeps recipes in a compact form (see compact.py) and takes writes
+# in the storage format; the repository converts between those and Recipe
+# records, so callers never see either.
+
+
+def sample_recipes():
+    now = str(datetime.datetime.now())
+    return {
+        "Pasta Carbonara": {
+            "ingredients": [
+                {"name": "Pasta", "image": None},
+                {"name": "Eggs", "image": None},
+                {"name": "Cheese", "image": None},
+                {"name": "Bacon", "image": None}
+            ],
+            "instructions": "1. Boil pasta\n2. Cook bacon\n3. Mix eggs and cheese\n4. Combine all ingredients",
+            "image": None,
+            "author": "system",
+            "date_added": now
+        },
+        "Chicken Curry": {
+            "ingredients": [
+                {"name": "Chicken", "image": None},
+                {"name": "Curry Paste", "image": None},
+                {"name": "Coconut Milk", "image": None},
+                {"name": "Rice", "image": None}
+            ],
+            "instructions": "1. Cook chicken\n2. Add curry paste\n3. Pour coconut milk\n4. Simmer and serve with rice",
+            "image": None,
+            "author": "system",
+            "date_added": now
+        }
+    }
+
+
+class RecipeRepository:
+    def __init__(self, store):
+        self.store = store
+
+    # Pick up other processes' writes and make sure there is something to show
+    def load(self):
+        store = self.store
+        store.refresh_if_stale()
+        if not store.users:
+            store.save_user("demo", "password")
+        if not store.recipes:
+            store.save_recipes(sample_recipes())
+
+    def __len__(self):
+        return len(self.store.recipes)
+
+    def __contains__(self, name):
+        return name in self.store.recipes
+
+    def names(self):
+        return list(self.store.recipes)
+
+    def get(self, name):
+        compact = self.store.recipes.get(name)
+        return Recipe.from_compact(name, compact) if compact is not None else None
+
+    def save(self, recipe):
+        self.store.save_recipe(recipe.name, recipe.to_dict())
+
+    # The existing recipe a new one named `name` would share its link with
+    # (same name up to case and spacing); None if the name is free
+    def name_conflict(self, name):
+        return self.store.slug_conflict(name)
+
+    # Attach an image to a recipe; False if the recipe no longer exists
+    def set_image(self, recipe_name, image):
+        return self.store.set_recipe_image(recipe_name, image)
+
+    # Attach an image to an ingredient, found by name since the recipe may
+    # have changed since the caller looked at it; False if it is gone
+    def set_ingredient_image(self, recipe_name, ingredient_name, image):
+        return self.store.set_ingredient_image_by_name(recipe_name, ingredient_name, image)
+
+
+class UserService:
+    def __init__(self, store):
+        self.store = store
+
+    def authenticate(self, username, password):
+        return username in self.store.users and self.store.users[username] == password
+
+    # Create an account; False if the name is taken
+    def register(self, username, password):
+        if username in self.store.users:
+            return False
+        self.store.save_user(username, password)
+        return True
+
+    # Per-user counts (UserStats), maintained by the store on every write
+    def stats(self, username):
+        return self.store.stats.get(username)
@@ -0,0 +1,100 @@
+from core.records import Recipe
+from metrics import METRICS
+
+# Recipe search: the name/ingredient index narrows the catalog down to the
+# matching names, and a presorted ordering (see sort_index.py) yields just
+# the requested page of them.
+#
+# Search is typo-tolerant: "Best Match" lists the exact (substring) matches
+# first and then the recipes whose words are merely similar to the query
+# (see SearchIndex.fuzzy()), most similar first. The other orders show the
+# exact matches, or the similar ones when there are no exact matches.
+
+SORT_OPTIONS = {
+    "Best Match": ("score", False),
+    "Name (A-Z)": ("name", False),
+    "Name (Z-A)": ("name", True),
+    "Newest First": ("date", True),
+    "Oldest First": ("date", False),
+}
+
+
+# Ordering for "Best Match": exact matches in name order, then similar
+# recipes by descending similarity. Same select() as SortedIndex.
+class RankedOrdering:
+    __slots__ = ("exact", "names", "ranked")
+
+    def __init__(self, exact, names, scores):
+        self.exact = exact
+        self.names = names
+        self.ranked = [name for _, name in sorted((-score, name) for name, score in scores.items()
+                                                  if name not in exact)]
+
+    def __len__(self):
+        return len(self.exact) + len(self.ranked)
+
+    def select(self, matches=None, start=0, stop=None, reverse=False):
+        stop = len(self) if stop is None else min(stop, len(self))
+        exact = len(self.exact)
+        names = self.names.select(self.exact, start, min(stop, exact)) if start < exact else []
+        return names + self.ranked[max(0, start - exact):max(0, stop - exact)]
+
+
+class SearchResult:
+    __slots__ = ("recipes", "ordering", "matches", "reverse", "exact", "scores", "total")
+
+    def __init__(self, recipes, ordering, matches, reverse, exact=None, scores=None):
+        self.recipes = recipes
+        self.ordering = ordering
+        self.matches = matches
+        self.reverse = reverse
+        # Names matching the query exactly (None when there was no query)
+        # and similarity of the fuzzy matches, when they were looked up
+        self.exact = exact
+        self.scores = scores
+        self.total = len(ordering) if matches is None else len(matches)
+
+    # 1.0 for exact matches, the similarity for fuzzy ones
+    def score(self, name):
+        if self.exact is None or name in self.exact:
+            return 1.0
+        return self.scores.get(name, 0.0) if self.scores else 0.0
+
+    # Recipes from start to stop; only this slice is taken from the
+    # presorted ordering
+    def page(self, start=0, stop=None):
+        with METRICS.timer("search_sort"):
+            names = self.ordering.select(self.matches, start, stop, self.reverse)
+        results = []
+        for name in names:
+            compact = self.recipes.get(name)
+            if compact is not None:
+                results.append(Recipe.from_compact(name, compact))
+        return results
+
+
+class SearchService:
+    def __init__(self, store, index, orderings):
+        self.store = store
+        self.index = index
+        self.orderings = orderings
+
+    # Recipes matching `term` (all when empty) in the given sort order
+    def search(self, term, sort_option):
+        ordering, reverse = SORT_OPTIONS[sort_option]
+        if not term:
+            # Nothing to rank by without a query
+            ordering = "name" if ordering == "score" else ordering
+            return SearchResult(self.store.recipes, self.orderings[ordering], None, reverse)
+
+        with METRICS.timer("search_filter"):
+            matches = self.index.search(term)
+        scores = None
+        if ordering == "score" or not matches:
+            with METRICS.timer("search_fuzzy"):
+                scores = self.index.fuzzy(term)
+        if ordering == "score":
+            return SearchResult(self.store.recipes, RankedOrdering(matches, self.orderings["name"], scores),
+                                None, False, matches, scores)
+        return SearchResult(self.store.recipes, self.orderings[ordering], matches or set(scores), reverse,
+                            matches, scores)
@@ -0,0 +1,70 @@
+import os
+
+from blobstore import BLOB_DIR, BlobStore, extract_inline_images
+from core.cards import CardCache
+from core.favorites import FavoritesService
+from core.images import ImageService
+from core.imports import ImportService
+from core.pantry import PantryService
+from core.repository import RecipeRepository, UserService
+from core.search import SearchService
+from core.sync import SyncService
+from datastore import DataStore
+from ingredient_index import IngredientIndex
+from search_index import INDEX_FILE, SearchIndex
+from share_server import start_share_server
+from sort_index import SortedIndex, date_key, name_key
+from storage import open_storage
+from thumbnails import THUMBNAIL_DIR, Thumbnailer
+from workers import UPLOAD_DIR
+
+# Everything the app needs, wired up over one data directory: the shared
+# DataStore with its search, sort and ingredient indexes, the blob store and
+# thumbnails, the prepared recipe cards, the change feed for device sync, and
+# the services built on them, plus the share server over the same data.
+# app.py keeps one Services per process; benchmarks and CLI tools create
+# their own.
+
+
+class Services:
+    def __init__(self, data_dir, backend=None):
+        self.data_dir = data_dir
+        self.blobs = BlobStore(os.path.join(data_dir, BLOB_DIR))
+        self.thumbnailer = Thumbnailer(self.blobs, os.path.join(data_dir, THUMBNAIL_DIR))
+
+        search_index = SearchIndex(os.path.join(data_dir, INDEX_FILE))
+        orderings = {"name": SortedIndex(name_key), "date": SortedIndex(date_key)}
+        ingredient_index = IngredientIndex()
+        self.cards = CardCache(self.thumbnailer)
+        self.store = DataStore(open_storage(data_dir, backend),
+                               indexes=[search_index, orderings["name"], orderings["date"], ingredient_index,
+                                        self.cards])
+        # Move any inline base64 images left from older versions into the blob store
+        inline = {name: recipe.to_dict() for name, recipe in self.store.recipes.items()
+                  if recipe.has_inline_images()}
+        migrated = extract_inline_images(inline, self.blobs)
+        if migrated:
+            self.store.save_recipes(migrated)
+            # Drop the old base64 strings from disk now rather than at the
+            # next compaction, which a small catalog may not reach for a long
+            # time; they would be parsed again on every start until then
+            self.store.compact()
+
+        self.users = UserService(self.store)
+        self.recipes = RecipeRepository(self.store)
+        self.search = SearchService(self.store, search_index, orderings)
+        self.favorites = FavoritesService(self.store)
+        self.pantry = PantryService(self.store, ingredient_index)
+        self.sync = SyncService(self.store, self.store.storage.feed, self.blobs)
+        self.images = ImageService(self.blobs, self.thumbnailer, self.recipes,
+                                   os.path.join(data_dir, UPLOAD_DIR))
+        self.imports = ImportService(self.store, self.blobs)
+
+    # Serve shared links and exports over HTTP (see share_server.py); None if
+    # the port is taken
+    def start_share_server(self, secret):
+        return start_share_server(self.store.storage, self.blobs, secret)
+
+    def close(self):
+        self.images.shutdown()
+        self.store.persist()
@@ -0,0 +1,191 @@
+from changefeed import FAVORITE_ADDED, FAVORITE_REMOVED, RECIPE
+from metrics import METRICS
+
+# Favorites sync between a user's devices, over the change feed (see
+# changefeed.py).
+#
+# A device pushes the favorites it changed locally, pulls the changes made
+# since its cursor and acknowledges the sequence number it got up to. A pull
+# reads only the feed rows after the cursor: favorites are collapsed to the
+# last change per recipe (leaving out those made by the pulling device
+# itself, which it already has), and the recipes involved are sent in the
+# storage format with their images as references, to be fetched one by one
+# with image() when the device needs them. New devices, and devices whose
+# cursor is older than what the feed still holds, get a full snapshot.
+#
+# The sync options only filter what is sent; a device that turns one on
+# later does not get the older changes it skipped.
+
+
+class SyncDelta:
+    __slots__ = ("since", "until", "full", "favorites", "added", "removed", "recipes", "deleted", "images",
+                 "changes")
+
+    def __init__(self, since, until, full=False):
+        # Cursor the delta starts after (None for a snapshot) and the one to
+        # acknowledge once it is applied
+        self.since = since
+        self.until = until
+        self.full = full
+        # All of the user's favorites, for a snapshot
+        self.favorites = []
+        self.added = []
+        self.removed = []
+        # name -> recipe dict, images as references
+        self.recipes = {}
+        self.deleted = []
+        # Image references of the sent recipes, for the enabled image options
+        self.images = []
+        # Feed rows read
+        self.changes = 0
+
+    def is_empty(self):
+        return not (self.full or self.added or self.removed or self.recipes or self.deleted)
+
+
+class SyncService:
+    def __init__(self, store, feed, blobs):
+        self.store = store
+        self.feed = feed
+        self.blobs = blobs
+
+    # Apply a device's local favorite changes; returns how many changed
+    # anything
+    @METRICS.timed("sync_push")
+    def push(self, username, device, added=(), removed=()):
+        changed = 0
+        for name in added:
+            changed += self.store.add_favorite(username, name, device=device)
+        for name in removed:
+            changed += self.store.remove_favorite(username, name, device=device)
+        return changed
+
+    @METRICS.timed("sync_pull")
+    def pull(self, username, device, favorites=True, authored=False, recipe_images=True,
+             ingredient_images=True):
+        cursor = self.feed.cursor(username, device)
+        if cursor is None or cursor < self.feed.pruned_through():
+            delta = SyncDelta(None, self.feed.last_seq(), full=True)
+            # Rows appended from here on are for the next pull
+            self.store.refresh_if_stale()
+            wanted = []
+            if favorites:
+                delta.favorites = list(self.store.get_favorites(username))
+                wanted.extend(delta.favorites)
+            if authored:
+                wanted.extend(self.store.recipes_by(username))
+        else:
+            rows = self.feed.since(username, cursor)
+            delta = SyncDelta(cursor, rows[-1][0] if rows else cursor)
+            delta.changes = len(rows)
+            METRICS.count("sync_changes", len(rows))
+            self.store.refresh_if_stale()
+
+            last = {}
+            written = {}
+            for seq, kind, name, origin in rows:
+                if kind == RECIPE:
+                    written[name] = None
+                else:
+                    last[name] = (kind, origin)
+            current = set(self.store.get_favorites(username))
+            wanted = []
+            if favorites:
+                for name, (kind, origin) in last.items():
+                    if origin == device:
+                        continue
+                    if kind == FAVORITE_ADDED:
+                        delta.added.append(name)
+                    elif kind == FAVORITE_REMOVED:
+                        delta.removed.append(name)
+                wanted.extend(delta.added)
+                wanted.extend(name for name in written if name in current)
+            if authored:
+                wanted.extend(name for name in written
+                              if name in self.store.recipes and self.store.recipes[name].author == username)
+            delta.deleted = [name for name in written if name not in self.store.recipes]
+
+        for name in dict.fromkeys(wanted):
+            recipe = self.store.recipes.get(name)
+            if recipe is None:
+                continue
+            delta.recipes[name] = recipe.to_dict()
+            if recipe_images and recipe.image is not None:
+                delta.images.append(recipe.image_ref())
+            if ingredient_images:
+                delta.images.extend(image for _, image in recipe.ingredients() if image)
+        delta.images = list(dict.fromkeys(delta.images))
+        return delta
+
+    # Record that a device has applied everything up to `seq`
+    def ack(self, username, device, seq):
+        self.feed.advance(username, device, seq)
+
+    # Image bytes for a reference from a delta
+    def image(self, ref):
+        METRICS.count("sync_image_fetch")
+        return self.blobs.load(ref)
+
+    # (device, cursor, synced_at) of the user's devices
+    def devices(self, username):
+        return self.feed.devices(username)
+
+    # When any of the user's devices last synced, or None
+    def last_sync(self, username):
+        devices = self.devices(username)
+        return devices[0][2] if devices else None
+
+
+# In-process stand-in for a remote device: a local replica of one user's
+# favorites and recipes that syncs through a SyncService the way a client
+# would over the network. Images are only fetched when image() asks for
+# them. Used by the sync benchmark.
+class LocalDevice:
+    def __init__(self, service, username, name, **options):
+        self.service = service
+        self.username = username
+        self.name = name
+        self.options = options
+        self.favorites = []
+        self.recipes = {}
+        self.images = {}
+        # recipe -> True (added) / False (removed) since the last sync
+        self.pending = {}
+
+    def add_favorite(self, name):
+        if name not in self.favorites:
+            self.favorites.append(name)
+            self.pending[name] = True
+
+    def remove_favorite(self, name):
+        if name in self.favorites:
+            self.favorites.remove(name)
+            self.pending[name] = False
+
+    def sync(self):
+        self.service.push(self.username, self.name,
+                          added=[name for name, added in self.pending.items() if added],
+                          removed=[name for name, added in self.pending.items() if not added])
+        self.pending = {}
+        delta = self.service.pull(self.username, self.name, **self.options)
+        self.apply(delta)
+        self.service.ack(self.username, self.name, delta.until)
+        return delta
+
+    def apply(self, delta):
+        if delta.full:
+            self.favorites = list(delta.favorites)
+            self.recipes = dict(delta.recipes)
+            return
+        removed = set(delta.removed)
+        self.favorites = [name for name in self.favorites if name not in removed]
+        self.favorites.extend(name for name in delta.added if name not in self.favorites)
+        self.recipes.update(delta.recipes)
+        for name in delta.deleted:
+            self.recipes.pop(name, None)
+
+    def image(self, ref):
+        data = self.images.get(ref)
+        if data is None:
+            data = self.images[ref] = self.service.image(ref)
+        return data
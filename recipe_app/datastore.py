@@ -0,0 +1,272 @@
+import threading
+
+from changefeed import FAVORITE_ADDED, FAVORITE_REMOVED, recipe_changes
+from compact import CompactRecipe
+from metrics import METRICS
+from stats import StatsIndex
+from storage import SlugMap
+
+# Changed entries above which a refresh reloads everything instead of
+# catching up: CATCH_UP_LIMIT or a CATCH_UP_FRACTION-th of the catalog,
+# whichever is more
+CATCH_UP_LIMIT = 1000
+CATCH_UP_FRACTION = 10
+
+# Process-wide in-memory copy of the users, recipes and favorites.
+#
+# One DataStore is shared by every Streamlit session (see core/services.py),
+# so memory scales with the catalog rather than with the number of
+# connected users. All writes go through the store: it updates its own copy
+# and persists the changed row through the storage backend. Changes made by
+# other processes are picked up by refresh_if_stale(), which compares the
+# backend's version token with the one seen at the last load.
+#
+# Writes are checked optimistically: the backend reports which version each
+# write was applied on top of, and if that is not the version this store last
+# saw, another writer got in between. The next refresh then picks up the
+# other writer's rows alongside its own.
+#
+# A refresh does not reload the catalog: the backend reports what was
+# written since the version last seen (see Storage.changes_since) and only
+# those users, recipes and favorites lists are read again and passed to the
+# indexes, so a write made by another process costs about as much as one
+# made here. The store falls back to a full load when the backend cannot
+# tell (the JSON log was compacted, the SQLite write history pruned) or when
+# so much changed that a load is cheaper.
+#
+# Recipes are held as CompactRecipe records (see compact.py) rather than in
+# the storage format; writers take and storage gets the usual dicts.
+# Readers must treat everything as read-only. Writers replace recipe records
+# instead of mutating them, so a record handed to a reader never changes
+# underneath it.
+#
+# Indexes over the recipes (search, sort orders, ...) are registered with the
+# store and kept in step with it: build(recipes, version) after every load and
+# update(name, old, new) for every recipe write. Indexes that can persist
+# themselves expose save(version) and a dirty flag.
+#
+# Per-user counts (see stats.py) are maintained the same way, but also
+# follow favorite changes, so they live on the store itself as `stats`. So
+# do the recipes' link slugs, as `slugs`.
+#
+# Every recipe write and favorite change hands the storage backend the change
+# feed entries describing it (see changefeed.py), which it publishes along
+# with the write, for device sync. Favorite changes can name the device they
+# came from.
+#
+# Loads and every write are timed (see metrics.py).
+class DataStore:
+    def __init__(self, storage, indexes=()):
+        self.storage = storage
+        self.indexes = list(indexes)
+        self.users = {}
+        self.recipes = {}
+        self.favorites = {}
+        self.stats = StatsIndex()
+        self.slugs = SlugMap()
+        self._seen = None
+        self._lock = threading.RLock()
+        self.load()
+
+    @METRICS.timed("store_load")
+    def load(self):
+        with self._lock:
+            seen = self.storage.version()
+            self.users = self.storage.load_users()
+            self.recipes = {name: CompactRecipe.from_dict(recipe)
+                            for name, recipe in self.storage.iter_recipes()}
+            self.favorites = self.storage.load_favorites()
+            self._seen = seen
+            self.stats.build(self.recipes, self.favorites)
+            self.slugs = SlugMap(self.recipes)
+            for index in self.indexes:
+                index.build(self.recipes, seen)
+
+    def refresh_if_stale(self):
+        if self.storage.version() != self._seen:
+            with self._lock:
+                if self.storage.version() != self._seen:
+                    if not self._catch_up():
+                        self.load()
+                    return True
+        return False
+
+    # Apply what was written since the version last seen, re-reading only
+    # the users, recipes and favorites lists involved; False if the backend
+    # cannot tell what changed or it is too much to be worth it
+    @METRICS.timed("store_catch_up")
+    def _catch_up(self):
+        limit = max(CATCH_UP_LIMIT, len(self.recipes) // CATCH_UP_FRACTION)
+        changes = self.storage.changes_since(self._seen, limit)
+        if changes is None:
+            return False
+        version, users, recipes, favorites = changes
+        for username, password in users.items():
+            if password is None:
+                self.users.pop(username, None)
+            else:
+                self.users[username] = password
+        for name, recipe in recipes.items():
+            self._recipe_written(name, self.recipes.get(name),
+                                 CompactRecipe.from_dict(recipe) if recipe is not None else None)
+        for username, names in favorites.items():
+            old = self.favorites.pop(username, [])
+            if names:
+                self.favorites[username] = names
+            self.stats.favorites_changed(username, len(names) - len(old))
+        self._seen = version
+        return True
+
+    def _written(self, versions):
+        before, after = versions
+        # Otherwise another process wrote in between: keep the version last
+        # seen, so the next refresh catches up on its writes (and re-reads
+        # this one, which changes nothing)
+        if before == self._seen:
+            self._seen = after
+
+    def _recipe_written(self, name, old, new):
+        if new is None:
+            self.recipes.pop(name, None)
+            self.slugs.discard(name)
+        else:
+            self.recipes[name] = new
+            self.slugs.add(name)
+        self.stats.recipe_changed(old, new)
+        for index in self.indexes:
+            index.update(name, old, new)
+
+    @staticmethod
+    def _recipe_changes(name, old, new):
+        return recipe_changes(name, old.author if old is not None else None, new.author if new is not None else None)
+
+    # Compact the backend's files (see Storage.compact); the data stays the
+    # same, so the store does not reload unless another process wrote too
+    def compact(self):
+        with self._lock:
+            self._written(self.storage.compact())
+
+    # Write indexes that changed since they were last saved
+    def persist(self):
+        with self._lock:
+            if self._seen is None:
+                return
+            for index in self.indexes:
+                if getattr(index, "dirty", False):
+                    index.save(self._seen)
+
+    # Users
+    @METRICS.timed("save_user")
+    def save_user(self, username, password):
+        with self._lock:
+            versions = self.storage.save_user(username, password)
+            self.users[username] = password
+            self._written(versions)
+
+    # Recipes
+    @METRICS.timed("save_recipe")
+    def save_recipe(self, name, recipe):
+        with self._lock:
+            old = self.recipes.get(name)
+            new = CompactRecipe.from_dict(recipe)
+            versions = self.storage.save_recipe(name, recipe, changes=self._recipe_changes(name, old, new))
+            self._recipe_written(name, old, new)
+            self._written(versions)
+
+    @METRICS.timed("save_recipes")
+    def save_recipes(self, recipes):
+        with self._lock:
+            written = {name: (self.recipes.get(name), CompactRecipe.from_dict(recipe))
+                       for name, recipe in recipes.items()}
+            changes = [change for name, (old, new) in written.items()
+                       for change in self._recipe_changes(name, old, new)]
+            versions = self.storage.save_recipes(recipes, changes=changes)
+            for name, (old, new) in written.items():
+                self._recipe_written(name, old, new)
+            self._written(versions)
+
+    # Attach an image to an existing recipe (e.g. once a background upload
+    # job finishes); returns False if the recipe no longer exists
+    @METRICS.timed("set_recipe_image")
+    def set_recipe_image(self, recipe_name, image):
+        with self._lock:
+            old = self.recipes.get(recipe_name)
+            if old is None:
+                return False
+            recipe = old.with_image(image)
+            versions = self.storage.save_recipe(recipe_name, recipe.to_dict(),
+                                                changes=self._recipe_changes(recipe_name, old, recipe))
+            self._recipe_written(recipe_name, old, recipe)
+            self._written(versions)
+            return True
+
+    # Same for one ingredient's image, by position; returns False if the
+    # recipe no longer exists (it may be deleted while an upload is processed)
+    @METRICS.timed("set_ingredient_image")
+    def set_ingredient_image(self, recipe_name, index, image):
+        with self._lock:
+            old = self.recipes.get(recipe_name)
+            if old is None:
+                return False
+            new = old.with_ingredient_image(index, image)
+            versions = self.storage.set_ingredient_image(recipe_name, index, image,
+                                                         changes=self._recipe_changes(recipe_name, old, new))
+            self._recipe_written(recipe_name, old, new)
+            self._written(versions)
+            return True
+
+    # Same, for the first ingredient with the given name; returns False if
+    # the recipe or the ingredient no longer exists
+    def set_ingredient_image_by_name(self, recipe_name, ingredient_name, image):
+        with self._lock:
+            recipe = self.recipes.get(recipe_name)
+            if recipe is None:
+                return False
+            for i, name in enumerate(recipe.ingredient_names()):
+                if name == ingredient_name:
+                    self.set_ingredient_image(recipe_name, i, image)
+                    return True
+            return False
+
+    # A recipe other than `name` whose name differs only in case or spacing,
+    # so that both would share one link; None if there is none
+    def slug_conflict(self, name):
+        with self._lock:
+            others = self.slugs.others(name)
+            return others[0] if others else None
+
+    # Names of an author's recipes; taken under the lock, as other sessions
+    # may be adding recipes while the catalog is walked
+    def recipes_by(self, author):
+        with self._lock:
+            return [name for name, recipe in self.recipes.items() if recipe.author == author]
+
+    # Favorites
+    def get_favorites(self, username):
+        return self.favorites.get(username, [])
+
+    @METRICS.timed("add_favorite")
+    def add_favorite(self, username, recipe_name, device=None):
+        with self._lock:
+            names = self.favorites.get(username, [])
+            if recipe_name in names:
+                return False
+            versions = self.storage.add_favorite(username, recipe_name,
+                                                 changes=[(FAVORITE_ADDED, username, recipe_name, device)])
+            self.favorites[username] = names + [recipe_name]
+            self.stats.favorites_changed(username, 1)
+            self._written(versions)
+            return True
+
+    @METRICS.timed("remove_favorite")
+    def remove_favorite(self, username, recipe_name, device=None):
+        with self._lock:
+            names = self.favorites.get(username, [])
+            if recipe_name not in names:
+                return False
+            versions = self.storage.remove_favorite(username, recipe_name,
+                                                    changes=[(FAVORITE_REMOVED, username, recipe_name, device)])
+            self.favorites[username] = [name for name in names if name != recipe_name]
+            self.stats.favorites_changed(username, -1)
+            self._written(versions)
+            return True
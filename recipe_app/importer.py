@@ -0,0 +1,234 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import re
+import time
+
+import pandas as pd
+
+from blobstore import BLOB_DIR, BlobStore, extract_inline_images
+from storage import recipe_slug
+
+# Bulk recipe import.
+#
+# Reads JSON-lines or CSV dumps with pandas in chunks of `batch_size` rows, so
+# a large file is never loaded at once. A .json file may also be a single
+# JSON document, either a list of rows or {name: recipe} as in
+# recipe_data.json; that has to be read whole. Each row becomes a recipe
+# record in the usual shape:
+#   name          required
+#   ingredients   required; a list of names or {"name", "image"} objects, a
+#                 JSON-encoded list, or text separated by ";", "|" or new
+#                 lines (commas only when none of those appear)
+#   instructions, image, author, date_added   optional
+# Rows without a name or ingredients are skipped as invalid. Recipes are
+# deduplicated by name, up to case and spacing as names share links that
+# way (see storage.recipe_slug): the first row for a name wins, and names
+# already in the store are skipped unless `replace` is set. Each chunk is committed with
+# a single save_recipes() call, i.e. one transaction or oplog append.
+#
+# The command line trusts the file's author column. An import made by a
+# user of the app passes `owner`: every recipe is attributed to that user,
+# and `replace` only overwrites recipes they wrote.
+#
+#     python importer.py recipes.jsonl --author admin
+
+BATCH_SIZE = 5000
+FORMATS = {".csv": "csv", ".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+INGREDIENT_SEPARATORS = re.compile(r"[;|\n]")
+
+
+class ImportResult:
+    __slots__ = ("imported", "duplicates", "invalid", "batches", "seconds")
+
+    def __init__(self):
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def detect_format(filename):
+    fmt = FORMATS.get(os.path.splitext(filename)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Cannot tell the format of {filename!r}; expected .csv, .json or .jsonl")
+    return fmt
+
+
+def read_chunks(source, fmt, batch_size=BATCH_SIZE):
+    if fmt == "csv":
+        return pd.read_csv(source, chunksize=batch_size, dtype=str, keep_default_na=False)
+    if fmt == "jsonl":
+        return pd.read_json(source, lines=True, chunksize=batch_size, dtype=False, convert_dates=False)
+    if fmt == "json":
+        return _json_chunks(source, batch_size)
+    raise ValueError(f"Unknown import format {fmt!r}")
+
+
+# A .json file: one JSON document (a list of rows, a {name: recipe} mapping
+# or a single row), or JSON lines after all
+def _json_chunks(source, batch_size):
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            text = f.read()
+    else:
+        text = source.read()
+    if isinstance(text, bytes):
+        text = text.decode("utf-8-sig")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        yield from read_chunks(io.StringIO(text), "jsonl", batch_size)
+        return
+    if isinstance(data, dict):
+        if "name" in data and "ingredients" in data:
+            rows = [data]
+        else:
+            rows = [dict(recipe, name=name) if isinstance(recipe, dict) else {"name": name}
+                    for name, recipe in data.items()]
+    elif isinstance(data, list):
+        rows = [row if isinstance(row, dict) else {} for row in data]
+    else:
+        raise ValueError("Expected a list of recipes or an object mapping names to recipes")
+    for start in range(0, len(rows), batch_size):
+        yield pd.DataFrame.from_records(rows[start:start + batch_size])
+
+
+def _text(value):
+    # Missing cells come through as None, NaN or ""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value).strip()
+
+
+def _optional(value):
+    return _text(value) or None
+
+
+def normalize_ingredients(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+    if isinstance(value, str):
+        separators = INGREDIENT_SEPARATORS if INGREDIENT_SEPARATORS.search(value) else ","
+        value = re.split(separators, value)
+    if not isinstance(value, (list, tuple)):
+        return []
+
+    ingredients = []
+    seen = set()
+    for item in value:
+        if isinstance(item, str):
+            name, image = item, None
+        elif isinstance(item, dict):
+            name, image = _text(item.get("name")), _optional(item.get("image"))
+        else:
+            name, image = _text(item), None
+        name = " ".join(name.split())
+        key = name.lower()
+        if name and key not in seen:
+            seen.add(key)
+            ingredients.append({"name": name, "image": image})
+    return ingredients
+
+
+def _column(chunk, name):
+    return chunk[name].tolist() if name in chunk.columns else [None] * len(chunk)
+
+
+# Turn one chunk into {name: recipe}, skipping invalid rows and duplicates.
+# `existing` maps names to stored records (with an `author`) and `slugs` is
+# their SlugMap, if any; `seen` collects the slugs of rows already taken. See
+# the top of the file for `owner`.
+def normalize_chunk(chunk, existing, seen, result, author, replace=False, now=None, owner=None, slugs=None):
+    now = now or str(datetime.datetime.now())
+    batch = {}
+    rows = zip(_column(chunk, "name"), _column(chunk, "ingredients"), _column(chunk, "instructions"),
+               _column(chunk, "image"), _column(chunk, "author"), _column(chunk, "date_added"))
+    for name, ingredients, instructions, image, row_author, date_added in rows:
+        name = " ".join(_text(name).split())
+        ingredients = normalize_ingredients(ingredients)
+        if not name or not ingredients:
+            result.invalid += 1
+            continue
+        slug = recipe_slug(name)
+        if (slug in seen or (name in existing and not (replace and _replaceable(existing[name], owner)))
+                or (slugs is not None and slugs.others(name))):
+            result.duplicates += 1
+            continue
+        seen.add(slug)
+        batch[name] = {
+            "ingredients": ingredients,
+            "instructions": _text(instructions),
+            "image": _optional(image),
+            "author": owner or _text(row_author) or author,
+            "date_added": _text(date_added) or now,
+        }
+    return batch
+
+
+def _replaceable(recipe, owner):
+    return owner is None or recipe.author == owner
+
+
+# Import a JSON-lines, JSON or CSV file (path or file object) into a DataStore.
+# progress(result) is called after every committed batch.
+def import_recipes(store, source, fmt=None, batch_size=BATCH_SIZE, author="admin",
+                   replace=False, blobs=None, progress=None, owner=None):
+    if fmt is None:
+        fmt = detect_format(source if isinstance(source, str) else source.name)
+    result = ImportResult()
+    started = time.perf_counter()
+    seen = set()
+    for chunk in read_chunks(source, fmt, batch_size):
+        batch = normalize_chunk(chunk, store.recipes, seen, result, author, replace, owner=owner,
+                                slugs=store.slugs)
+        if not batch:
+            continue
+        if blobs is not None:
+            # Inline base64 images go to the blob store like any other image
+            batch.update(extract_inline_images(batch, blobs))
+        store.save_recipes(batch)
+        result.imported += len(batch)
+        result.batches += 1
+        if progress is not None:
+            progress(result)
+    result.seconds = round(time.perf_counter() - started, 3)
+    return result
+
+
+def main():
+    from datastore import DataStore
+    from storage import open_storage
+
+    parser = argparse.ArgumentParser(description="Bulk import recipes from JSON lines or CSV")
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=["jsonl", "json", "csv"], default=None,
+                        help="Input format (default: from the file extension)")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--backend", default=None, help="Storage backend (default: RECIPE_STORAGE or sqlite)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--author", default="admin", help="Author for rows that do not name one")
+    parser.add_argument("--replace", action="store_true", help="Overwrite recipes that already exist")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    store = DataStore(open_storage(args.data_dir, args.backend))
+    blobs = BlobStore(os.path.join(args.data_dir, BLOB_DIR))
+    result = import_recipes(store, args.file, args.format, args.batch_size, args.author,
+                            args.replace, blobs)
+    print(json.dumps(result.as_dict()))
+
+
+if __name__ == "__main__":
+    main()
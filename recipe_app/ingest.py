@@ -0,0 +1,67 @@
+import os
+
+from PIL import Image, ImageOps
+
+from metrics import METRICS
+
+# Upload ingest pipeline.
+#
+# Turns an uploaded photo into a stored blob with as little memory and CPU as
+# possible:
+#   - JPEGs are decoded at reduced scale (draft mode lets the decoder skip
+#     DCT coefficients), so a 12 MP phone photo is never fully decoded when
+#     it is going to be downscaled anyway;
+#   - the remaining downscale uses an integer reduce() followed by a
+#     resampling pass, both to at most MAX_IMAGE_DIMENSION;
+#   - EXIF orientation is applied and the metadata (EXIF, ICC, GPS) dropped;
+#   - photos are re-encoded as JPEG, images with transparency as PNG;
+#   - the encoder writes straight into the blob store, which hashes the
+#     stream on the way to disk, so no encoded copy is held in memory.
+
+MAX_IMAGE_DIMENSION = int(os.environ.get("RECIPE_MAX_IMAGE_DIMENSION", "1600"))
+JPEG_QUALITY = 85
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+
+
+# Decode and downscale an image file to fit max_dimension, applying EXIF
+# orientation. Returns the loaded image.
+def load_scaled(source, max_dimension=MAX_IMAGE_DIMENSION):
+    image = Image.open(source)
+    if image.format == "JPEG":
+        image.draft("RGB", (max_dimension, max_dimension))
+    ImageOps.exif_transpose(image, in_place=True)
+
+    factor = max(image.size) // max_dimension
+    if factor > 1:
+        image = image.reduce(factor)
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension))
+    return image
+
+
+def output_format(image):
+    return "PNG" if _has_alpha(image) else "JPEG"
+
+
+# Ingest an uploaded file (path or file object) into the blob store and
+# return its digest; thumbnails are built from the decoded image when a
+# thumbnailer is given
+@METRICS.timed("image_ingest")
+def ingest_image(source, blobs, thumbnailer=None, max_dimension=MAX_IMAGE_DIMENSION):
+    image = load_scaled(source, max_dimension)
+    image_format = output_format(image)
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    with METRICS.timer("image_encode"):
+        if image_format == "JPEG":
+            digest = blobs.put_stream(lambda f: image.save(f, format="JPEG", quality=JPEG_QUALITY))
+        else:
+            digest = blobs.put_stream(lambda f: image.save(f, format="PNG"))
+
+    if thumbnailer is not None:
+        thumbnailer.generate(digest, image=image)
+    return digest
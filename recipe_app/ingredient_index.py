@@ -0,0 +1,219 @@
+import bisect
+import threading
+from array import array
+
+# Ingredient -> recipe index for "what can I cook".
+#
+# Every recipe gets a small integer slot, and every distinct ingredient a
+# posting list of the slots of the recipes that use it. Postings are stored
+# like roaring bitmap containers: a sorted array of slots while the
+# ingredient is rare, and a bitset (a Python int, one bit per slot) once it
+# is used by more than 1/DENSE_FRACTION of the catalog, where the bitset is
+# the smaller of the two.
+#
+# A query turns the postings of the ingredients at hand into bitsets and
+# adds them up as a bit-sliced counter, so after len(pantry) * log2(len(pantry))
+# big-int operations plane i holds bit i of "how many of my ingredients does
+# each recipe use". Recipes are also grouped by how many ingredients they
+# need, so every (have, required) combination is a handful of AND/ANDNOTs
+# away, and ranking by coverage and missing count is a sort of those
+# combinations rather than of the matching recipes. Only the combinations
+# that overlap the requested page are turned back into names.
+#
+# Maintained through DataStore like the search index: build() on load,
+# update() on every write.
+
+DENSE_FRACTION = 32
+
+
+def ingredient_key(name):
+    return " ".join(name.lower().split())
+
+
+# Slot numbers of the set bits, in increasing order
+_BYTE_BITS = [tuple(i for i in range(8) if byte >> i & 1) for byte in range(256)]
+
+
+def bit_positions(bits):
+    positions = []
+    for offset, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        if byte:
+            base = offset * 8
+            positions.extend(base + i for i in _BYTE_BITS[byte])
+    return positions
+
+
+def to_bits(slots, size):
+    buf = bytearray((size + 7) // 8)
+    for slot in slots:
+        buf[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buf, "little")
+
+
+class IngredientMatches:
+    __slots__ = ("names", "buckets", "total")
+
+    def __init__(self, names, buckets):
+        # Snapshot of slot -> name, so later writes cannot change what a
+        # slot of this result means
+        self.names = names
+        # (have, required, bits), best first
+        self.buckets = buckets
+        self.total = sum(bits.bit_count() for _, _, bits in buckets)
+
+    # (name, have, required) from start to stop, ties in name order
+    def select(self, start=0, stop=None):
+        stop = self.total if stop is None else min(stop, self.total)
+        results = []
+        seen = 0
+        for have, required, bits in self.buckets:
+            if seen >= stop:
+                break
+            count = bits.bit_count()
+            if seen + count > start:
+                names = sorted(self.names[slot] for slot in bit_positions(bits))
+                results.extend((name, have, required)
+                               for name in names[max(0, start - seen):stop - seen])
+            seen += count
+        return results
+
+
+class IngredientIndex:
+    def __init__(self):
+        self.names = []
+        self.slots = {}
+        self.free = []
+        # slot -> tuple of ingredient keys
+        self.recipe_keys = []
+        # key -> array of slots or int bitset
+        self.postings = {}
+        # ingredient count -> bitset of the recipes needing that many
+        self.by_required = {}
+        self._key_cache = {}
+        self._lock = threading.Lock()
+
+    def _keys(self, recipe):
+        cache = self._key_cache
+        keys = []
+        for name in recipe.ingredient_names():
+            key = cache.get(name)
+            if key is None:
+                key = cache[name] = ingredient_key(name)
+            if key and key not in keys:
+                keys.append(key)
+        return tuple(keys)
+
+    def build(self, recipes, version=None):
+        with self._lock:
+            self.names = list(recipes)
+            self.slots = {name: slot for slot, name in enumerate(self.names)}
+            self.free = []
+            self.recipe_keys = [self._keys(recipe) for recipe in recipes.values()]
+            size = len(self.names)
+
+            postings = {}
+            by_required = {}
+            for slot, keys in enumerate(self.recipe_keys):
+                for key in keys:
+                    postings.setdefault(key, []).append(slot)
+                by_required.setdefault(len(keys), []).append(slot)
+            self.postings = {key: to_bits(slots, size) if len(slots) * DENSE_FRACTION > size else array("I", slots)
+                             for key, slots in postings.items()}
+            self.by_required = {required: to_bits(slots, size) for required, slots in by_required.items()}
+
+    def update(self, name, old, new):
+        with self._lock:
+            slot = self.slots.pop(name, None)
+            if slot is not None:
+                self._remove(slot)
+            if new is not None:
+                self._add(name, new)
+
+    def _add(self, name, recipe):
+        keys = self._keys(recipe)
+        if self.free:
+            slot = self.free.pop()
+            self.names[slot] = name
+            self.recipe_keys[slot] = keys
+        else:
+            slot = len(self.names)
+            self.names.append(name)
+            self.recipe_keys.append(keys)
+        self.slots[name] = slot
+
+        bit = 1 << slot
+        for key in keys:
+            posting = self.postings.get(key)
+            if posting is None:
+                self.postings[key] = array("I", [slot])
+            elif isinstance(posting, int):
+                self.postings[key] = posting | bit
+            else:
+                bisect.insort(posting, slot)
+                if len(posting) * DENSE_FRACTION > len(self.names):
+                    self.postings[key] = to_bits(posting, len(self.names))
+        self.by_required[len(keys)] = self.by_required.get(len(keys), 0) | bit
+
+    def _remove(self, slot):
+        keys = self.recipe_keys[slot]
+        mask = ~(1 << slot)
+        for key in keys:
+            posting = self.postings[key]
+            if isinstance(posting, int):
+                posting &= mask
+            else:
+                del posting[bisect.bisect_left(posting, slot)]
+            if posting:
+                self.postings[key] = posting
+            else:
+                del self.postings[key]
+        self.by_required[len(keys)] &= mask
+        self.names[slot] = None
+        self.recipe_keys[slot] = ()
+        self.free.append(slot)
+
+    def known(self, ingredient):
+        return ingredient_key(ingredient) in self.postings
+
+    # Recipes using at least one of `ingredients`, ranked by the fraction of
+    # their ingredients covered, then by how many are missing, then by how
+    # many of `ingredients` they use. max_missing drops recipes that need
+    # more than that many other ingredients.
+    def match(self, ingredients, max_missing=None):
+        with self._lock:
+            size = len(self.names)
+            postings = [self.postings[key] for key in dict.fromkeys(map(ingredient_key, ingredients))
+                        if key in self.postings]
+            if not postings:
+                return IngredientMatches([], [])
+
+            # planes[i] holds bit i of each recipe's count of matches
+            planes = []
+            for posting in postings:
+                carry = posting if isinstance(posting, int) else to_bits(posting, size)
+                for i, plane in enumerate(planes):
+                    planes[i], carry = plane ^ carry, plane & carry
+                    if not carry:
+                        break
+                if carry:
+                    planes.append(carry)
+
+            matched = 0
+            for plane in planes:
+                matched |= plane
+            buckets = []
+            # No recipe can match more often than the planes can count
+            for have in range(1, min(len(postings), (1 << len(planes)) - 1) + 1):
+                exactly = matched
+                for i, plane in enumerate(planes):
+                    exactly &= plane if have >> i & 1 else ~plane
+                if not exactly:
+                    continue
+                for required, recipes in self.by_required.items():
+                    if required < have or (max_missing is not None and required - have > max_missing):
+                        continue
+                    bits = exactly & recipes
+                    if bits:
+                        buckets.append((have, required, bits))
+            buckets.sort(key=lambda bucket: (-bucket[0] / bucket[1], bucket[1] - bucket[0], -bucket[0]))
+            return IngredientMatches(list(self.names), buckets)
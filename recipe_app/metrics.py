@@ -0,0 +1,218 @@
+import cProfile
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from fileio import write_file
+
+# Timers and counters for the hot paths.
+#
+# Code that may be slow is wrapped in METRICS.timer(name) (or decorated with
+# METRICS.timed(name)); cheap events are counted with METRICS.count(name).
+# Every observation is aggregated three ways:
+#
+#   - cumulative totals since the process started (the _sum/_count series of
+#     the Prometheus dump);
+#   - a rolling window of the last WINDOW_SECONDS, for percentiles;
+#   - the current rerun, when the observing thread is inside
+#     METRICS.rerun() (the Streamlit script thread). Work done on other
+#     threads, such as the image workers, only shows up in the first two.
+#
+# For a rerun, the time not covered by any top-level timer is widget
+# rendering and everything else the page does.
+#
+# dump() writes the Prometheus text exposition format, so the file can be
+# picked up by node_exporter's textfile collector or just read.
+
+WINDOW_SECONDS = float(os.environ.get("RECIPE_METRICS_WINDOW", "300"))
+# Samples kept per timer within the window
+MAX_SAMPLES = 10000
+METRICS_FILE = "metrics.prom"
+PROFILE_DIR = "profiles"
+PREFIX = "recipe_app"
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Timings and counts of a single rerun
+class RerunTimings:
+    __slots__ = ("started", "seconds", "timings", "counters", "instrumented", "_depth")
+
+    def __init__(self):
+        self.started = time.time()
+        self.seconds = 0.0
+        # name -> [calls, seconds]
+        self.timings = {}
+        self.counters = {}
+        # Time inside top-level timers; nested ones are already part of it
+        self.instrumented = 0.0
+        self._depth = 0
+
+    def other_seconds(self):
+        return max(0.0, self.seconds - self.instrumented)
+
+
+class Metrics:
+    def __init__(self, window=WINDOW_SECONDS, max_samples=MAX_SAMPLES):
+        self.window = window
+        self.max_samples = max_samples
+        # name -> [calls, seconds] since start
+        self.totals = {}
+        # name -> deque of (time, seconds)
+        self.samples = {}
+        self.counters = {}
+        # name -> deque of (time, n)
+        self.events = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dumped = 0.0
+
+    def _current(self):
+        return getattr(self._local, "rerun", None)
+
+    def observe(self, name, seconds):
+        now = time.time()
+        with self._lock:
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = [0, 0.0]
+                self.samples[name] = deque(maxlen=self.max_samples)
+            total[0] += 1
+            total[1] += seconds
+            self.samples[name].append((now, seconds))
+
+    @contextmanager
+    def timer(self, name):
+        rerun = self._current()
+        if rerun is not None:
+            rerun._depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe(name, seconds)
+            if rerun is not None:
+                rerun._depth -= 1
+                timing = rerun.timings.setdefault(name, [0, 0.0])
+                timing[0] += 1
+                timing[1] += seconds
+                if rerun._depth == 0:
+                    rerun.instrumented += seconds
+
+    def timed(self, name):
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, n=1):
+        now = time.time()
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            self.events.setdefault(name, deque(maxlen=self.max_samples)).append((now, n))
+        rerun = self._current()
+        if rerun is not None:
+            rerun.counters[name] = rerun.counters.get(name, 0) + n
+
+    # Collect the timings of one rerun on this thread; the whole rerun is
+    # also timed as "rerun"
+    @contextmanager
+    def rerun(self):
+        rerun = self._local.rerun = RerunTimings()
+        started = time.perf_counter()
+        try:
+            yield rerun
+        finally:
+            rerun.seconds = time.perf_counter() - started
+            self._local.rerun = None
+            self.observe("rerun", rerun.seconds)
+
+    # Per-timer statistics over the rolling window, in milliseconds
+    def window_summary(self):
+        cutoff = time.time() - self.window
+        with self._lock:
+            samples = {name: [s for t, s in values if t >= cutoff] for name, values in self.samples.items()}
+        summary = {}
+        for name, values in sorted(samples.items()):
+            if not values:
+                continue
+            values.sort()
+            summary[name] = {
+                "calls": len(values),
+                "mean_ms": sum(values) / len(values) * 1000,
+                "p50_ms": _percentile(values, 0.5) * 1000,
+                "p95_ms": _percentile(values, 0.95) * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        return summary
+
+    # Counter increments over the rolling window
+    def window_counts(self):
+        cutoff = time.time() - self.window
+        with self._lock:
+            return {name: sum(n for t, n in values if t >= cutoff) for name, values in sorted(self.events.items())}
+
+    def prometheus(self):
+        cutoff = time.time() - self.window
+        with self._lock:
+            totals = {name: list(total) for name, total in self.totals.items()}
+            samples = {name: sorted(s for t, s in values if t >= cutoff) for name, values in self.samples.items()}
+            counters = dict(self.counters)
+
+        lines = [
+            f"# HELP {PREFIX}_operation_seconds Time spent in instrumented operations; "
+            f"quantiles over the last {self.window:g} s.",
+            f"# TYPE {PREFIX}_operation_seconds summary",
+        ]
+        for name in sorted(totals):
+            for quantile in (0.5, 0.95, 0.99):
+                value = f"{_percentile(samples[name], quantile):.6g}" if samples[name] else "NaN"
+                lines.append(f'{PREFIX}_operation_seconds{{op="{name}",quantile="{quantile}"}} {value}')
+            lines.append(f'{PREFIX}_operation_seconds_sum{{op="{name}"}} {totals[name][1]:.6g}')
+            lines.append(f'{PREFIX}_operation_seconds_count{{op="{name}"}} {totals[name][0]}')
+        lines.append(f"# HELP {PREFIX}_events_total Counted events.")
+        lines.append(f"# TYPE {PREFIX}_events_total counter")
+        for name in sorted(counters):
+            lines.append(f'{PREFIX}_events_total{{event="{name}"}} {counters[name]}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        write_file(path, self.prometheus().encode(), fsync=False)
+        self._dumped = time.monotonic()
+
+    # dump(), at most once every `interval` seconds
+    def dump_if_due(self, path, interval):
+        if time.monotonic() - self._dumped >= interval:
+            self.dump(path)
+
+
+# Process-wide registry used by all instrumented modules
+METRICS = Metrics()
+
+
+# Profile the calling thread for the duration of the block and write the
+# stats to `path` (open with pstats or snakeviz). Only one profile can run
+# at a time; returns False instead of profiling if another one is active.
+@contextmanager
+def profile(path):
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        profiler.dump_stats(path)
@@ -0,0 +1,66 @@
+import json
+import os
+
+from fileio import write_file
+
+# Append-only operation log.
+#
+# Each operation is one JSON line ({"op": "add_favorite", ...}), appended and
+# fsynced on its own, so the cost of a write does not depend on how much data
+# already exists. Readers replay the log on top of the last snapshot and can
+# resume from a byte offset to pick up only what other processes appended.
+#
+# Operations must be idempotent (set/replace/delete semantics): after a
+# compaction the snapshot is written before the log is reset, so a crash in
+# between replays operations that are already part of the snapshot.
+
+OPLOG_FILE = "oplog.jsonl"
+
+
+class OpLog:
+    def __init__(self, path):
+        self.path = path
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def size(self):
+        stat = self.stat()
+        return stat[1] if stat else 0
+
+    # Append operations and fsync before returning; the caller holds the
+    # storage lock so lines from different writers never interleave
+    def append(self, ops):
+        data = "".join(json.dumps(op, separators=(",", ":")) + "\n" for op in ops).encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # Complete operations from `offset` on and the offset just past the last
+    # complete line; a partially written last line is left for the next read
+    def read_from(self, offset):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b"\n") + 1
+        ops = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        return ops, offset + end
+
+    # Drop anything after `offset`, i.e. a line torn by a crash mid-append
+    def truncate(self, offset):
+        with open(self.path, 'r+b') as f:
+            f.truncate(offset)
+
+    # Start a new, empty log (a new file, so readers notice the reset)
+    def reset(self):
+        write_file(self.path, b"")
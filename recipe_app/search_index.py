@@ -0,0 +1,284 @@
+import math
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+
+from fileio import write_file
+
+# Inverted index for the recipe search box.
+#
+# A recipe is indexed under its "terms": the lowercased recipe name and each
+# lowercased ingredient name. Terms are in turn indexed by the trigrams they
+# contain, which gives exact substring matching without scanning the
+# catalog:
+#
+#   - queries of GRAM_SIZE characters or more intersect the posting sets of
+#     their trigrams and keep the candidate terms that really contain the
+#     query;
+#   - shorter queries scan the term vocabulary, which is much smaller than
+#     the catalog (ingredient names are shared between recipes).
+#
+# For typo-tolerant search the words of every term are indexed once more by
+# their padded trigrams ("  c", " ch", "chi", ..., "en "), as pg_trgm does.
+# fuzzy() finds, for each query word, the indexed words whose trigram sets
+# have a Jaccard similarity of at least FUZZY_THRESHOLD with it: counting
+# shared trigrams over the posting sets of the query's trigrams only touches
+# words that share some trigram, and words sharing fewer than
+# threshold * len(query trigrams) cannot reach the threshold. Only the
+# FUZZY_WORDS most similar words count. A recipe scores the mean over the
+# query words of its best matching word.
+#
+# The index is kept up to date through DataStore (build() on load, update()
+# on every write) and can be pickled next to the data so a restart does not
+# have to rebuild it.
+
+GRAM_SIZE = 3
+INDEX_FILE = "search_index.pickle"
+INDEX_FORMAT = 2
+FUZZY_THRESHOLD = 0.4
+# Similar words considered per query word, best first; bounds the work for
+# words that resemble many common ones
+FUZZY_WORDS = 8
+
+# Words for fuzzy matching: runs of two or more letters (numbers are left
+# to the exact search)
+_WORD_RE = re.compile(r"[^\W\d_]{2,}")
+
+
+def ingredient_terms(recipe):
+    return {name.lower() for name in recipe.ingredient_names() if name}
+
+
+def recipe_terms(name, recipe):
+    terms = ingredient_terms(recipe)
+    terms.add(name.lower())
+    return terms
+
+
+def term_grams(term):
+    return {term[i:i + GRAM_SIZE] for i in range(len(term) - GRAM_SIZE + 1)}
+
+
+def term_words(text):
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def word_grams(word):
+    return term_grams(f"  {word} ")
+
+
+class SearchIndex:
+    def __init__(self, path=None):
+        self.path = path
+        self.recipes = set()
+        self.postings = {}
+        self.grams = {}
+        self.recipe_terms = {}
+        # Fuzzy search: word -> names of the recipes with that word in their
+        # name, word -> ingredient terms containing it (with the number of
+        # recipes using each such term), padded trigram -> words, and the
+        # number of distinct trigrams of each word
+        self.name_words = {}
+        self.ingredient_words = {}
+        self.ingredient_counts = {}
+        self.word_grams = {}
+        self.word_sizes = {}
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def build(self, recipes, version=None):
+        with self._lock:
+            if version is not None and self._load(version):
+                return
+            self.recipes = set()
+            self.postings = {}
+            self.grams = {}
+            self.recipe_terms = {}
+            self.name_words = {}
+            self.ingredient_words = {}
+            self.ingredient_counts = {}
+            self.word_grams = {}
+            self.word_sizes = {}
+            for name, recipe in recipes.items():
+                self._add(name, recipe)
+            self.dirty = True
+            if version is not None:
+                self.save(version)
+
+    def update(self, name, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove(name, old)
+            if new is not None:
+                self._add(name, new)
+            self.dirty = True
+
+    def _add(self, name, recipe):
+        terms = recipe_terms(name, recipe)
+        self.recipes.add(name)
+        self.recipe_terms[name] = terms
+        for term in terms:
+            names = self.postings.get(term)
+            if names is None:
+                names = self.postings[term] = set()
+                for gram in term_grams(term):
+                    self.grams.setdefault(gram, set()).add(term)
+            names.add(name)
+
+        for word in term_words(name):
+            self._add_word(word)
+            self.name_words.setdefault(word, set()).add(name)
+        for term in ingredient_terms(recipe):
+            count = self.ingredient_counts.get(term, 0)
+            self.ingredient_counts[term] = count + 1
+            if count == 0:
+                for word in term_words(term):
+                    self._add_word(word)
+                    self.ingredient_words.setdefault(word, set()).add(term)
+
+    def _add_word(self, word):
+        if word not in self.word_sizes:
+            grams = word_grams(word)
+            self.word_sizes[word] = len(grams)
+            for gram in grams:
+                self.word_grams.setdefault(gram, set()).add(word)
+
+    # Drop `word` from the trigram index once nothing uses it
+    def _drop_word(self, word):
+        if word in self.name_words or word in self.ingredient_words:
+            return
+        del self.word_sizes[word]
+        for gram in word_grams(word):
+            words = self.word_grams[gram]
+            words.discard(word)
+            if not words:
+                del self.word_grams[gram]
+
+    def _discard_word(self, index, word, item):
+        items = index[word]
+        items.discard(item)
+        if not items:
+            del index[word]
+            self._drop_word(word)
+
+    def _remove(self, name, recipe):
+        for word in term_words(name):
+            self._discard_word(self.name_words, word, name)
+        for term in ingredient_terms(recipe):
+            count = self.ingredient_counts.pop(term) - 1
+            if count:
+                self.ingredient_counts[term] = count
+            else:
+                for word in term_words(term):
+                    self._discard_word(self.ingredient_words, word, term)
+
+        self.recipes.discard(name)
+        for term in self.recipe_terms.pop(name, ()):
+            names = self.postings[term]
+            names.discard(name)
+            if not names:
+                del self.postings[term]
+                for gram in term_grams(term):
+                    terms = self.grams[gram]
+                    terms.discard(term)
+                    if not terms:
+                        del self.grams[gram]
+
+    def matching_terms(self, query):
+        query = query.lower()
+        if len(query) < GRAM_SIZE:
+            return {term for term in self.postings if query in term}
+        posting_sets = sorted((self.grams.get(query[i:i + GRAM_SIZE], set())
+                               for i in range(len(query) - GRAM_SIZE + 1)), key=len)
+        candidates = set.intersection(*posting_sets)
+        return {term for term in candidates if query in term}
+
+    # Names of the recipes whose name or any ingredient contains the query
+    def search(self, query):
+        with self._lock:
+            if not query:
+                return set(self.recipes)
+            names = set()
+            for term in self.matching_terms(query):
+                names.update(self.postings[term])
+            return names
+
+    # Indexed words similar to `word`, with their similarity, at most
+    # `limit` of them (the most similar)
+    def similar_words(self, word, threshold=FUZZY_THRESHOLD, limit=FUZZY_WORDS):
+        grams = word_grams(word)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.word_grams.get(gram, ()))
+        least = max(1, math.ceil(threshold * len(grams)))
+        similar = {}
+        for candidate, shared in counts.items():
+            if shared >= least:
+                score = shared / (len(grams) + self.word_sizes[candidate] - shared)
+                if score >= threshold:
+                    similar[candidate] = score
+        if len(similar) > limit:
+            similar = dict(sorted(similar.items(), key=lambda item: (-item[1], item[0]))[:limit])
+        return similar
+
+    # Recipe name -> similarity in (0, 1] for the recipes whose name or
+    # ingredient words resemble the words of the query. For a one-word
+    # query, words containing it are skipped: search() already finds
+    # those recipes.
+    def fuzzy(self, query, threshold=FUZZY_THRESHOLD):
+        with self._lock:
+            query_words = term_words(query)
+            single = len(query_words) == 1
+            totals = None
+            for query_word in query_words:
+                # Least similar first, so the best score for a recipe is
+                # the one left standing
+                best = {}
+                similar = self.similar_words(query_word, threshold)
+                for word, score in sorted(similar.items(), key=lambda item: item[1]):
+                    if single and query_word in word:
+                        continue
+                    names = self.name_words.get(word)
+                    if names:
+                        best.update(dict.fromkeys(names, score))
+                    for term in self.ingredient_words.get(word, ()):
+                        best.update(dict.fromkeys(self.postings[term], score))
+                if totals is None:
+                    totals = best
+                else:
+                    get = totals.get
+                    totals.update({name: get(name, 0.0) + score for name, score in best.items()})
+            if not totals or len(query_words) == 1:
+                return totals or {}
+            count = len(query_words)
+            return {name: total / count for name, total in totals.items() if total >= threshold * count}
+
+    def save(self, version):
+        if self.path is None:
+            return
+        with self._lock:
+            state = (INDEX_FORMAT, version, self.recipes, self.postings, self.grams, self.recipe_terms,
+                     self.name_words, self.ingredient_words, self.ingredient_counts, self.word_grams,
+                     self.word_sizes)
+            data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+            self.dirty = False
+        write_file(self.path, data, fsync=False)
+
+    # Use the persisted index if it was saved for exactly this data version
+    def _load(self, version):
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if state[0] != INDEX_FORMAT or state[1] != version:
+            return False
+        (_, _, self.recipes, self.postings, self.grams, self.recipe_terms,
+         self.name_words, self.ingredient_words, self.ingredient_counts, self.word_grams,
+         self.word_sizes) = state
+        self.dirty = False
+        return True
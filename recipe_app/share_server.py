@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from blobstore import BLOB_DIR, BlobStore, is_blob_ref
+from fileio import write_file
+from storage import open_storage, recipe_slug
+
+# Read-only HTTP endpoint for shared recipes and exports.
+#
+# A small stdlib server that runs next to Streamlit (started once per process
+# by the app, or on its own with `python share_server.py`). It reads single
+# rows straight from the storage backend, so a shared-link hit neither starts
+# a Streamlit session nor loads the catalog:
+#
+#   GET /recipes/<slug>                       one recipe as JSON
+#   GET /images/<digest>                      an image from the blob store
+#   GET /users/<name>/favorites.jsonl?token=  a user's favorites, JSON lines
+#   GET /users/<name>/recipes.jsonl?token=    a user's own recipes, JSON lines
+#
+# Responses carry an ETag and answer If-None-Match with 304; JSON is
+# gzipped for clients that accept it. Exports are streamed with chunked
+# encoding, one recipe at a time, and need a token signed with the server
+# secret so only the owner's links work.
+
+# Only local clients by default; set RECIPE_SHARE_HOST (e.g. 0.0.0.0) to
+# serve links to other machines
+SHARE_HOST = os.environ.get("RECIPE_SHARE_HOST", "127.0.0.1")
+SHARE_PORT = int(os.environ.get("RECIPE_SHARE_PORT", "8502"))
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+# Base URL put in links when RECIPE_SHARE_URL is not set: the bound host, or
+# this machine's name when listening on every interface. Behind a proxy or
+# NAT, RECIPE_SHARE_URL has to give the public address.
+def default_share_url(host, port):
+    if host in ("", "0.0.0.0", "::"):
+        host = socket.getfqdn()
+    elif host in LOCAL_HOSTS:
+        host = "localhost"
+    return f"http://{host}:{port}"
+
+
+SHARE_URL = (os.environ.get("RECIPE_SHARE_URL") or default_share_url(SHARE_HOST, SHARE_PORT)).rstrip("/")
+SECRET_FILE = ".share_secret"
+EXPORT_KINDS = ("favorites", "recipes")
+# Smaller bodies are not worth compressing
+GZIP_MIN_BYTES = 512
+# Export lines are buffered up to this size before a chunk is sent
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+_EXPORT_PATH = re.compile(r"^/users/([^/]+)/(favorites|recipes)\.jsonl$")
+
+
+# The signing secret: RECIPE_SHARE_SECRET, or one generated on first use
+# and kept in the data directory
+def load_secret(data_dir):
+    secret = os.environ.get("RECIPE_SHARE_SECRET")
+    if secret:
+        return secret
+    path = os.path.join(data_dir, SECRET_FILE)
+    if not os.path.exists(path):
+        write_file(path, os.urandom(32).hex().encode())
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+
+def export_token(secret, username, kind):
+    return hmac.new(secret.encode(), f"{username}/{kind}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+# Whether links on `base` only work on this machine
+def is_local_url(base=SHARE_URL):
+    return urlsplit(base).hostname in LOCAL_HOSTS
+
+
+def share_url(recipe_name, base=SHARE_URL):
+    return f"{base}/recipes/{quote(recipe_slug(recipe_name))}"
+
+
+def export_url(secret, username, kind, base=SHARE_URL):
+    return f"{base}/users/{quote(username)}/{kind}.jsonl?token={export_token(secret, username, kind)}"
+
+
+def _image_url(ref):
+    return f"/images/{ref}" if is_blob_ref(ref) else None
+
+
+# Public form of a recipe: images become URLs on this server
+def recipe_document(name, recipe):
+    return {
+        "name": name,
+        "ingredients": [{"name": ing["name"], "image": _image_url(ing.get("image"))}
+                        for ing in recipe["ingredients"]],
+        "instructions": recipe.get("instructions", ""),
+        "image": _image_url(recipe.get("image")),
+        "author": recipe.get("author"),
+        "date_added": recipe.get("date_added"),
+    }
+
+
+def _image_type(head):
+    if head.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class ShareRequestHandler(BaseHTTPRequestHandler):
+    server_version = "RecipeShare/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def log_message(self, format, *args):
+        log.info("%s %s", self.address_string(), format % args)
+
+    def _handle(self, send_body):
+        self.send_body = send_body
+        url = urlsplit(self.path)
+        path = url.path
+        try:
+            if path.startswith("/recipes/"):
+                self._recipe(unquote(path[len("/recipes/"):]))
+            elif path.startswith("/images/"):
+                self._image(path[len("/images/"):])
+            elif _EXPORT_PATH.match(path):
+                username, kind = _EXPORT_PATH.match(path).groups()
+                self._export(unquote(username), kind, parse_qs(url.query).get("token", [""])[0])
+            else:
+                self._error(404, "Not found")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({"error": message}).encode(), "application/json")
+
+    # Records carry no modification time, so only ETags are checked;
+    # If-Modified-Since is ignored
+    def _not_modified(self, etag):
+        match = self.headers.get("If-None-Match")
+        if match is None:
+            return False
+        return etag in [tag.strip() for tag in match.split(",")] or match.strip() == "*"
+
+    def _send(self, status, body, content_type, headers=(), compress=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        if compress:
+            self.send_header("Vary", "Accept-Encoding")
+            if len(body) >= GZIP_MIN_BYTES and self._accepts_gzip():
+                body = zlib.compress(body, wbits=31)
+                self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.send_body:
+            self.wfile.write(body)
+
+    def _accepts_gzip(self):
+        return "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def _recipe(self, slug):
+        found = self.server.storage.find_recipe(slug)
+        if found is None:
+            self._error(404, "No such recipe")
+            return
+        body = json.dumps(recipe_document(*found)).encode()
+        # Weak, since the gzipped and plain bodies share it
+        etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+        headers = [("ETag", etag), ("Cache-Control", "public, max-age=60")]
+        if self._not_modified(etag):
+            self._send(304, b"", "application/json", headers)
+        else:
+            self._send(200, body, "application/json", headers, compress=True)
+
+    def _image(self, digest):
+        blobs = self.server.blobs
+        if not is_blob_ref(digest) or not blobs.exists(digest):
+            self._error(404, "No such image")
+            return
+        # Blobs are content-addressed, so they never change
+        headers = [("ETag", f'"{digest}"'), ("Cache-Control", "public, max-age=31536000, immutable")]
+        if self._not_modified(f'"{digest}"'):
+            self._send(304, b"", "application/octet-stream", headers)
+            return
+        data = blobs.get(digest)
+        self._send(200, data, _image_type(data[:12]), headers)
+
+    def _export(self, username, kind, token):
+        if not hmac.compare_digest(token, export_token(self.server.secret, username, kind)):
+            self._error(403, "Invalid export token")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Disposition", f'attachment; filename="{kind}.jsonl"')
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Vary", "Accept-Encoding")
+        compressor = zlib.compressobj(wbits=31) if self._accepts_gzip() else None
+        if compressor:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        # A HEAD response has no body, not even the last chunk
+        if not self.send_body:
+            return
+
+        storage = self.server.storage
+        rows = storage.iter_favorite_recipes(username) if kind == "favorites" else storage.iter_authored_recipes(username)
+        buffer = []
+        size = 0
+        for name, recipe in rows:
+            line = json.dumps(recipe_document(name, recipe)).encode() + b"\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                self._write_chunk(b"".join(buffer), compressor)
+                buffer, size = [], 0
+        self._write_chunk(b"".join(buffer), compressor)
+        if compressor:
+            self._write_chunk(compressor.flush(), None)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data, compressor):
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+
+class ShareServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, storage, blobs, secret):
+        super().__init__(address, ShareRequestHandler)
+        self.storage = storage
+        self.blobs = blobs
+        self.secret = secret
+
+
+# Serve on a daemon thread; returns None if the port is taken (usually by
+# another server process already serving the same data)
+def start_share_server(storage, blobs, secret, host=SHARE_HOST, port=SHARE_PORT):
+    try:
+        server = ShareServer((host, port), storage, blobs, secret)
+    except OSError as e:
+        log.warning("Share server not started on %s:%s: %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="share-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve shared recipes and exports over HTTP")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--backend", default=None, help="Storage backend (default: RECIPE_STORAGE or sqlite)")
+    parser.add_argument("--host", default=SHARE_HOST)
+    parser.add_argument("--port", type=int, default=SHARE_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = ShareServer((args.host, args.port), open_storage(args.data_dir, args.backend),
+                         BlobStore(os.path.join(args.data_dir, BLOB_DIR)), load_secret(args.data_dir))
+    print(f"Serving shared recipes on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import bisect
+import threading
+from itertools import islice
+
+# Presorted orderings of the catalog for the "Sort by" options.
+#
+# A SortedIndex keeps every recipe name in a list ordered by a sort key and
+# is maintained incrementally by DataStore, like the search index. Producing
+# a page of sorted results is then a walk over an existing ordering that
+# stops once the page is full, instead of sorting all matches on every
+# rerun. When the set of matches is tiny compared to the catalog, sorting
+# just the matches is cheaper than walking, and select() does that instead.
+
+# Sort only the matches when they are fewer than 1/SORT_THRESHOLD of the catalog
+SORT_THRESHOLD = 32
+
+
+def name_key(name, recipe):
+    return name
+
+
+def date_key(name, recipe):
+    return (recipe.timestamp(), name)
+
+
+class SortedIndex:
+    def __init__(self, key_func):
+        self.key_func = key_func
+        self.keys = {}
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def build(self, recipes, version=None):
+        with self._lock:
+            self.keys = {name: self.key_func(name, recipe) for name, recipe in recipes.items()}
+            self.entries = sorted((key, name) for name, key in self.keys.items())
+
+    def update(self, name, old, new):
+        with self._lock:
+            key = self.keys.pop(name, None)
+            if key is not None:
+                del self.entries[bisect.bisect_left(self.entries, (key, name))]
+            if new is not None:
+                key = self.keys[name] = self.key_func(name, new)
+                bisect.insort(self.entries, (key, name))
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Names in [start, stop) of the ordering, restricted to `matches`
+    # (a set of names, or None for the whole catalog)
+    def select(self, matches=None, start=0, stop=None, reverse=False):
+        with self._lock:
+            if matches is None:
+                if reverse:
+                    n = len(self.entries)
+                    stop = n if stop is None else min(stop, n)
+                    chunk = self.entries[max(n - stop, 0):max(n - start, 0)][::-1]
+                else:
+                    chunk = self.entries[start:stop]
+                return [name for _, name in chunk]
+
+            if len(matches) * SORT_THRESHOLD < len(self.entries):
+                keys = self.keys
+                ordered = sorted((keys[name], name) for name in matches if name in keys)
+                if reverse:
+                    ordered.reverse()
+                return [name for _, name in ordered[start:stop]]
+
+            entries = reversed(self.entries) if reverse else iter(self.entries)
+            walk = (name for _, name in entries if name in matches)
+            return list(islice(walk, start, stop))
+
+    def top_k(self, k, matches=None, reverse=False):
+        return self.select(matches, 0, k, reverse)
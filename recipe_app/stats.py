@@ -0,0 +1,65 @@
+import threading
+
+# Per-user aggregates for the sidebar and the sync summary.
+#
+# Counts are computed once when the data is loaded and then adjusted by the
+# DataStore write paths (recipe saves and favorite changes), so reading them
+# is O(1) no matter how large the catalog is.
+
+
+class UserStats:
+    __slots__ = ("recipes", "recipe_images", "ingredient_images", "favorites")
+
+    def __init__(self):
+        self.recipes = 0
+        self.recipe_images = 0
+        self.ingredient_images = 0
+        self.favorites = 0
+
+    # recipe is a CompactRecipe
+    def add_recipe(self, recipe, sign=1):
+        self.recipes += sign
+        if recipe.image is not None:
+            self.recipe_images += sign
+        self.ingredient_images += sign * recipe.ingredient_image_count()
+
+
+class StatsIndex:
+    def __init__(self):
+        self.users = {}
+        self.totals = UserStats()
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        return self.users.get(username) or UserStats()
+
+    def _user(self, username):
+        stats = self.users.get(username)
+        if stats is None:
+            stats = self.users[username] = UserStats()
+        return stats
+
+    def build(self, recipes, favorites):
+        with self._lock:
+            self.users = {}
+            self.totals = UserStats()
+            for recipe in recipes.values():
+                self._user(recipe.author).add_recipe(recipe)
+                self.totals.add_recipe(recipe)
+            for username, names in favorites.items():
+                self._user(username).favorites = len(names)
+                self.totals.favorites += len(names)
+
+    def recipe_changed(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._user(old.author).add_recipe(old, -1)
+                self.totals.add_recipe(old, -1)
+            if new is not None:
+                self._user(new.author).add_recipe(new)
+                self.totals.add_recipe(new)
+
+    def favorites_changed(self, username, delta):
+        with self._lock:
+            self._user(username).favorites += delta
+            self.totals.favorites += delta
@@ -0,0 +1,759 @@
+import argparse
+import json
+import os
+import sqlite3
+import string
+import threading
+from contextlib import contextmanager
+
+from changefeed import FEED_FILE, RECIPE, ChangeFeed
+from fileio import FileLock, write_file
+from oplog import OPLOG_FILE, OpLog
+
+# Storage backends for users, recipes and favorites.
+#
+# Every backend exposes the same row-level API (save one user, one recipe,
+# one favorite) so callers only ever persist what actually changed. The bulk
+# save_* methods exist for migrations and imports.
+#
+# Recipe and favorite writes take the change feed entries that describe them
+# ((kind, username, recipe, device), see changefeed.py) and publish them to
+# the backend's `feed` along with the write.
+
+USER_DATA_FILE = "user_data.json"
+RECIPE_DATA_FILE = "recipe_data.json"
+FAVORITES_DATA_FILE = "favorites_data.json"
+DATABASE_FILE = "recipes.db"
+LOCK_FILE = ".storage.lock"
+
+# Size of the JSON backend's operation log that triggers a compaction
+COMPACT_BYTES = int(os.environ.get("RECIPE_OPLOG_COMPACT_BYTES", 1024 * 1024))
+# Versions whose written keys the SQLite backend keeps for changes_since(),
+# pruned every WRITES_PRUNE_EVERY writes
+WRITES_KEPT = 10000
+WRITES_PRUNE_EVERY = 100
+
+# Slugs lower-case ASCII letters only, like SQLite's lower(), so the SQLite
+# backend can look them up through an expression index
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+# URL slug of a recipe name, e.g. "Pasta Carbonara" -> "pasta-carbonara"
+def recipe_slug(name):
+    return name.replace(" ", "-").translate(_ASCII_LOWER)
+
+
+# Recipe names by slug. Names that differ only in case or in spaces vs
+# hyphens share a slug, and so a link; new ones are refused (see
+# DataStore.slug_conflict), but older data may hold several, so every name
+# is kept and lookups take the first in sort order, like the SQLite backend.
+class SlugMap:
+    def __init__(self, names=()):
+        self._names = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        self._names.setdefault(recipe_slug(name), set()).add(name)
+
+    def discard(self, name):
+        slug = recipe_slug(name)
+        names = self._names.get(slug)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del self._names[slug]
+
+    def get(self, slug):
+        names = self._names.get(slug)
+        return min(names) if names else None
+
+    # Other names sharing `name`'s slug
+    def others(self, name):
+        return sorted(self._names.get(recipe_slug(name), set()) - {name})
+
+
+# Every write returns a (before, after) pair of version tokens taken
+# atomically with the write: `before` is the version the write was applied
+# on top of. A caller whose last-seen version differs from `before` knows
+# another session or process wrote in between and must reload; because writes
+# are row-level and applied to the latest stored state, nothing is
+# overwritten.
+class Storage:
+    # Change feed the backend publishes to (see changefeed.py)
+    feed = None
+
+    def load_users(self):
+        raise NotImplementedError
+
+    def load_recipes(self):
+        raise NotImplementedError
+
+    def load_favorites(self):
+        raise NotImplementedError
+
+    def save_user(self, username, password):
+        raise NotImplementedError
+
+    def save_recipe(self, name, recipe, changes=()):
+        raise NotImplementedError
+
+    def delete_recipe(self, name, changes=()):
+        raise NotImplementedError
+
+    def set_ingredient_image(self, recipe_name, index, image, changes=()):
+        raise NotImplementedError
+
+    def add_favorite(self, username, recipe_name, changes=()):
+        raise NotImplementedError
+
+    def remove_favorite(self, username, recipe_name, changes=()):
+        raise NotImplementedError
+
+    # (name, recipe) pairs, for callers that convert recipes as they go
+    # rather than holding the whole dict at once
+    def iter_recipes(self):
+        return iter(self.load_recipes().items())
+
+    # Reads for callers that do not keep the whole catalog in memory (the
+    # share server). These defaults go through load_recipes(); backends that
+    # can look rows up directly override them.
+    def find_recipe(self, slug):
+        recipes = self.load_recipes()
+        name = SlugMap(recipes).get(slug)
+        return (name, recipes[name]) if name is not None else None
+
+    def iter_favorite_recipes(self, username):
+        recipes = self.load_recipes()
+        for name in self.load_favorites().get(username, []):
+            if name in recipes:
+                yield name, recipes[name]
+
+    def iter_authored_recipes(self, author):
+        for name, recipe in self.load_recipes().items():
+            if recipe.get("author") == author:
+                yield name, recipe
+
+    def save_users(self, users):
+        raise NotImplementedError
+
+    def save_recipes(self, recipes, changes=()):
+        raise NotImplementedError
+
+    def save_favorites(self, favorites):
+        raise NotImplementedError
+
+    def is_empty(self):
+        return not self.load_users() and not self.load_recipes()
+
+    # Cheap token that changes whenever the stored data changes, including
+    # writes made by other processes. Used to invalidate in-memory caches.
+    def version(self):
+        raise NotImplementedError
+
+    # What was written after `version`, as (version, users, recipes,
+    # favorites): the version the changes run up to and the current value of
+    # every user, recipe and user's favorites list written since (None for
+    # a deleted one). None if the backend cannot tell, e.g. because that
+    # part of its history is gone, or if more than `limit` entries changed;
+    # the caller then reloads everything.
+    def changes_since(self, version, limit):
+        return None
+
+    # Rewrite the stored documents so earlier writes no longer have to be
+    # replayed on load; only the JSON backend has anything to do. Returns
+    # (before, after) versions like a write.
+    def compact(self):
+        version = self.version()
+        return version, version
+
+    def close(self):
+        pass
+
+
+# The original storage format: one JSON document per collection, used as a
+# snapshot. Changes are not written into the documents directly: each one is
+# appended to an operation log (see oplog.py), fsynced, and replayed on top of
+# the snapshot when loading. Once the log grows past COMPACT_BYTES a
+# background thread folds it into fresh documents and starts a new log.
+#
+# Change feed rows go to their own database (FEED_FILE), appended after the
+# operation log while the lock is still held; a crash in between loses the
+# rows of that one write.
+#
+# Writers take a lock file in the data directory and first replay whatever
+# other processes appended since their last read, so concurrent sessions
+# merge instead of clobbering each other; documents are only ever replaced
+# atomically, so a crash never leaves a truncated file.
+class JSONStorage(Storage):
+    def __init__(self, data_dir, compact_bytes=None):
+        self.user_file = os.path.join(data_dir, USER_DATA_FILE)
+        self.recipe_file = os.path.join(data_dir, RECIPE_DATA_FILE)
+        self.favorites_file = os.path.join(data_dir, FAVORITES_DATA_FILE)
+        self.oplog = OpLog(os.path.join(data_dir, OPLOG_FILE))
+        self.feed_path = os.path.join(data_dir, FEED_FILE)
+        self._feed = None
+        self.compact_bytes = COMPACT_BYTES if compact_bytes is None else compact_bytes
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(data_dir, LOCK_FILE))
+        self._loaded_version = None
+        self._log_offset = 0
+        self._compacting = False
+        self._reload_if_changed()
+
+    @staticmethod
+    def _read(path):
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _snapshot_version(self):
+        token = []
+        for path in (self.user_file, self.recipe_file, self.favorites_file):
+            try:
+                stat = os.stat(path)
+                token.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except FileNotFoundError:
+                token.append(None)
+        return tuple(token)
+
+    # Bring the in-memory state up to date: re-read the snapshot if it was
+    # replaced (or the log was reset), then replay the log from where the
+    # last read stopped
+    def _reload_if_changed(self):
+        with self._lock:
+            version = self.version()
+            if version == self._loaded_version:
+                return
+            loaded = self._loaded_version
+            log_stat = version[1]
+            if (loaded is None or version[0] != loaded[0] or log_stat is None
+                    or loaded[1] is None or log_stat[0] != loaded[1][0] or log_stat[1] < self._log_offset):
+                self._users = self._read(self.user_file)
+                self._recipes = self._read(self.recipe_file)
+                self._favorites = self._read(self.favorites_file)
+                self._slugs = SlugMap(self._recipes)
+                self._log_offset = 0
+            ops, self._log_offset = self.oplog.read_from(self._log_offset)
+            for op in ops:
+                self._apply(op)
+            self._loaded_version = version
+
+    def _apply(self, op):
+        kind = op["op"]
+        if kind == "save_user":
+            self._users[op["user"]] = op["password"]
+        elif kind == "upsert_recipe":
+            self._recipes[op["name"]] = op["recipe"]
+            self._slugs.add(op["name"])
+        elif kind == "delete_recipe":
+            self._recipes.pop(op["name"], None)
+            self._slugs.discard(op["name"])
+        elif kind == "add_ingredient_photo":
+            recipe = self._recipes.get(op["recipe"])
+            if recipe is not None and op["index"] < len(recipe["ingredients"]):
+                ingredients = list(recipe["ingredients"])
+                ingredients[op["index"]] = dict(ingredients[op["index"]], image=op["image"])
+                self._recipes[op["recipe"]] = dict(recipe, ingredients=ingredients)
+        elif kind == "add_favorite":
+            names = self._favorites.setdefault(op["user"], [])
+            if op["recipe"] not in names:
+                names.append(op["recipe"])
+        elif kind == "remove_favorite":
+            names = self._favorites.get(op["user"], [])
+            if op["recipe"] in names:
+                names.remove(op["recipe"])
+        else:
+            raise ValueError(f"Unknown operation: {kind}")
+
+    # Opened on first use, so reading legacy files does not create it
+    @property
+    def feed(self):
+        if self._feed is None:
+            self._feed = ChangeFeed(SQLiteDatabase(self.feed_path))
+        return self._feed
+
+    def _favorited_by(self):
+        users = {}
+        for username, names in self._favorites.items():
+            for name in names:
+                users.setdefault(name, []).append(username)
+        return lambda name: users.get(name, ())
+
+    # Append operations under the lock, on top of the latest stored state
+    def _log(self, ops, changes=()):
+        with self._lock, self._file_lock:
+            before = self.version()
+            self._reload_if_changed()
+            if self.oplog.size() > self._log_offset:
+                # A torn line left by a crashed writer
+                self.oplog.truncate(self._log_offset)
+            self.oplog.append(ops)
+            for op in ops:
+                self._apply(op)
+            self._log_offset = self.oplog.size()
+            after = self._loaded_version = self.version()
+            if changes:
+                favorited_by = self._favorited_by() if any(change[0] == RECIPE for change in changes) else None
+                self.feed.append(ChangeFeed.rows(changes, favorited_by))
+        if changes:
+            self.feed.prune_if_due()
+        if self._log_offset > self.compact_bytes:
+            self._start_compaction()
+        return before, after
+
+    def _start_compaction(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    # Fold the log into new snapshot documents and start an empty log
+    def compact(self):
+        try:
+            with self._lock, self._file_lock:
+                before = self.version()
+                self._reload_if_changed()
+                if self._log_offset == 0:
+                    return before, before
+                write_file(self.user_file, json.dumps(self._users).encode())
+                write_file(self.recipe_file, json.dumps(self._recipes).encode())
+                write_file(self.favorites_file, json.dumps(self._favorites).encode())
+                self.oplog.reset()
+                self._log_offset = 0
+                self._loaded_version = self.version()
+                return before, self._loaded_version
+        finally:
+            self._compacting = False
+
+    def load_users(self):
+        with self._lock:
+            self._reload_if_changed()
+            return dict(self._users)
+
+    def load_recipes(self):
+        with self._lock:
+            self._reload_if_changed()
+            return dict(self._recipes)
+
+    def load_favorites(self):
+        with self._lock:
+            self._reload_if_changed()
+            return {username: list(names) for username, names in self._favorites.items()}
+
+    def find_recipe(self, slug):
+        with self._lock:
+            self._reload_if_changed()
+            name = self._slugs.get(slug)
+            return (name, self._recipes[name]) if name is not None else None
+
+    def save_user(self, username, password):
+        return self._log([{"op": "save_user", "user": username, "password": password}])
+
+    def save_recipe(self, name, recipe, changes=()):
+        return self._log([{"op": "upsert_recipe", "name": name, "recipe": recipe}], changes)
+
+    def delete_recipe(self, name, changes=()):
+        return self._log([{"op": "delete_recipe", "name": name}], changes)
+
+    def set_ingredient_image(self, recipe_name, index, image, changes=()):
+        return self._log([{"op": "add_ingredient_photo", "recipe": recipe_name, "index": index, "image": image}],
+                         changes)
+
+    def add_favorite(self, username, recipe_name, changes=()):
+        return self._log([{"op": "add_favorite", "user": username, "recipe": recipe_name}], changes)
+
+    def remove_favorite(self, username, recipe_name, changes=()):
+        return self._log([{"op": "remove_favorite", "user": username, "recipe": recipe_name}], changes)
+
+    def save_users(self, users):
+        return self._log([{"op": "save_user", "user": username, "password": password}
+                          for username, password in users.items()])
+
+    def save_recipes(self, recipes, changes=()):
+        return self._log([{"op": "upsert_recipe", "name": name, "recipe": recipe}
+                          for name, recipe in recipes.items()], changes)
+
+    def save_favorites(self, favorites):
+        return self._log([{"op": "add_favorite", "user": username, "recipe": name}
+                          for username, names in favorites.items() for name in names])
+
+    def is_empty(self):
+        return not (os.path.exists(self.user_file) or os.path.exists(self.recipe_file)
+                    or self.oplog.size())
+
+    def version(self):
+        return (self._snapshot_version(), self.oplog.stat())
+
+    # Read back from the operation log, as long as it still holds everything
+    # written since `version` (it is replaced when compacted)
+    def changes_since(self, version, limit):
+        with self._lock, self._file_lock:
+            self._reload_if_changed()
+            current = self._loaded_version
+            if version == current:
+                return current, {}, {}, {}
+            if version is None or version[0] != current[0]:
+                return None
+            seen_log, log = version[1], current[1]
+            if seen_log is None:
+                # No log yet back then: all of it is newer
+                offset = 0
+            elif log is None or seen_log[0] != log[0] or seen_log[1] > log[1]:
+                return None
+            else:
+                offset = seen_log[1]
+            ops, _ = self.oplog.read_from(offset)
+            users, recipes, favorites = set(), set(), set()
+            for op in ops:
+                kind = op["op"]
+                if kind == "save_user":
+                    users.add(op["user"])
+                elif kind in ("upsert_recipe", "delete_recipe"):
+                    recipes.add(op["name"])
+                elif kind == "add_ingredient_photo":
+                    recipes.add(op["recipe"])
+                else:
+                    favorites.add(op["user"])
+            if len(users) + len(recipes) + len(favorites) > limit:
+                return None
+            return (current,
+                    {username: self._users.get(username) for username in users},
+                    {name: self._recipes.get(name) for name in recipes},
+                    {username: list(self._favorites.get(username, ())) for username in favorites})
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipes (
+    name TEXT PRIMARY KEY,
+    ingredients TEXT NOT NULL,
+    instructions TEXT,
+    image TEXT,
+    author TEXT,
+    date_added TEXT
+);
+CREATE TABLE IF NOT EXISTS favorites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    recipe TEXT NOT NULL,
+    UNIQUE (username, recipe)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('database_id', abs(random()));
+CREATE TABLE IF NOT EXISTS writes (
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS writes_version ON writes (version);
+INSERT OR IGNORE INTO meta (key, value) SELECT 'writes_from', value FROM meta WHERE key = 'version';
+CREATE INDEX IF NOT EXISTS recipes_slug ON recipes (lower(replace(name, ' ', '-')));
+CREATE INDEX IF NOT EXISTS recipes_author ON recipes (author);
+CREATE INDEX IF NOT EXISTS favorites_recipe ON favorites (recipe);
+"""
+
+
+# One SQLite database in WAL mode, so readers in other sessions or processes
+# never block on a writer, with a connection per thread. Write transactions
+# take SQLite's lock up front (BEGIN IMMEDIATE), so writers serialize instead
+# of failing to upgrade a read lock.
+class SQLiteDatabase:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Reads that see one consistent state of the database
+    @contextmanager
+    def snapshot(self):
+        conn = self.conn()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# SQLite backend: one row per user, recipe and favorite, so a write only
+# touches the rows that changed. The change feed's tables live in the same
+# database, and a write's feed rows are inserted in its transaction.
+#
+# Each write also records the keys it touched in the `writes` table under
+# its version, for changes_since(); only the last WRITES_KEPT versions are
+# kept, and meta's 'writes_from' is the version from which the table is
+# complete.
+class SQLiteStorage(Storage):
+    def __init__(self, path):
+        self.path = path
+        self.db = SQLiteDatabase(path)
+        self._conn().executescript(SCHEMA)
+        self.feed = ChangeFeed(self.db)
+
+    def _conn(self):
+        return self.db.conn()
+
+    # Every write runs in one transaction that also bumps the data version,
+    # records the (kind, key) pairs in `written` and inserts the feed rows of
+    # `changes`; the (before, after) versions are handed back to the caller
+    @contextmanager
+    def _transaction(self, written, changes=()):
+        with self.db.transaction() as conn:
+            database_id, before = self._version(conn)
+            versions = [(database_id, before), (database_id, before + 1)]
+            yield conn, versions
+            after = before + 1
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (after,))
+            conn.executemany("INSERT INTO writes (version, kind, key) VALUES (?, ?, ?)",
+                             ((after, kind, key) for kind, key in written))
+            if after % WRITES_PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM writes WHERE version <= ?", (after - WRITES_KEPT,))
+                conn.execute("UPDATE meta SET value = max(value, ?) WHERE key = 'writes_from'",
+                             (after - WRITES_KEPT,))
+            if changes:
+                self.feed.insert(conn, ChangeFeed.rows(changes, lambda name: [
+                    username for (username,) in conn.execute("SELECT username FROM favorites WHERE recipe = ?",
+                                                             (name,))]))
+        if changes:
+            self.feed.prune_if_due()
+
+    @staticmethod
+    def _recipe_row(name, recipe):
+        return (name, json.dumps(recipe["ingredients"]), recipe.get("instructions", ""),
+                recipe.get("image"), recipe.get("author"), recipe.get("date_added"))
+
+    def load_users(self):
+        return dict(self._conn().execute("SELECT username, password FROM users"))
+
+    RECIPE_COLUMNS = "name, ingredients, instructions, image, author, date_added"
+
+    @staticmethod
+    def _row_recipe(row):
+        name, ingredients, instructions, image, author, date_added = row
+        return name, {
+            "ingredients": json.loads(ingredients),
+            "instructions": instructions,
+            "image": image,
+            "author": author,
+            "date_added": date_added,
+        }
+
+    def load_recipes(self):
+        rows = self._conn().execute(f"SELECT {self.RECIPE_COLUMNS} FROM recipes")
+        return dict(map(self._row_recipe, rows))
+
+    def iter_recipes(self):
+        return map(self._row_recipe, self._conn().execute(f"SELECT {self.RECIPE_COLUMNS} FROM recipes"))
+
+    def find_recipe(self, slug):
+        row = self._conn().execute(
+            f"SELECT {self.RECIPE_COLUMNS} FROM recipes WHERE lower(replace(name, ' ', '-')) = ? "
+            "ORDER BY name LIMIT 1", (slug,)).fetchone()
+        return self._row_recipe(row) if row else None
+
+    def iter_favorite_recipes(self, username):
+        rows = self._conn().execute(
+            "SELECT r.name, r.ingredients, r.instructions, r.image, r.author, r.date_added "
+            "FROM favorites f JOIN recipes r ON r.name = f.recipe WHERE f.username = ? ORDER BY f.id",
+            (username,))
+        return map(self._row_recipe, rows)
+
+    def iter_authored_recipes(self, author):
+        rows = self._conn().execute(
+            f"SELECT {self.RECIPE_COLUMNS} FROM recipes WHERE author = ? ORDER BY name", (author,))
+        return map(self._row_recipe, rows)
+
+    def load_favorites(self):
+        favorites = {}
+        rows = self._conn().execute("SELECT username, recipe FROM favorites ORDER BY id")
+        for username, recipe in rows:
+            favorites.setdefault(username, []).append(recipe)
+        return favorites
+
+    def save_user(self, username, password):
+        with self._transaction([("user", username)]) as (conn, versions):
+            conn.execute("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)",
+                         (username, password))
+        return tuple(versions)
+
+    def save_recipe(self, name, recipe, changes=()):
+        with self._transaction([("recipe", name)], changes) as (conn, versions):
+            conn.execute("INSERT OR REPLACE INTO recipes VALUES (?, ?, ?, ?, ?, ?)",
+                         self._recipe_row(name, recipe))
+        return tuple(versions)
+
+    def delete_recipe(self, name, changes=()):
+        with self._transaction([("recipe", name)], changes) as (conn, versions):
+            conn.execute("DELETE FROM recipes WHERE name = ?", (name,))
+        return tuple(versions)
+
+    def set_ingredient_image(self, recipe_name, index, image, changes=()):
+        with self._transaction([("recipe", recipe_name)], changes) as (conn, versions):
+            row = conn.execute("SELECT ingredients FROM recipes WHERE name = ?", (recipe_name,)).fetchone()
+            if row is not None:
+                ingredients = json.loads(row[0])
+                if index < len(ingredients):
+                    ingredients[index]["image"] = image
+                    conn.execute("UPDATE recipes SET ingredients = ? WHERE name = ?",
+                                 (json.dumps(ingredients), recipe_name))
+        return tuple(versions)
+
+    def add_favorite(self, username, recipe_name, changes=()):
+        with self._transaction([("favorites", username)], changes) as (conn, versions):
+            conn.execute("INSERT OR IGNORE INTO favorites (username, recipe) VALUES (?, ?)",
+                         (username, recipe_name))
+        return tuple(versions)
+
+    def remove_favorite(self, username, recipe_name, changes=()):
+        with self._transaction([("favorites", username)], changes) as (conn, versions):
+            conn.execute("DELETE FROM favorites WHERE username = ? AND recipe = ?",
+                         (username, recipe_name))
+        return tuple(versions)
+
+    def save_users(self, users):
+        with self._transaction([("user", username) for username in users]) as (conn, versions):
+            conn.executemany("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)",
+                             users.items())
+        return tuple(versions)
+
+    def save_recipes(self, recipes, changes=()):
+        with self._transaction([("recipe", name) for name in recipes], changes) as (conn, versions):
+            conn.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?, ?, ?, ?, ?)",
+                             (self._recipe_row(name, recipe) for name, recipe in recipes.items()))
+        return tuple(versions)
+
+    def save_favorites(self, favorites):
+        with self._transaction([("favorites", username) for username in favorites]) as (conn, versions):
+            conn.executemany("INSERT OR IGNORE INTO favorites (username, recipe) VALUES (?, ?)",
+                             ((username, name) for username, names in favorites.items() for name in names))
+        return tuple(versions)
+
+    def is_empty(self):
+        conn = self._conn()
+        return (conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+                and conn.execute("SELECT 1 FROM recipes LIMIT 1").fetchone() is None)
+
+    # (database id, write counter): the id is random and set when the
+    # database is created, so a version saved for a deleted and recreated
+    # database (whose counter starts over) never matches the new one
+    @staticmethod
+    def _version(conn):
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('database_id', 'version')"))
+        return meta["database_id"], meta["version"]
+
+    def version(self):
+        return self._version(self._conn())
+
+    def changes_since(self, version, limit):
+        with self.db.snapshot() as conn:
+            current = self._version(conn)
+            writes_from = conn.execute("SELECT value FROM meta WHERE key = 'writes_from'").fetchone()[0]
+            if version is None or version[0] != current[0] or not writes_from <= version[1] <= current[1]:
+                return None
+            written = conn.execute("SELECT DISTINCT kind, key FROM writes WHERE version > ? LIMIT ?",
+                                   (version[1], limit + 1)).fetchall()
+            if len(written) > limit:
+                return None
+            users, recipes, favorites = {}, {}, {}
+            for kind, key in written:
+                if kind == "user":
+                    row = conn.execute("SELECT password FROM users WHERE username = ?", (key,)).fetchone()
+                    users[key] = row[0] if row else None
+                elif kind == "recipe":
+                    row = conn.execute(f"SELECT {self.RECIPE_COLUMNS} FROM recipes WHERE name = ?",
+                                       (key,)).fetchone()
+                    recipes[key] = self._row_recipe(row)[1] if row else None
+                else:
+                    favorites[key] = [name for (name,) in conn.execute(
+                        "SELECT recipe FROM favorites WHERE username = ? ORDER BY id", (key,))]
+            return current, users, recipes, favorites
+
+    def close(self):
+        self.db.close()
+
+
+# Copy everything from one backend into another
+def migrate(source, target):
+    target.save_users(source.load_users())
+    target.save_recipes(source.load_recipes())
+    target.save_favorites(source.load_favorites())
+
+
+def migrate_json_to_sqlite(data_dir, db_path=None):
+    db_path = db_path or os.path.join(data_dir, DATABASE_FILE)
+    target = SQLiteStorage(db_path)
+    migrate(JSONStorage(data_dir), target)
+    return target
+
+
+# Open the configured backend. RECIPE_STORAGE selects "sqlite" (default) or
+# "json"; the first time the SQLite database is created it is filled from
+# any existing JSON files so no data is left behind.
+def open_storage(data_dir, backend=None):
+    backend = backend or os.environ.get("RECIPE_STORAGE", "sqlite")
+    if backend == "json":
+        return JSONStorage(data_dir)
+    if backend != "sqlite":
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    db_path = os.path.join(data_dir, DATABASE_FILE)
+    is_new = not os.path.exists(db_path)
+    storage = SQLiteStorage(db_path)
+    if is_new:
+        legacy = JSONStorage(data_dir)
+        if not legacy.is_empty():
+            migrate(legacy, storage)
+    return storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Copy the JSON data files into SQLite")
+    migrate_parser.add_argument("--data-dir", default="data")
+    migrate_parser.add_argument("--db", default=None, help="Target database (default: <data-dir>/recipes.db)")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        storage = migrate_json_to_sqlite(args.data_dir, args.db)
+        print(f"Migrated {len(storage.load_users())} users, {len(storage.load_recipes())} recipes "
+              f"and {sum(len(v) for v in storage.load_favorites().values())} favorites "
+              f"into {storage.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The app's modules are imported top-level, as when running from recipe_app/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def backend(request):
+    return request.param
@@ -0,0 +1,98 @@
+import pytest
+
+import storage
+from core import Services
+from datastore import DataStore
+
+
+def recipe(author, *ingredients):
+    return {
+        "ingredients": [{"name": name, "image": None} for name in ingredients],
+        "instructions": "",
+        "image": None,
+        "author": author,
+        "date_added": "2024-01-01 00:00:00",
+    }
+
+
+def contents(store):
+    return ({name: recipe.to_dict() for name, recipe in store.recipes.items()}, store.favorites, store.users,
+            {username: (s.recipes, s.favorites) for username, s in store.stats.users.items()
+             if s.recipes or s.favorites})
+
+
+@pytest.fixture
+def processes(backend, tmp_path):
+    # Two stores over the same data, as in two server processes
+    writer = Services(str(tmp_path), backend)
+    writer.store.save_recipes({"Bread": recipe("alice", "flour"), "Soup": recipe("alice", "leek")})
+    writer.store.add_favorite("bob", "Soup")
+    reader = Services(str(tmp_path), backend)
+    loads = []
+    load = reader.store.load
+    reader.store.load = lambda: (loads.append(1), load())
+    yield writer.store, reader.store, loads
+    writer.close()
+    reader.close()
+
+
+def test_refresh_applies_other_writers_changes_without_reloading(processes):
+    writer, reader, loads = processes
+    writer.save_user("carol", "secret")
+    writer.save_recipe("Stew", recipe("carol", "beef"))
+    writer.save_recipe("Soup", recipe("bob", "leek", "potato"))
+    writer.set_ingredient_image("Bread", 0, "a" * 64)
+    writer.add_favorite("bob", "Stew")
+    writer.remove_favorite("bob", "Soup")
+    writer.storage.delete_recipe("Bread")
+
+    assert reader.refresh_if_stale()
+    assert not loads
+    assert contents(reader) == contents(DataStore(writer.storage))
+    assert reader.indexes[0].search("potato") == {"Soup"}
+    assert reader.indexes[0].search("bread") == set()
+    assert not reader.refresh_if_stale()
+
+
+def test_own_write_after_a_foreign_one_catches_up(processes):
+    writer, reader, loads = processes
+    writer.save_recipe("Stew", recipe("carol", "beef"))
+    reader.save_recipe("Pie", recipe("bob", "apple"))
+    assert reader.refresh_if_stale()
+    assert not loads
+    assert set(reader.recipes) == {"Bread", "Soup", "Stew", "Pie"}
+
+
+def test_large_changes_reload(processes, monkeypatch):
+    writer, reader, loads = processes
+    monkeypatch.setattr("datastore.CATCH_UP_LIMIT", 2)
+    writer.save_recipes({f"Recipe {i}": recipe("alice", "salt") for i in range(3)})
+    assert reader.refresh_if_stale()
+    assert loads
+    assert len(reader.recipes) == 5
+
+
+def test_pruned_history_reloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "WRITES_KEPT", 2)
+    monkeypatch.setattr(storage, "WRITES_PRUNE_EVERY", 1)
+    writer = Services(str(tmp_path), "sqlite")
+    reader = Services(str(tmp_path), "sqlite")
+    for i in range(4):
+        writer.store.save_recipe(f"Recipe {i}", recipe("alice", "salt"))
+    assert reader.store.storage.changes_since(reader.store._seen, 100) is None
+    assert reader.store.refresh_if_stale()
+    assert len(reader.store.recipes) == 4
+    writer.close()
+    reader.close()
+
+
+def test_compacted_log_reloads(tmp_path):
+    writer = Services(str(tmp_path), "json")
+    reader = Services(str(tmp_path), "json")
+    writer.store.save_recipe("Stew", recipe("carol", "beef"))
+    writer.store.storage.compact()
+    assert reader.store.storage.changes_since(reader.store._seen, 100) is None
+    assert reader.store.refresh_if_stale()
+    assert set(reader.store.recipes) == {"Stew"}
+    writer.close()
+    reader.close()
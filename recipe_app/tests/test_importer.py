@@ -0,0 +1,113 @@
+import io
+import json
+
+import pytest
+
+from core import Services
+from importer import detect_format, import_recipes
+
+
+def jsonl(*rows):
+    return io.BytesIO("".join(json.dumps(row) + "\n" for row in rows).encode())
+
+
+@pytest.fixture
+def services(backend, tmp_path):
+    services = Services(str(tmp_path), backend)
+    services.store.save_recipes({
+        "Bread": {"ingredients": [{"name": "flour", "image": None}], "instructions": "Bake.",
+                  "image": None, "author": "alice", "date_added": "2024-01-01 00:00:00"},
+        "Stew": {"ingredients": [{"name": "beef", "image": None}], "instructions": "Simmer.",
+                 "image": None, "author": "bob", "date_added": "2024-01-01 00:00:00"},
+    })
+    yield services
+    services.close()
+
+
+def test_malformed_rows_are_counted_not_imported(services):
+    rows = jsonl(
+        {"name": "Pancakes", "ingredients": "flour; milk;  ; Milk"},
+        {"name": "  ", "ingredients": ["eggs"]},
+        {"name": "No Ingredients", "ingredients": []},
+        {"name": "Not A List", "ingredients": 42},
+        {"ingredients": ["salt"]},
+        {"name": "Pancakes", "ingredients": ["butter"]},
+        {"name": "pancakes", "ingredients": ["butter"]},
+        {"name": "Bread", "ingredients": ["rye"]},
+        {"name": "bread", "ingredients": ["rye"]},
+    )
+    result = import_recipes(services.store, rows, "jsonl", batch_size=2, author="admin")
+    assert (result.imported, result.invalid, result.duplicates) == (1, 4, 4)
+    assert "pancakes" not in services.store.recipes and "bread" not in services.store.recipes
+    pancakes = services.store.recipes["Pancakes"].to_dict()
+    assert [i["name"] for i in pancakes["ingredients"]] == ["flour", "milk"]
+    assert pancakes["author"] == "admin"
+    assert services.store.recipes["Bread"].author == "alice"
+
+
+def test_csv_rows(services):
+    rows = io.BytesIO(b"name,ingredients,author\n"
+                      b"Salad,\"lettuce, tomato\",carol\n"
+                      b",cheese,carol\n"
+                      b"Toast,,carol\n")
+    result = import_recipes(services.store, rows, "csv", author="admin")
+    assert (result.imported, result.invalid) == (1, 2)
+    assert services.store.recipes["Salad"].author == "carol"
+    assert services.store.recipes["Salad"].ingredient_names() == ["lettuce", "tomato"]
+
+
+def test_json_documents(services):
+    assert detect_format("recipes.json") == "json"
+    mapping = io.BytesIO(json.dumps({
+        "Soup": {"ingredients": [{"name": "leek", "image": None}], "instructions": "Boil.",
+                 "image": None, "author": "carol", "date_added": "2024-02-01 00:00:00"},
+        "Broken": {"instructions": "Nothing to cook with."},
+    }).encode())
+    result = import_recipes(services.store, mapping, "json")
+    assert (result.imported, result.invalid) == (1, 1)
+    assert services.store.recipes["Soup"].to_dict()["date_added"] == "2024-02-01 00:00:00"
+
+    listed = io.BytesIO(json.dumps([{"name": "Rice", "ingredients": ["rice"]}, "junk"]).encode())
+    result = import_recipes(services.store, listed, "json")
+    assert (result.imported, result.invalid) == (1, 1)
+
+    # JSON lines saved as .json
+    result = import_recipes(services.store, jsonl({"name": "Tea", "ingredients": ["tea"]},
+                                                  {"name": "Milk", "ingredients": ["milk"]}), "json")
+    assert result.imported == 2
+
+    with pytest.raises(ValueError):
+        import_recipes(services.store, io.BytesIO(b'"just a string"'), "json")
+
+
+def test_command_line_trusts_authors_and_replaces_anything(services):
+    rows = jsonl({"name": "Stew", "ingredients": ["lamb"], "author": "carol"})
+    result = import_recipes(services.store, rows, "jsonl", author="admin", replace=True)
+    assert result.imported == 1
+    assert services.store.recipes["Stew"].author == "carol"
+
+
+def test_app_import_is_attributed_to_the_user(services):
+    rows = jsonl(
+        {"name": "Bread", "ingredients": ["rye"], "author": "bob"},
+        {"name": "Stew", "ingredients": ["lamb"], "author": "alice"},
+        {"name": "Cake", "ingredients": ["sugar"], "author": "bob"},
+    )
+    result = import_recipes(services.store, rows, "jsonl", author="alice", replace=True, owner="alice")
+    assert (result.imported, result.duplicates) == (2, 1)
+    recipes = services.store.recipes
+    assert recipes["Bread"].author == "alice"
+    assert recipes["Bread"].ingredient_names() == ["rye"]
+    assert recipes["Cake"].author == "alice"
+    # Bob's recipe is left alone
+    assert recipes["Stew"].author == "bob"
+    assert recipes["Stew"].ingredient_names() == ["beef"]
+
+
+def test_import_service(services):
+    result = services.imports.import_file("carol", jsonl({"name": "Tea", "ingredients": ["tea"], "author": "bob"}),
+                                          "upload.jsonl")
+    assert result.imported == 1
+    assert services.store.recipes["Tea"].author == "carol"
+    with pytest.raises(ValueError):
+        services.imports.import_file("carol", io.BytesIO(b""), "upload.txt")
@@ -0,0 +1,119 @@
+import random
+from array import array
+
+import pytest
+
+from compact import CompactRecipe
+from ingredient_index import IngredientIndex, bit_positions, ingredient_key, to_bits
+
+VOCABULARY = [f"Ingredient {i}" for i in range(200)]
+
+
+def compact(*ingredients):
+    return CompactRecipe.from_dict({
+        "ingredients": [{"name": name, "image": None} for name in ingredients],
+        "instructions": "",
+        "image": None,
+        "author": "alice",
+        "date_added": "2024-01-01 00:00:00",
+    })
+
+
+def catalog(rng, count, start=0):
+    # A few ingredients in nearly every recipe, the rest rare
+    return {f"Recipe {i}": compact(*rng.sample(VOCABULARY[:3], rng.randint(0, 2)),
+                                   *rng.sample(VOCABULARY[3:], rng.randint(1, 5)))
+            for i in range(start, start + count)}
+
+
+# What match() should return, worked out recipe by recipe
+def expected(recipes, pantry, max_missing=None):
+    pantry = {ingredient_key(name) for name in pantry}
+    rows = []
+    for name, recipe in recipes.items():
+        keys = {ingredient_key(ingredient) for ingredient in recipe.ingredient_names()}
+        have, required = len(keys & pantry), len(keys)
+        if have and (max_missing is None or required - have <= max_missing):
+            rows.append((name, have, required))
+    rows.sort(key=lambda row: (-row[1] / row[2], row[2] - row[1], -row[1], row[0]))
+    return rows
+
+
+def check(index, recipes, rng):
+    for _ in range(20):
+        pantry = rng.sample(VOCABULARY[:40], rng.randint(1, 12))
+        for max_missing in (None, 0, 2):
+            want = expected(recipes, pantry, max_missing)
+            found = index.match(pantry, max_missing)
+            assert found.total == len(want)
+            assert found.select() == want
+            assert found.select(3, 9) == want[3:9]
+
+
+def test_bits_round_trip():
+    slots = [0, 7, 8, 63, 64, 200]
+    assert bit_positions(to_bits(slots, 201)) == slots
+    assert bit_positions(0) == []
+
+
+def test_matches_are_ranked_by_coverage():
+    index = IngredientIndex()
+    index.build({"Toast": compact("Bread", "Butter"), "Sandwich": compact("Bread", "Ham", "Cheese"),
+                 "Omelette": compact("Eggs", "Cheese")})
+    found = index.match([" bread ", "BUTTER", "cheese"])
+    assert found.select() == [("Toast", 2, 2), ("Sandwich", 2, 3), ("Omelette", 1, 2)]
+    assert index.match(["bread", "cheese"], max_missing=0).select() == []
+    assert index.match(["bread", "cheese"], max_missing=1).select() == [("Sandwich", 2, 3), ("Omelette", 1, 2),
+                                                                        ("Toast", 1, 2)]
+    assert index.match(["caviar"]).total == 0
+    assert index.known("Eggs") and not index.known("caviar")
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_sparse_and_dense_postings_match_a_brute_force(seed):
+    rng = random.Random(seed)
+    recipes = catalog(rng, 300)
+    index = IngredientIndex()
+    index.build(recipes)
+    kinds = {type(posting) for posting in index.postings.values()}
+    assert kinds == {int, array}
+    check(index, recipes, rng)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_updates_match_a_rebuild(seed):
+    rng = random.Random(seed)
+    recipes = catalog(rng, 100)
+    index = IngredientIndex()
+    index.build(recipes)
+
+    # Adds, edits, renames and deletes; new recipes reuse freed slots, and
+    # rare ingredients become dense as they spread
+    for name, recipe in catalog(rng, 60, start=100).items():
+        index.update(name, None, recipe)
+        recipes[name] = recipe
+    for name in rng.sample(sorted(recipes), 30):
+        new = compact(*rng.sample(VOCABULARY, rng.randint(1, 6)))
+        index.update(name, recipes[name], new)
+        recipes[name] = new
+    for name in rng.sample(sorted(recipes), 40):
+        old = recipes.pop(name)
+        index.update(name, old, None)
+        if rng.random() < 0.5:
+            index.update(f"{name} (renamed)", None, old)
+            recipes[f"{name} (renamed)"] = old
+    for ingredient in VOCABULARY[3:8]:
+        for i in range(20):
+            index.update(f"Spread {ingredient} {i}", None, compact(ingredient))
+            recipes[f"Spread {ingredient} {i}"] = compact(ingredient)
+
+    check(index, recipes, rng)
+    rebuilt = IngredientIndex()
+    rebuilt.build(recipes)
+    for key, posting in index.postings.items():
+        slots = bit_positions(posting) if isinstance(posting, int) else list(posting)
+        assert sorted(index.names[slot] for slot in slots) == \
+            sorted(rebuilt.names[slot] for slot in (bit_positions(rebuilt.postings[key])
+                                                    if isinstance(rebuilt.postings[key], int)
+                                                    else rebuilt.postings[key]))
+    assert set(index.postings) == set(rebuilt.postings)
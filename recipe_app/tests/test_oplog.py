@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+from oplog import OPLOG_FILE, OpLog
+from storage import RECIPE_DATA_FILE, JSONStorage
+
+
+def recipe(author):
+    return {"ingredients": [{"name": "flour", "image": None}], "instructions": "", "image": None,
+            "author": author, "date_added": "2024-01-01 00:00:00"}
+
+
+def test_read_from_leaves_a_torn_line_for_later(tmp_path):
+    log = OpLog(str(tmp_path / OPLOG_FILE))
+    log.append([{"op": "save_user", "user": "alice", "password": "x"}])
+    complete = log.size()
+    with open(log.path, 'ab') as f:
+        f.write(b'{"op": "save_user", "us')
+    ops, offset = log.read_from(0)
+    assert ops == [{"op": "save_user", "user": "alice", "password": "x"}]
+    assert offset == complete
+    assert log.read_from(offset) == ([], offset)
+
+
+def test_torn_last_line_is_ignored_and_replaced_by_the_next_write(tmp_path):
+    storage = JSONStorage(str(tmp_path))
+    storage.save_recipe("Bread", recipe("alice"))
+    # A writer that crashed halfway through its append
+    with open(tmp_path / OPLOG_FILE, 'ab') as f:
+        f.write(b'{"op": "upsert_recipe", "name": "Soup", "reci')
+
+    storage = JSONStorage(str(tmp_path))
+    assert list(storage.load_recipes()) == ["Bread"]
+    storage.add_favorite("alice", "Bread")
+
+    with open(tmp_path / OPLOG_FILE, 'rb') as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)["op"] for line in lines] == ["upsert_recipe", "add_favorite"]
+    storage = JSONStorage(str(tmp_path))
+    assert list(storage.load_recipes()) == ["Bread"]
+    assert storage.load_favorites() == {"alice": ["Bread"]}
+
+
+def _wait_for_compaction(storage):
+    deadline = time.monotonic() + 10
+    while (storage._compacting or not os.path.exists(storage.recipe_file)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_log_is_compacted_past_the_threshold(tmp_path):
+    storage = JSONStorage(str(tmp_path), compact_bytes=1000)
+    storage.save_user("alice", "x")
+    assert not os.path.exists(tmp_path / RECIPE_DATA_FILE)
+    assert storage.oplog.size() < 1000
+
+    for i in range(10):
+        storage.save_recipe(f"Recipe {i}", recipe("alice"))
+        storage.add_favorite("alice", f"Recipe {i}")
+    _wait_for_compaction(storage)
+    assert os.path.exists(tmp_path / RECIPE_DATA_FILE)
+
+    # Everything survives the fold into the snapshot, and later writes
+    # start a new log on top of it
+    storage.remove_favorite("alice", "Recipe 0")
+    reopened = JSONStorage(str(tmp_path))
+    assert reopened.load_users() == {"alice": "x"}
+    assert len(reopened.load_recipes()) == 10
+    assert reopened.load_favorites() == {"alice": [f"Recipe {i}" for i in range(1, 10)]}
+
+
+def test_replaying_a_log_already_in_the_snapshot_changes_nothing(tmp_path):
+    storage = JSONStorage(str(tmp_path))
+    storage.save_recipe("Bread", recipe("alice"))
+    storage.add_favorite("alice", "Bread")
+    with open(tmp_path / OPLOG_FILE, 'rb') as f:
+        log = f.read()
+    storage.compact()
+    # A crash between writing the snapshot and resetting the log
+    with open(tmp_path / OPLOG_FILE, 'wb') as f:
+        f.write(log)
+
+    reopened = JSONStorage(str(tmp_path))
+    assert list(reopened.load_recipes()) == ["Bread"]
+    assert reopened.load_favorites() == {"alice": ["Bread"]}
@@ -0,0 +1,194 @@
+import os
+
+from compact import CompactRecipe
+from core import Services
+from search_index import FUZZY_THRESHOLD, FUZZY_WORDS, INDEX_FILE, SearchIndex, term_words, word_grams
+
+STATE = ("recipes", "postings", "grams", "recipe_terms", "name_words", "ingredient_words", "ingredient_counts",
+         "word_grams", "word_sizes")
+
+
+def recipe(*ingredients, author="alice"):
+    return {
+        "ingredients": [{"name": name, "image": None} for name in ingredients],
+        "instructions": "",
+        "image": None,
+        "author": author,
+        "date_added": "2024-01-01 00:00:00",
+    }
+
+
+def compact(*ingredients):
+    return CompactRecipe.from_dict(recipe(*ingredients))
+
+
+def state(index):
+    return {attr: getattr(index, attr) for attr in STATE}
+
+
+def rebuilt(recipes):
+    index = SearchIndex()
+    index.build(recipes)
+    return state(index)
+
+
+def test_substring_search():
+    index = SearchIndex()
+    index.build({"Pasta Carbonara": compact("Pasta", "Egg"), "Egg Fried Rice": compact("Rice", "Egg"),
+                 "Tomato Soup": compact("Tomato")})
+    assert index.search("carbo") == {"Pasta Carbonara"}
+    assert index.search("EGG") == {"Pasta Carbonara", "Egg Fried Rice"}
+    # Shorter than a trigram
+    assert index.search("ri") == {"Egg Fried Rice"}
+    assert index.search("") == {"Pasta Carbonara", "Egg Fried Rice", "Tomato Soup"}
+    assert index.search("chocolate") == set()
+
+
+def test_add_rename_and_delete_match_a_rebuild():
+    recipes = {"Pasta Carbonara": compact("Pasta", "Egg"), "Tomato Soup": compact("Tomato", "Salt")}
+    index = SearchIndex()
+    index.build(recipes)
+
+    added = compact("Rice", "Egg", "Soy Sauce")
+    index.update("Egg Fried Rice", None, added)
+    recipes["Egg Fried Rice"] = added
+    assert state(index) == rebuilt(recipes)
+
+    renamed = recipes.pop("Tomato Soup")
+    index.update("Tomato Soup", renamed, None)
+    index.update("Cream of Tomato", None, renamed)
+    recipes["Cream of Tomato"] = renamed
+    assert state(index) == rebuilt(recipes)
+    assert index.search("soup") == set()
+
+    # Egg and rice stay indexed through the other recipes
+    index.update("Egg Fried Rice", added, None)
+    del recipes["Egg Fried Rice"]
+    assert state(index) == rebuilt(recipes)
+    assert index.search("soy") == set()
+    assert index.search("egg") == {"Pasta Carbonara"}
+
+
+# What fuzzy() should return, worked out from the definitions: Jaccard
+# similarity of padded trigrams, the FUZZY_WORDS most similar words per
+# query word, a recipe's best word per query word, averaged
+def fuzzy_brute_force(recipes, query):
+    words = {}
+    for name, recipe in recipes.items():
+        for word in term_words(name):
+            words.setdefault(word, set()).add(name)
+        for ingredient in recipe.ingredient_names():
+            for word in term_words(ingredient):
+                words.setdefault(word, set()).add(name)
+    query_words = term_words(query)
+    totals = {}
+    for query_word in query_words:
+        grams = word_grams(query_word)
+        similar = {}
+        for word in words:
+            score = len(grams & word_grams(word)) / len(grams | word_grams(word))
+            if score >= FUZZY_THRESHOLD:
+                similar[word] = score
+        similar = dict(sorted(similar.items(), key=lambda item: (-item[1], item[0]))[:FUZZY_WORDS])
+        best = {}
+        for word, score in similar.items():
+            if len(query_words) == 1 and query_word in word:
+                continue
+            for name in words[word]:
+                best[name] = max(best.get(name, 0.0), score)
+        for name, score in best.items():
+            totals[name] = totals.get(name, 0.0) + score
+    if len(query_words) == 1:
+        return totals
+    return {name: total / len(query_words) for name, total in totals.items()
+            if total >= FUZZY_THRESHOLD * len(query_words)}
+
+
+def test_fuzzy_matches_a_brute_force():
+    recipes = {"Chicken Curry": compact("Chicken", "Curry Paste", "Coconut Milk"),
+               "Spicy Chickpea Stew": compact("Chickpeas", "Chilli", "Tomato"),
+               "Curried Lentils": compact("Lentils", "Curry Powder"),
+               "Pasta Carbonara": compact("Pasta", "Eggs", "Pecorino"),
+               "Carrot Cake": compact("Carrots", "Flour", "Eggs"),
+               "Tomato Soup": compact("Tomatoes", "Basil")}
+    index = SearchIndex()
+    index.build(recipes)
+    for query in ("chiken", "cury", "spicey cury", "carbonarra", "tomatos", "pasta eggs", "zzqx", "lentil soop"):
+        found = index.fuzzy(query)
+        want = fuzzy_brute_force(recipes, query)
+        assert found.keys() == want.keys(), query
+        assert all(abs(found[name] - want[name]) < 1e-9 for name in want), query
+    assert "Chicken Curry" in index.fuzzy("chiken")
+    # Words containing a single query word are left to the exact search
+    assert "Chicken Curry" not in index.fuzzy("chick")
+
+
+def test_best_match_lists_exact_matches_then_similar_ones(backend, tmp_path):
+    services = Services(str(tmp_path), backend)
+    services.store.save_recipes({"Chicken Curry": recipe("Chicken", "Curry Paste"),
+                                 "Curried Lentils": recipe("Lentils", "Cumin"),
+                                 "Beef Curry": recipe("Beef", "Curry Paste"),
+                                 "Carrot Cake": recipe("Carrots", "Flour")})
+    index = services.store.indexes[0]
+
+    found = services.search.search("curry", "Best Match")
+    names = [r.name for r in found.page()]
+    assert names == ["Beef Curry", "Chicken Curry", "Curried Lentils"]
+    assert [found.score(name) for name in names] == [1.0, 1.0, index.fuzzy("curry")["Curried Lentils"]]
+    assert found.score("Curried Lentils") < 1.0
+
+    # No exact match: the similar recipes, in the chosen order
+    found = services.search.search("chiken cury", "Name (Z-A)")
+    assert [r.name for r in found.page()] == sorted(index.fuzzy("chiken cury"), reverse=True)
+    assert "Chicken Curry" in index.fuzzy("chiken cury")
+
+    # Writes reach the fuzzy words too
+    services.store.save_recipe("Chicken Curry", recipe("Tofu"))
+    assert "Chicken Curry" in index.fuzzy("tofo")
+    assert "Chicken Curry" not in index.fuzzy("pastte")
+    services.close()
+
+
+def test_store_writes_keep_the_index_equal_to_a_rebuild(backend, tmp_path):
+    services = Services(str(tmp_path), backend)
+    index = services.store.indexes[0]
+    services.store.save_recipes({"Pasta Carbonara": recipe("Pasta", "Egg"), "Tomato Soup": recipe("Tomato")})
+    services.store.save_recipe("Tomato Soup", recipe("Tomato", "Basil"))
+    services.store.set_ingredient_image("Pasta Carbonara", 1, "a" * 64)
+    assert state(index) == rebuilt(services.store.recipes)
+    assert index.search("basil") == {"Tomato Soup"}
+    services.close()
+
+
+def test_persisted_index_is_reused_only_for_the_same_data(backend, tmp_path):
+    services = Services(str(tmp_path), backend)
+    services.store.save_recipe("Tomato Soup", recipe("Tomato"))
+    services.close()
+    assert os.path.exists(tmp_path / INDEX_FILE)
+
+    # Written by another process while the index file was not updated
+    services = Services(str(tmp_path), backend)
+    services.store.storage.save_recipe("Pea Soup", recipe("Peas"))
+    services.close()
+
+    services = Services(str(tmp_path), backend)
+    assert services.store.indexes[0].search("soup") == {"Tomato Soup", "Pea Soup"}
+    services.close()
+
+
+def test_index_of_a_recreated_database_is_not_reused(tmp_path):
+    services = Services(str(tmp_path), "sqlite")
+    services.store.save_recipe("Tomato Soup", recipe("Tomato"))
+    services.close()
+    for name in os.listdir(tmp_path):
+        if name.startswith("recipes.db"):
+            os.remove(tmp_path / name)
+
+    # Same write count as the deleted database
+    services = Services(str(tmp_path), "sqlite")
+    services.store.save_recipe("Pea Soup", recipe("Peas"))
+    services.close()
+
+    services = Services(str(tmp_path), "sqlite")
+    assert services.store.indexes[0].search("soup") == {"Pea Soup"}
+    services.close()
@@ -0,0 +1,89 @@
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import pytest
+
+from core import Services
+from share_server import LOCAL_HOSTS, ShareServer, default_share_url, export_url, is_local_url, share_url
+
+
+@pytest.fixture
+def server(backend, tmp_path):
+    services = Services(str(tmp_path), backend)
+    services.store.save_recipes({
+        name: {"ingredients": [{"name": "flour", "image": None}], "instructions": "Bake.",
+               "image": None, "author": "alice", "date_added": "2024-01-01 00:00:00"}
+        for name in ("Bread", "Pasta Carbonara")
+    })
+    server = ShareServer(("127.0.0.1", 0), services.store.storage, services.blobs, "secret")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    services.close()
+
+
+def _path(url):
+    parts = urlsplit(url)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+
+def test_head_then_get_on_one_connection(server):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    path = _path(export_url("secret", "alice", "recipes", base=""))
+
+    conn.request("HEAD", path)
+    head = conn.getresponse()
+    assert head.status == 200
+    assert head.read() == b""
+
+    # Anything left over from the HEAD response would be read as this
+    # response's status line
+    conn.request("GET", path)
+    get = conn.getresponse()
+    assert get.status == 200
+    names = [json.loads(line)["name"] for line in get.read().splitlines()]
+    assert sorted(names) == ["Bread", "Pasta Carbonara"]
+
+    conn.request("GET", _path(share_url("Pasta Carbonara", base="")))
+    recipe = conn.getresponse()
+    assert recipe.status == 200
+    assert json.loads(recipe.read())["name"] == "Pasta Carbonara"
+    conn.close()
+
+
+def test_export_needs_the_signed_token(server):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    conn.request("GET", _path(export_url("secret", "alice", "recipes", base="")).replace("recipes", "favorites", 1))
+    response = conn.getresponse()
+    assert response.status == 403
+    response.read()
+    conn.close()
+
+
+def test_default_link_address():
+    assert default_share_url("127.0.0.1", 8502) == "http://localhost:8502"
+    assert is_local_url("http://localhost:8502")
+    assert not is_local_url(default_share_url("0.0.0.0", 8502)) or socket.getfqdn() in LOCAL_HOSTS
+    assert default_share_url("recipes.example.com", 80) == "http://recipes.example.com:80"
+
+
+def test_names_sharing_a_slug(backend, tmp_path):
+    services = Services(str(tmp_path), backend)
+    services.recipes.load()
+    storage = services.store.storage
+    assert storage.find_recipe("pasta-carbonara")[0] == "Pasta Carbonara"
+    assert services.recipes.name_conflict("pasta carbonara") == "Pasta Carbonara"
+    assert services.recipes.name_conflict("Pasta Carbonara") is None
+    assert services.recipes.name_conflict("Pasta Bake") is None
+
+    # Older data may already hold both; links then go to the first by name
+    services.store.save_recipe("pasta carbonara", services.store.recipes["Pasta Carbonara"].to_dict())
+    assert storage.find_recipe("pasta-carbonara")[0] == "Pasta Carbonara"
+    storage.delete_recipe("Pasta Carbonara")
+    assert storage.find_recipe("pasta-carbonara")[0] == "pasta carbonara"
+    assert storage.find_recipe("no-such-recipe") is None
+    services.close()
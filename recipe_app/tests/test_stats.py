@@ -0,0 +1,62 @@
+from datastore import DataStore
+from stats import StatsIndex
+from storage import open_storage
+
+IMAGE = "a" * 64
+
+
+def recipe(author, image=None, ingredient_images=()):
+    return {
+        "ingredients": [{"name": "flour", "image": None}]
+                       + [{"name": f"topping {i}", "image": image} for i, image in enumerate(ingredient_images)],
+        "instructions": "",
+        "image": image,
+        "author": author,
+        "date_added": "2024-01-01 00:00:00",
+    }
+
+
+def counts(stats):
+    return {username: (s.recipes, s.recipe_images, s.ingredient_images, s.favorites)
+            for username, s in stats.users.items() if (s.recipes, s.recipe_images, s.ingredient_images, s.favorites)}
+
+
+def rebuilt(store):
+    stats = StatsIndex()
+    stats.build(store.recipes, store.favorites)
+    return stats
+
+
+def test_writes_keep_the_stats_equal_to_a_rebuild(backend, tmp_path):
+    store = DataStore(open_storage(str(tmp_path), backend))
+    store.save_recipes({"Bread": recipe("alice", IMAGE), "Soup": recipe("alice", ingredient_images=[IMAGE, IMAGE]),
+                        "Stew": recipe("bob")})
+    assert store.stats.get("alice").recipes == 2
+    assert store.stats.get("alice").recipe_images == 1
+    assert store.stats.get("alice").ingredient_images == 2
+
+    # Re-authored, and the image moved from the recipe to an ingredient
+    store.save_recipe("Bread", recipe("bob", ingredient_images=[IMAGE]))
+    store.set_recipe_image("Stew", IMAGE)
+    store.set_ingredient_image("Soup", 0, IMAGE)
+    store.add_favorite("carol", "Bread")
+    store.add_favorite("carol", "Bread")
+    store.add_favorite("carol", "Soup")
+    store.remove_favorite("carol", "Soup")
+    store.remove_favorite("carol", "Soup")
+
+    assert counts(store.stats) == {"alice": (1, 0, 3, 0), "bob": (2, 1, 1, 0), "carol": (0, 0, 0, 1)}
+    assert counts(store.stats) == counts(rebuilt(store))
+    totals = store.stats.totals
+    assert (totals.recipes, totals.recipe_images, totals.ingredient_images, totals.favorites) == (3, 1, 4, 1)
+
+    # And the same after loading from storage
+    store.load()
+    assert counts(store.stats) == {"alice": (1, 0, 3, 0), "bob": (2, 1, 1, 0), "carol": (0, 0, 0, 1)}
+
+
+def test_unknown_user_has_empty_stats(backend, tmp_path):
+    store = DataStore(open_storage(str(tmp_path), backend))
+    stats = store.stats.get("nobody")
+    assert (stats.recipes, stats.recipe_images, stats.ingredient_images, stats.favorites) == (0, 0, 0, 0)
+    assert "nobody" not in store.stats.users
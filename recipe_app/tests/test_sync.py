@@ -0,0 +1,133 @@
+import pytest
+
+from core import LocalDevice, Services
+
+
+def recipe(author, image=None, ingredient_image=None):
+    return {
+        "ingredients": [{"name": "flour", "image": ingredient_image}, {"name": "water", "image": None}],
+        "instructions": "Mix.",
+        "image": image,
+        "author": author,
+        "date_added": "2024-01-01 00:00:00",
+    }
+
+
+@pytest.fixture
+def services(backend, tmp_path):
+    services = Services(str(tmp_path), backend)
+    services.store.save_recipes({name: recipe("alice") for name in ("Bread", "Pancakes", "Soup")})
+    services.store.save_recipe("Bob's Stew", recipe("bob"))
+    services.store.add_favorite("alice", "Bread")
+    yield services
+    services.close()
+
+
+def test_first_sync_is_a_snapshot(services):
+    phone = LocalDevice(services.sync, "alice", "Phone")
+    delta = phone.sync()
+    assert delta.full
+    assert phone.favorites == ["Bread"]
+    assert list(phone.recipes) == ["Bread"]
+    assert services.sync.devices("alice")[0][:2] == ("Phone", delta.until)
+
+
+def test_delta_pull_reads_only_changes_after_the_cursor(services):
+    phone = LocalDevice(services.sync, "alice", "Phone")
+    laptop = LocalDevice(services.sync, "alice", "Laptop")
+    cursor = phone.sync().until
+    laptop.sync()
+
+    laptop.add_favorite("Soup")
+    laptop.remove_favorite("Bread")
+    laptop.sync()
+    delta = phone.sync()
+
+    assert not delta.full
+    assert delta.since == cursor
+    assert delta.changes == 2
+    assert delta.added == ["Soup"]
+    assert delta.removed == ["Bread"]
+    assert list(delta.recipes) == ["Soup"]
+    assert phone.favorites == ["Soup"]
+
+    again = phone.sync()
+    assert again.changes == 0 and again.is_empty()
+    assert again.until == delta.until
+
+
+def test_recipe_edits_reach_only_interested_users(services):
+    phone = LocalDevice(services.sync, "alice", "Phone")
+    phone.sync()
+
+    # Not alice's and not one of her favorites: nothing to read
+    services.store.save_recipe("Bob's Stew", recipe("bob"))
+    assert phone.sync().changes == 0
+
+    # One of her favorites, edited by someone else
+    services.store.save_recipe("Bread", recipe("bob"))
+    delta = phone.sync()
+    assert delta.changes == 1
+    assert delta.recipes["Bread"]["author"] == "bob"
+
+
+def test_own_changes_are_not_sent_back(services):
+    phone = LocalDevice(services.sync, "alice", "Phone")
+    laptop = LocalDevice(services.sync, "alice", "Laptop")
+    phone.sync()
+    laptop.sync()
+
+    phone.add_favorite("Pancakes")
+    delta = phone.sync()
+    assert delta.changes == 1
+    assert delta.added == [] and delta.removed == []
+    assert services.store.get_favorites("alice") == ["Bread", "Pancakes"]
+    assert laptop.sync().added == ["Pancakes"]
+
+    # The last change wins: laptop removes it, then phone adds it back
+    laptop.remove_favorite("Pancakes")
+    laptop.sync()
+    phone.remove_favorite("Pancakes")
+    phone.add_favorite("Pancakes")
+    phone.sync()
+    assert "Pancakes" in phone.favorites
+    assert "Pancakes" in services.store.get_favorites("alice")
+    laptop.sync()
+    assert "Pancakes" in laptop.favorites
+
+
+def test_pruned_feed_falls_back_to_a_snapshot(services):
+    phone = LocalDevice(services.sync, "alice", "Phone")
+    laptop = LocalDevice(services.sync, "alice", "Laptop")
+    phone.sync()
+    laptop.add_favorite("Soup")
+    laptop.sync()
+
+    feed = services.sync.feed
+    feed.retention = -1
+    feed.prune()
+    assert feed.pruned_through() > services.sync.feed.cursor("alice", "Phone")
+
+    delta = phone.sync()
+    assert delta.full
+    assert sorted(phone.favorites) == ["Bread", "Soup"]
+    assert not phone.sync().full
+
+
+def test_images_are_sent_as_references_and_fetched_lazily(services):
+    cover = services.blobs.put(b"cover image")
+    flour = services.blobs.put(b"flour photo")
+    services.store.save_recipe("Bread", recipe("alice", image=cover, ingredient_image=flour))
+
+    phone = LocalDevice(services.sync, "alice", "Phone")
+    delta = phone.sync()
+    assert delta.images == [cover, flour]
+    assert phone.recipes["Bread"]["image"] == cover
+    assert phone.images == {}
+
+    assert phone.image(flour) == b"flour photo"
+    assert list(phone.images) == [flour]
+    assert phone.image(flour) == b"flour photo"
+
+    no_images = LocalDevice(services.sync, "alice", "Watch", recipe_images=False, ingredient_images=False)
+    assert no_images.sync().images == []
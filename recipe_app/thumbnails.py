@@ -0,0 +1,152 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, features
+
+from blobstore import is_blob_ref
+from fileio import write_file
+from metrics import METRICS
+
+# Fixed-size thumbnails for the result grids.
+#
+# Each stored image gets one variant per THUMBNAIL_SIZES entry (longest side
+# in pixels), written to <root>/<size>/<digest>.<ext> on upload or lazily the
+# first time a legacy image is shown. Recently used thumbnails are kept in an
+# LRU cache bounded by a byte budget, so rendering a grid touches neither the
+# originals nor the disk for hot images.
+
+THUMBNAIL_DIR = "thumbs"
+THUMBNAIL_SIZES = (100, 200, 300)
+THUMBNAIL_QUALITY = 80
+DEFAULT_CACHE_BYTES = int(os.environ.get("RECIPE_THUMBNAIL_CACHE_MB", "64")) * 1024 * 1024
+
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+THUMBNAIL_EXT = {"WEBP": "webp", "JPEG": "jpg"}[THUMBNAIL_FORMAT]
+
+
+# Smallest variant that is at least as large as the requested display width
+def variant_for(width):
+    for size in THUMBNAIL_SIZES:
+        if size >= width:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+@METRICS.timed("thumbnail_encode")
+def _encode(image, size, image_format):
+    image = image.copy()
+    image.thumbnail((size, size))
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    buf = io.BytesIO()
+    image.save(buf, format=image_format, quality=THUMBNAIL_QUALITY)
+    return buf.getvalue()
+
+
+# Decode the original once and encode one thumbnail per requested size
+def make_thumbnails(data, sizes=THUMBNAIL_SIZES, image_format=THUMBNAIL_FORMAT):
+    with Image.open(io.BytesIO(data)) as image:
+        # Let the JPEG decoder downscale while decoding
+        largest = max(sizes)
+        image.draft("RGB", (largest, largest))
+        image.load()
+        return thumbnails_from_image(image, sizes, image_format)
+
+
+def thumbnails_from_image(image, sizes=THUMBNAIL_SIZES, image_format=THUMBNAIL_FORMAT):
+    return {size: _encode(image, size, image_format) for size in sizes}
+
+
+def make_thumbnail(data, size, image_format=THUMBNAIL_FORMAT):
+    return make_thumbnails(data, (size,), image_format)[size]
+
+
+class LRUByteCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Thumbnailer:
+    def __init__(self, blobs, root, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.blobs = blobs
+        self.root = root
+        self.cache = LRUByteCache(cache_bytes)
+
+    def path(self, digest, size):
+        return os.path.join(self.root, str(size), f"{digest}.{THUMBNAIL_EXT}")
+
+    # Build every variant of a stored image; called right after an upload,
+    # from the already decoded image when the caller has it
+    def generate(self, digest, data=None, image=None):
+        if all(os.path.exists(self.path(digest, size)) for size in THUMBNAIL_SIZES):
+            return
+        if image is not None:
+            thumbs = thumbnails_from_image(image)
+        else:
+            thumbs = make_thumbnails(data if data is not None else self.blobs.get(digest))
+        for size, thumb in thumbs.items():
+            write_file(self.path(digest, size), thumb, fsync=False)
+            self.cache.put((digest, size), thumb)
+
+    # Thumbnail bytes for an image reference at the given display width
+    def get(self, ref, width):
+        size = variant_for(width)
+        key = (ref, size)
+        if not is_blob_ref(ref):
+            # Legacy inline image: nothing on disk to key the file by, so it
+            # is only kept in the LRU cache
+            thumb = self.cache.get(key)
+            if thumb is not None:
+                METRICS.count("thumbnail_cache_hit")
+                return thumb
+            METRICS.count("thumbnail_miss")
+            thumb = make_thumbnail(self.blobs.load(ref), size)
+            self.cache.put(key, thumb)
+            return thumb
+
+        thumb = self.cache.get(key)
+        if thumb is not None:
+            METRICS.count("thumbnail_cache_hit")
+            return thumb
+
+        path = self.path(ref, size)
+        try:
+            with open(path, 'rb') as f:
+                thumb = f.read()
+            METRICS.count("thumbnail_disk_hit")
+        except FileNotFoundError:
+            METRICS.count("thumbnail_miss")
+            thumb = make_thumbnail(self.blobs.get(ref), size)
+            write_file(path, thumb, fsync=False)
+        self.cache.put(key, thumb)
+        return thumb
@@ -0,0 +1,147 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ingest import MAX_IMAGE_DIMENSION, ingest_image
+
+# Background image processing.
+#
+# Decoding, downscaling and thumbnailing an upload is CPU-bound Pillow work;
+# doing it inside the Streamlit rerun blocks the user's page. ImageJobQueue
+# spools each upload to disk and hands it to a bounded pool of worker
+# threads, returning a job id straight away. The page polls the job (and
+# shows a placeholder meanwhile), and callbacks registered with when_done()
+# persist the result through the normal DataStore save path once the image
+# is stored.
+#
+# Threads rather than processes: Pillow releases the GIL while decoding,
+# resampling and encoding, so uploads are processed in parallel, and a
+# spawned process would re-import the Streamlit script (Streamlit runs it as
+# __main__) in every worker.
+
+UPLOAD_DIR = "uploads"
+MAX_WORKERS = int(os.environ.get("RECIPE_IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+MAX_PENDING = int(os.environ.get("RECIPE_IMAGE_QUEUE", "32"))
+# Finished jobs remembered for polling
+MAX_FINISHED = 1000
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ImageJob:
+    __slots__ = ("id", "status", "digest", "error", "callbacks")
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = PENDING
+        self.digest = None
+        self.error = None
+        self.callbacks = []
+
+
+class ImageJobQueue:
+    def __init__(self, blobs, thumbnailer, spool_dir, max_workers=MAX_WORKERS,
+                 max_pending=MAX_PENDING):
+        self.blobs = blobs
+        self.thumbnailer = thumbnailer
+        self.spool_dir = spool_dir
+        self.max_pending = max_pending
+        os.makedirs(spool_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="image-worker")
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    # Queue an uploaded file object for ingestion and return the job id
+    def submit(self, fileobj):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull(f"{self._pending} images are already waiting to be processed")
+            self._pending += 1
+            job = ImageJob(uuid.uuid4().hex)
+            self._jobs[job.id] = job
+
+        try:
+            fd, spool_path = tempfile.mkstemp(dir=self.spool_dir, suffix=".upload")
+            with os.fdopen(fd, 'wb') as f:
+                fileobj.seek(0)
+                shutil.copyfileobj(fileobj, f)
+            future = self._executor.submit(self._process, spool_path)
+        except BaseException as e:
+            self._finish(job, None, e)
+            raise
+        future.add_done_callback(lambda f: self._finish(job, *self._outcome(f)))
+        return job.id
+
+    # Runs on a worker thread: ingest the spooled upload, then remove it
+    def _process(self, spool_path):
+        try:
+            with open(spool_path, 'rb') as f:
+                return ingest_image(f, self.blobs, self.thumbnailer, MAX_IMAGE_DIMENSION)
+        finally:
+            os.unlink(spool_path)
+
+    @staticmethod
+    def _outcome(future):
+        error = future.exception()
+        return (None, error) if error is not None else (future.result(), None)
+
+    def _finish(self, job, digest, error):
+        with self._lock:
+            self._pending -= 1
+            job.digest = digest
+            job.error = error
+            job.status = FAILED if error is not None else DONE
+            callbacks, job.callbacks = job.callbacks, []
+            while len(self._jobs) > MAX_FINISHED:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status == PENDING:
+                    break
+                self._jobs.popitem(last=False)
+        if error is not None:
+            log.error("Image job %s failed: %s", job.id, error)
+            return
+        for callback in callbacks:
+            self._run_callback(callback, digest)
+
+    @staticmethod
+    def _run_callback(callback, digest):
+        try:
+            callback(digest)
+        except Exception:
+            log.exception("Image job callback failed")
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    # Call callback(digest) once the job has succeeded (now, if it already
+    # has). Returns the job's status, or None if the job is unknown or was
+    # forgotten (see MAX_FINISHED); the callback never runs for those or for
+    # failed jobs.
+    def when_done(self, job_id, callback):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == PENDING:
+                job.callbacks.append(callback)
+                return PENDING
+        if job.status == DONE:
+            self._run_callback(callback, job.digest)
+        return job.status
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)